@@ -0,0 +1,136 @@
+"""
+Measures how long the bot takes to boot up to connecting to discord: importing the bot and
+loading every extension the way MisoBot.load_all_extensions does. The database is replaced with
+one that answers every query with an empty result, so this is the import and cog_load cost of
+the code itself. Every run is a fresh interpreter, so all imports are cold.
+
+usage, from the repository root:
+    python -m benchmarks.boot_time [--runs 5] [--save FILE] [--check FILE]
+
+--save writes the median timings to FILE. --check compares them to timings saved earlier and
+exits with status 1 if the total boot time regressed by more than 20%.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+from time import perf_counter
+
+RESULT_PREFIX = "BOOT_TIME "
+TOLERANCE = 0.2
+
+
+class EmptyDatabase:
+    """Answers every query with an empty result"""
+
+    async def execute(self, statement, *params, one_row=False, one_value=False, **kwargs):
+        return None if one_row or one_value else []
+
+
+async def boot():
+    start = perf_counter()
+    os.environ.setdefault("MISO_BOT_TOKEN", "benchmark")
+    import aiohttp
+
+    import main
+    from modules.misobot import MisoBot
+
+    imported = perf_counter()
+    bot = MisoBot(extensions=main.extensions, default_prefix=">")
+    bot.db = EmptyDatabase()
+    # what logging in would do, without connecting anywhere
+    await bot._async_setup_hook()
+    bot.session = aiohttp.ClientSession()
+    await bot.load_all_extensions()
+    loaded = perf_counter()
+    await bot.session.close()
+
+    return {
+        "import_bot": imported - start,
+        "load_extensions": loaded - imported,
+        "total": loaded - start,
+        "extensions": {
+            timing.name: {
+                "import": timing.import_time,
+                "cog_load": timing.cog_load_time,
+                "cache_warm": timing.warm_time,
+                "total": timing.total,
+            }
+            for timing in bot.startup_report.extensions.values()
+        },
+    }
+
+
+def run_once():
+    process = subprocess.run(
+        [sys.executable, "-m", "benchmarks.boot_time", "--child"],
+        capture_output=True,
+        text=True,
+    )
+    if process.returncode != 0:
+        raise RuntimeError(f"Boot failed:\n{process.stderr}")
+    for line in process.stdout.splitlines():
+        if line.startswith(RESULT_PREFIX):
+            return json.loads(line[len(RESULT_PREFIX) :])
+    raise RuntimeError(f"Boot did not report timings:\n{process.stdout}\n{process.stderr}")
+
+
+def median_result(results):
+    extensions = results[0]["extensions"]
+    return {
+        "import_bot": statistics.median(r["import_bot"] for r in results),
+        "load_extensions": statistics.median(r["load_extensions"] for r in results),
+        "total": statistics.median(r["total"] for r in results),
+        "extensions": {
+            name: {
+                phase: statistics.median(r["extensions"][name][phase] for r in results)
+                for phase in extensions[name]
+            }
+            for name in extensions
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--save")
+    parser.add_argument("--check")
+    parser.add_argument("--child", action="store_true")
+    args = parser.parse_args()
+
+    if args.child:
+        print(RESULT_PREFIX + json.dumps(asyncio.run(boot())))
+        return
+
+    result = median_result([run_once() for _ in range(args.runs)])
+    print(f"{'extension':16} {'import':>8} {'cog_load':>8} {'warm':>8} {'total':>8}")
+    extensions = sorted(result["extensions"].items(), key=lambda x: x[1]["total"], reverse=True)
+    for name, timing in extensions:
+        print(
+            f"{name:16} {timing['import']:7.3f}s {timing['cog_load']:7.3f}s "
+            f"{timing['cache_warm']:7.3f}s {timing['total']:7.3f}s"
+        )
+    print(
+        f"median of {args.runs} runs: import bot {result['import_bot']:.3f}s  "
+        f"load extensions {result['load_extensions']:.3f}s  total {result['total']:.3f}s"
+    )
+
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(result, file, indent=2)
+
+    if args.check:
+        with open(args.check) as file:
+            baseline = json.load(file)
+        change = result["total"] / baseline["total"] - 1
+        print(f"total boot time {change:+.0%} compared to {args.check}")
+        if change > TOLERANCE:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
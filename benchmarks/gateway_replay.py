@@ -0,0 +1,177 @@
+"""
+Replays gateway frames through the stdlib json decoding path that discord.py uses by default,
+and through the orjson based GatewayDecoder used in gateway proxy mode.
+
+usage, from the repository root:
+    python -m benchmarks.gateway_replay [frames_file]
+
+frames_file is a recording made with GATEWAY_RECORD_PATH. Without one, 20k synthetic
+zlib-stream frames of typical dispatch events are used.
+"""
+import json
+import random
+import sys
+import timeit
+import zlib
+
+import orjson
+
+from modules.gateway_proxy import ZLIB_SUFFIX, GatewayDecoder, read_frames
+
+FRAMES = 20_000
+
+
+def snowflake(rng):
+    return str(rng.randrange(10**17, 10**18))
+
+
+def message_create(rng, seq):
+    author_id = snowflake(rng)
+    return {
+        "t": "MESSAGE_CREATE",
+        "s": seq,
+        "op": 0,
+        "d": {
+            "type": 0,
+            "tts": False,
+            "timestamp": "2022-11-05T12:34:56.789000+00:00",
+            "pinned": False,
+            "mentions": [],
+            "mention_roles": [],
+            "mention_everyone": False,
+            "member": {
+                "roles": [snowflake(rng) for _ in range(rng.randrange(6))],
+                "premium_since": None,
+                "pending": False,
+                "nick": None,
+                "mute": False,
+                "joined_at": "2021-01-01T00:00:00.000000+00:00",
+                "flags": 0,
+                "deaf": False,
+                "avatar": None,
+            },
+            "id": snowflake(rng),
+            "flags": 0,
+            "embeds": [],
+            "edited_timestamp": None,
+            "content": " ".join(
+                rng.choice(["hello", "miso", "what", "is", "this", "lol", ">fm", "😂"])
+                for _ in range(rng.randrange(1, 40))
+            ),
+            "components": [],
+            "channel_id": snowflake(rng),
+            "author": {
+                "username": f"user{rng.randrange(10**6)}",
+                "public_flags": 0,
+                "id": author_id,
+                "discriminator": f"{rng.randrange(10**4):04}",
+                "avatar": "%032x" % rng.getrandbits(128),
+            },
+            "attachments": [],
+            "guild_id": snowflake(rng),
+        },
+    }
+
+
+def member_update(rng, seq):
+    return {
+        "t": "GUILD_MEMBER_UPDATE",
+        "s": seq,
+        "op": 0,
+        "d": {
+            "user": {
+                "username": f"user{rng.randrange(10**6)}",
+                "id": snowflake(rng),
+                "discriminator": f"{rng.randrange(10**4):04}",
+                "avatar": None,
+            },
+            "roles": [snowflake(rng) for _ in range(rng.randrange(10))],
+            "guild_id": snowflake(rng),
+            "nick": None,
+            "joined_at": "2021-01-01T00:00:00.000000+00:00",
+        },
+    }
+
+
+def reaction_add(rng, seq):
+    return {
+        "t": "MESSAGE_REACTION_ADD",
+        "s": seq,
+        "op": 0,
+        "d": {
+            "user_id": snowflake(rng),
+            "message_id": snowflake(rng),
+            "emoji": {"name": "⭐", "id": None},
+            "channel_id": snowflake(rng),
+            "guild_id": snowflake(rng),
+        },
+    }
+
+
+def synthetic_frames(count):
+    rng = random.Random(0)
+    compressor = zlib.compressobj()
+    frames = []
+    for seq in range(1, count + 1):
+        event = rng.choices([message_create, member_update, reaction_add], [6, 2, 2])[0]
+        payload = orjson.dumps(event(rng, seq))
+        frames.append(compressor.compress(payload) + compressor.flush(zlib.Z_SYNC_FLUSH))
+    return frames
+
+
+def legacy_decode(frames):
+    """The default discord.py path: buffer, decompress, decode to str, json.loads"""
+    inflator = zlib.decompressobj()
+    buffer = bytearray()
+    for frame in frames:
+        if type(frame) is bytes:
+            buffer.extend(frame)
+            if len(frame) < 4 or frame[-4:] != ZLIB_SUFFIX:
+                continue
+            msg = inflator.decompress(buffer).decode("utf-8")
+            buffer = bytearray()
+        else:
+            msg = frame
+        json.loads(msg)
+
+
+def decoder_decode(frames):
+    decoder = GatewayDecoder("benchmark")
+    for frame in frames:
+        decoder.feed(frame)
+
+
+def main():
+    if len(sys.argv) > 1:
+        frames = read_frames(sys.argv[1])
+        if frames and not frames[0].endswith(ZLIB_SUFFIX):
+            # recorded from an uncompressed connection
+            frames = [frame.decode() for frame in frames]
+        print(f"replaying {len(frames)} recorded frames from {sys.argv[1]}")
+    else:
+        frames = synthetic_frames(FRAMES)
+        print(f"replaying {len(frames)} synthetic frames")
+
+    wire_bytes = sum(len(frame) for frame in frames)
+    decoder = GatewayDecoder("size")
+    payload_bytes = 0
+    for frame in frames:
+        data = decoder.feed(frame)
+        if data is not None:
+            payload_bytes += len(orjson.dumps(data))
+    print(
+        f"bytes    wire {wire_bytes / 2**20:7.2f}MiB  payload {payload_bytes / 2**20:7.2f}MiB  "
+        f"ratio {payload_bytes / wire_bytes:.1f}x"
+    )
+
+    legacy_time = min(timeit.repeat(lambda: legacy_decode(frames), number=1, repeat=5))
+    decoder_time = min(timeit.repeat(lambda: decoder_decode(frames), number=1, repeat=5))
+    print(
+        f"decode   legacy {legacy_time / len(frames) * 1e6:6.2f}us/frame  "
+        f"decoder {decoder_time / len(frames) * 1e6:6.2f}us/frame  "
+        f"speedup {legacy_time / decoder_time:.1f}x"
+    )
+
+
+if __name__ == "__main__":
+    main()
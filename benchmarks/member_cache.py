@@ -0,0 +1,130 @@
+"""
+Measures the memory used by cached members per guild with synthetic guild fixtures, caching
+every member of every guild versus the `features` member cache policy.
+
+usage, from the repository root:
+    python -m benchmarks.member_cache
+"""
+import random
+import tracemalloc
+
+import discord
+from discord.state import ConnectionState
+
+from modules.member_cache import MemberLRU
+
+GUILDS = 300
+# share of guilds with member features that keep their full member list
+FEATURE_GUILDS = 0.1
+# members of the other guilds looked up through the LRU
+ACTIVE_MEMBERS = 30
+BOT_ID = 500385855072894982
+
+
+def snowflake(rng):
+    return rng.randrange(10**17, 10**18)
+
+
+def guild_sizes(rng):
+    """Mostly small guilds with a long tail of large ones"""
+    return [min(int(rng.paretovariate(0.9) * 20), 50_000) for _ in range(GUILDS)]
+
+
+def member_payload(rng, user_id, role_ids):
+    return {
+        "user": {
+            "id": str(user_id),
+            "username": f"user{user_id % 10**6}",
+            "discriminator": f"{rng.randrange(10**4):04}",
+            "global_name": None,
+            "avatar": "%032x" % rng.getrandbits(128) if rng.random() < 0.8 else None,
+            "bot": False,
+        },
+        "roles": [str(role_id) for role_id in rng.sample(role_ids, rng.randrange(4))],
+        "joined_at": "2021-01-01T00:00:00.000000+00:00",
+        "nick": f"nick{user_id % 1000}" if rng.random() < 0.3 else None,
+        "deaf": False,
+        "mute": False,
+        "flags": 0,
+        "pending": False,
+    }
+
+
+def make_guild(rng, state, size):
+    guild_id = snowflake(rng)
+    role_ids = [snowflake(rng) for _ in range(10)]
+    guild = discord.Guild(
+        data={
+            "id": str(guild_id),
+            "name": f"guild {guild_id}",
+            "member_count": size,
+            "roles": [
+                {"id": str(role_id), "name": "role", "permissions": "0", "position": i}
+                for i, role_id in enumerate(role_ids)
+            ],
+        },
+        state=state,
+    )
+    member_data = [member_payload(rng, BOT_ID, role_ids)] + [
+        member_payload(rng, snowflake(rng), role_ids) for _ in range(size - 1)
+    ]
+    return guild, member_data
+
+
+def fill(guild, state, member_data):
+    for data in member_data:
+        guild._add_member(discord.Member(data=data, guild=guild, state=state))
+
+
+def measure(func):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = func()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, after - before
+
+
+def main():
+    rng = random.Random(0)
+    state = ConnectionState(dispatch=None, handlers={}, hooks={}, http=None)
+    fixtures = [make_guild(rng, state, max(size, 2)) for size in guild_sizes(rng)]
+    feature_guilds = set(rng.sample(range(GUILDS), int(GUILDS * FEATURE_GUILDS)))
+    total_members = sum(len(data) for _, data in fixtures)
+    print(f"{GUILDS} guilds, {total_members} members, {len(feature_guilds)} with member features")
+
+    def cache_all():
+        for guild, data in fixtures:
+            fill(guild, state, data)
+
+    def cache_features():
+        lru = MemberLRU()
+        for i, (guild, data) in enumerate(fixtures):
+            if i in feature_guilds:
+                fill(guild, state, data)
+            else:
+                fill(guild, state, data[:1])
+                for member_data in data[1 : ACTIVE_MEMBERS + 1]:
+                    member = discord.Member(data=member_data, guild=guild, state=state)
+                    lru.put((guild.id, member.id), member)
+        return lru
+
+    _, all_memory = measure(cache_all)
+    for guild, _ in fixtures:
+        guild._members = {}
+    state._users.clear()
+    _, features_memory = measure(cache_features)
+
+    print(
+        f"all       {all_memory / 2**20:8.1f}MiB  {all_memory / GUILDS / 1024:8.1f}KiB/guild  "
+        f"{all_memory / total_members:6.0f}B/member"
+    )
+    print(
+        f"features  {features_memory / 2**20:8.1f}MiB  "
+        f"{features_memory / GUILDS / 1024:8.1f}KiB/guild  "
+        f"saved {1 - features_memory / all_memory:.0%}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+"""
+Checks that the queries the indexes in sql/migrations were added for actually use them.
+
+Every table involved is shadowed by a temporary table created with CREATE TABLE ... LIKE, so it
+has the same columns and indexes as the real one, and filled with generated rows. The queries
+are then run through EXPLAIN and the script exits with status 1 if any of them doesn't use the
+index it's meant to. Nothing is written to the real tables, and creating temporary tables is a
+privilege the bot already needs for queries.guild_member_query.
+
+The statements are copies of the ones in the cogs, keep them in sync when changing either.
+
+usage, from the repository root, with the DB_* variables of the bot set and migrations applied:
+    python -m benchmarks.query_plans [--rows 20000]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+import aiomysql
+
+SNOWFLAKE_MIN = 10**17
+
+
+def snowflakes(rng, count):
+    return [rng.randrange(SNOWFLAKE_MIN, SNOWFLAKE_MIN * 10) for _ in range(count)]
+
+
+def random_date(rng):
+    return datetime(2022, 1, 1) + timedelta(seconds=rng.randrange(3 * 365 * 86400))
+
+
+def notification_rows(rng, count):
+    guilds, users = snowflakes(rng, count // 10), snowflakes(rng, count // 2)
+    return [
+        (rng.choice(guilds), rng.choice(users), f"keyword {i}", rng.randrange(100))
+        for i in range(count)
+    ]
+
+
+def artist_crown_rows(rng, count):
+    guilds, users = snowflakes(rng, 20), snowflakes(rng, count // 20)
+    return [
+        (rng.choice(guilds), rng.choice(users), f"artist {i}", rng.randrange(10_000))
+        for i in range(count)
+    ]
+
+
+def command_usage_rows(rng, count):
+    guilds, users = snowflakes(rng, count // 50), snowflakes(rng, count // 5)
+    commands = [f"command {i}" for i in range(200)]
+    return [
+        (
+            rng.choice(guilds),
+            rng.choice(users),
+            rng.choice(commands),
+            "internal",
+            rng.randrange(50),
+        )
+        for _ in range(count)
+    ]
+
+
+def typing_stats_rows(rng, count):
+    guilds, users = snowflakes(rng, count // 50), snowflakes(rng, count // 20)
+    return [
+        (
+            rng.choice(users),
+            rng.choice(guilds),
+            random_date(rng),
+            rng.randrange(20, 200),
+            rng.random(),
+            25,
+            "english",
+        )
+        for _ in range(count)
+    ]
+
+
+def muted_user_rows(rng, count):
+    # most mutes are permanent
+    return [
+        (guild_id, user_id, 0, random_date(rng) if rng.random() < 0.05 else None)
+        for guild_id, user_id in zip(snowflakes(rng, count), snowflakes(rng, count))
+    ]
+
+
+TABLES = {
+    "notification": (
+        "(guild_id, user_id, keyword, times_triggered)",
+        notification_rows,
+    ),
+    "artist_crown": (
+        "(guild_id, user_id, artist_name, cached_playcount)",
+        artist_crown_rows,
+    ),
+    "command_usage": (
+        "(guild_id, user_id, command_name, command_type, uses)",
+        command_usage_rows,
+    ),
+    "typing_stats": (
+        "(user_id, guild_id, test_date, wpm, accuracy, word_count, test_language)",
+        typing_stats_rows,
+    ),
+    "muted_user": (
+        "(guild_id, user_id, channel_id, unmute_on)",
+        muted_user_rows,
+    ),
+}
+
+
+class Check:
+    """A query and the index it should use on `table`.
+
+    String params name a column of `table`, and are replaced with a value of that column from the
+    generated rows.
+    """
+
+    def __init__(self, name, table, index, statement, *params):
+        self.name = name
+        self.table = table
+        self.index = index
+        self.statement = statement
+        self.params = params
+
+
+CHECKS = [
+    Check(
+        "notifications of a user",
+        "notification",
+        "notification_user_id",
+        "SELECT COUNT(*) FROM notification WHERE user_id = %s",
+        "user_id",
+    ),
+    Check(
+        "unmute loop",
+        "muted_user",
+        "muted_user_unmute_on",
+        """
+        SELECT user_id, guild_id, channel_id, unmute_on FROM muted_user
+        WHERE unmute_on IS NOT NULL AND (guild_id >> 22) %% %s IN (%s, %s)
+        """,
+        4,
+        0,
+        1,
+    ),
+    Check(
+        "crowns of a member",
+        "artist_crown",
+        "artist_crown_guild_id_user_id",
+        """
+        SELECT artist_name, cached_playcount FROM artist_crown
+        WHERE guild_id = %s AND user_id = %s ORDER BY cached_playcount DESC
+        """,
+        "guild_id",
+        "user_id",
+    ),
+    Check(
+        "typing history of a user",
+        "typing_stats",
+        "typing_stats_user_id_wpm",
+        """
+        SELECT test_date, wpm, accuracy, word_count, test_language FROM typing_stats
+        WHERE user_id = %s ORDER BY test_date DESC
+        """,
+        "user_id",
+    ),
+    Check(
+        "command usage of a user",
+        "command_usage",
+        "command_usage_user_id",
+        """
+        SELECT command_name, SUM(uses) as total FROM command_usage
+            WHERE command_type = 'internal'
+              AND user_id = %s
+        GROUP BY command_name
+        ORDER BY total DESC
+        """,
+        "user_id",
+    ),
+    Check(
+        "most uses of a command",
+        "command_usage",
+        "command_usage_command_name",
+        """
+        SELECT user_id, SUM(uses) as use_sum FROM command_usage
+            WHERE command_type = 'internal'
+              AND command_name = %s
+        GROUP BY user_id
+        ORDER BY use_sum DESC
+        LIMIT 1
+        """,
+        "command_name",
+    ),
+]
+
+
+async def fill_tables(cur, rows):
+    rng = random.Random(0)
+    samples = {}
+    for table, (columns, generate) in TABLES.items():
+        await cur.execute(f"CREATE TEMPORARY TABLE {table} LIKE {table}")
+        data = generate(rng, rows)
+        placeholders = ", ".join(["%s"] * len(data[0]))
+        for i in range(0, len(data), 1000):
+            await cur.executemany(
+                f"INSERT IGNORE INTO {table} {columns} VALUES ({placeholders})",
+                data[i : i + 1000],
+            )
+        await cur.execute(f"ANALYZE TABLE {table}")
+        await cur.fetchall()
+        # existing values to look up, so the plans are for queries that find rows
+        names = [name.strip() for name in columns.strip("()").split(",")]
+        samples[table] = dict(zip(names, data[len(data) // 2]))
+    return samples
+
+
+async def explain(cur, check, samples):
+    params = [
+        samples[check.table][param] if isinstance(param, str) else param for param in check.params
+    ]
+    await cur.execute("EXPLAIN " + check.statement, params)
+    for row in await cur.fetchall():
+        if row["table"] == check.table:
+            return row
+    raise RuntimeError(f"{check.table} is not in the plan of {check.name}")
+
+
+async def run(rows):
+    conn = await aiomysql.connect(
+        db=os.environ["DB_NAME"],
+        host=os.environ["DB_HOST"],
+        port=int(os.environ["DB_PORT"]),
+        user=os.environ["DB_USER"],
+        password=os.environ["DB_PASSWORD"],
+        autocommit=True,
+    )
+    failed = []
+    try:
+        async with conn.cursor(aiomysql.DictCursor) as cur:
+            samples = await fill_tables(cur, rows)
+            print(f"{'query':28} {'expected index':32} {'used index':32} {'rows':>8}")
+            for check in CHECKS:
+                plan = await explain(cur, check, samples)
+                ok = plan["key"] == check.index
+                if not ok:
+                    failed.append(check)
+                print(
+                    f"{check.name:28} {check.index:32} {str(plan['key']):32} {plan['rows']:8}"
+                    + ("" if ok else "  FAIL")
+                )
+    finally:
+        conn.close()
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=20_000)
+    args = parser.parse_args()
+
+    failed = asyncio.run(run(args.rows))
+    if failed:
+        print(f"{len(failed)} of {len(CHECKS)} queries don't use their index")
+        sys.exit(1)
+    print(f"all {len(CHECKS)} queries use their index")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Compares the memory use and lookup latency of the old string keyed settings cache layout
+against the current integer keyed one, with 100k guilds' worth of settings.
+
+usage, from the repository root:
+    python -m benchmarks.settings_cache
+"""
+import random
+import timeit
+import tracemalloc
+
+from modules.cache import LoggingSettings, StarboardSettings
+
+GUILDS = 100_000
+MARRIAGES = 20_000
+
+
+def random_ids(rng, count):
+    return [rng.randrange(10**17, 10**18) for _ in range(count)]
+
+
+def build_legacy(guild_ids, user_ids):
+    prefixes = {}
+    starboard_settings = {}
+    logging_settings = {}
+    for guild_id in guild_ids:
+        prefixes[str(guild_id)] = "!"
+        starboard_settings[str(guild_id)] = [
+            True,
+            guild_id + 1,
+            3,
+            ":star:",
+            None,
+            "unicode",
+            None,
+        ]
+        logging_settings[str(guild_id)] = {
+            "member_log_channel_id": guild_id + 2,
+            "ban_log_channel_id": None,
+            "message_log_channel_id": guild_id + 3,
+        }
+    marriages = [set(user_ids[i : i + 2]) for i in range(0, len(user_ids), 2)]
+    return prefixes, starboard_settings, logging_settings, marriages
+
+
+def build_current(guild_ids, user_ids):
+    prefixes = {}
+    starboard_settings = {}
+    logging_settings = {}
+    for guild_id in guild_ids:
+        prefixes[guild_id] = "!"
+        starboard_settings[guild_id] = StarboardSettings(
+            True, guild_id + 1, 3, ":star:", None, "unicode", None
+        )
+        logging_settings[guild_id] = LoggingSettings(guild_id + 2, None, guild_id + 3)
+    marriages = {}
+    for i in range(0, len(user_ids), 2):
+        marriages[user_ids[i]] = user_ids[i + 1]
+        marriages[user_ids[i + 1]] = user_ids[i]
+    return prefixes, starboard_settings, logging_settings, marriages
+
+
+def measure_memory(build, *args):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    data = build(*args)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return data, after - before
+
+
+def main():
+    rng = random.Random(0)
+    guild_ids = random_ids(rng, GUILDS)
+    user_ids = random_ids(rng, MARRIAGES * 2)
+    lookups = rng.sample(guild_ids, 10_000)
+    user_lookups = rng.sample(user_ids, 200)
+
+    legacy, legacy_memory = measure_memory(build_legacy, guild_ids, user_ids)
+    current, current_memory = measure_memory(build_current, guild_ids, user_ids)
+    print(
+        f"memory        legacy {legacy_memory / 2**20:7.1f}MiB  "
+        f"current {current_memory / 2**20:7.1f}MiB  saved {1 - current_memory / legacy_memory:.0%}"
+    )
+
+    legacy_prefixes, legacy_starboard, legacy_logging, legacy_marriages = legacy
+    prefixes, starboard, logging, marriages = current
+
+    def legacy_guild_lookups():
+        for guild_id in lookups:
+            legacy_prefixes.get(str(guild_id), ">")
+            legacy_starboard.get(str(guild_id))[2]
+            legacy_logging.get(str(guild_id))["member_log_channel_id"]
+
+    def current_guild_lookups():
+        for guild_id in lookups:
+            prefixes.get(guild_id, ">")
+            starboard.get(guild_id).reaction_count
+            logging.get(guild_id).member_log_channel_id
+
+    def legacy_marriage_lookups():
+        for user_id in user_lookups:
+            for pair in legacy_marriages:
+                if user_id in pair:
+                    break
+
+    def current_marriage_lookups():
+        for user_id in user_lookups:
+            marriages.get(user_id)
+
+    for name, legacy_func, current_func, count in [
+        ("guild lookup", legacy_guild_lookups, current_guild_lookups, len(lookups)),
+        ("partner", legacy_marriage_lookups, current_marriage_lookups, len(user_lookups)),
+    ]:
+        legacy_time = min(timeit.repeat(legacy_func, number=1, repeat=5)) / count
+        current_time = min(timeit.repeat(current_func, number=1, repeat=5)) / count
+        print(
+            f"{name:<13} legacy {legacy_time * 1e6:8.2f}us  current {current_time * 1e6:8.2f}us  "
+            f"speedup {legacy_time / current_time:.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
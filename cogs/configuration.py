@@ -52,7 +52,8 @@ class Configuration(commands.Cog):
             ctx.guild.id,
             prefix,
         )
-        self.bot.cache.prefixes[str(ctx.guild.id)] = prefix
+        self.bot.cache.prefixes[ctx.guild.id] = prefix
+        await self.bot.invalidation.publish("prefixes", ctx.guild.id)
         await util.send_success(
             ctx,
             f"Command prefix for this server is now `{prefix}`. "
@@ -159,6 +160,7 @@ class Configuration(commands.Cog):
             channel.id if channel is not None else None,
         )
         await self.bot.cache.cache_logging_settings()
+        await self.bot.invalidation.publish("logging", ctx.guild.id)
         if channel is None:
             await util.send_success(ctx, "Members logging **disabled**")
         else:
@@ -178,6 +180,7 @@ class Configuration(commands.Cog):
             channel.id if channel is not None else None,
         )
         await self.bot.cache.cache_logging_settings()
+        await self.bot.invalidation.publish("logging", ctx.guild.id)
         if channel is None:
             await util.send_success(ctx, "Bans logging **disabled**")
         else:
@@ -202,6 +205,7 @@ class Configuration(commands.Cog):
             channel.id if channel is not None else None,
         )
         await self.bot.cache.cache_logging_settings()
+        await self.bot.invalidation.publish("logging", ctx.guild.id)
         if channel is None:
             await util.send_success(ctx, "Deleted message logging **disabled**")
         else:
@@ -217,6 +221,8 @@ class Configuration(commands.Cog):
             ctx.guild.id,
             channel.id,
         )
+        self.bot.cache.message_log_ignored.setdefault(ctx.guild.id, set()).add(channel.id)
+        await self.bot.invalidation.publish("logging", ctx.guild.id)
         await util.send_success(
             ctx, f"No longer logging any messages deleted in {channel.mention}"
         )
@@ -229,6 +235,8 @@ class Configuration(commands.Cog):
             ctx.guild.id,
             channel.id,
         )
+        self.bot.cache.message_log_ignored.get(ctx.guild.id, set()).discard(channel.id)
+        await self.bot.invalidation.publish("logging", ctx.guild.id)
         await util.send_success(
             ctx,
             f"{channel.mention} is no longer being ignored from deleted message logging.",
@@ -247,6 +255,7 @@ class Configuration(commands.Cog):
         await queries.update_setting(ctx, "starboard_settings", "channel_id", channel.id)
         await util.send_success(ctx, f"Starboard channel is now {channel.mention}")
         await self.bot.cache.cache_starboard_settings()
+        await self.bot.invalidation.publish("starboard", ctx.guild.id)
 
     @starboard.command(name="amount")
     async def starboard_amount(self, ctx: commands.Context, amount: int):
@@ -270,6 +279,7 @@ class Configuration(commands.Cog):
             f"Messages now need **{amount}** {emoji} reactions to get into the starboard.",
         )
         await self.bot.cache.cache_starboard_settings()
+        await self.bot.invalidation.publish("starboard", ctx.guild.id)
 
     @starboard.command(name="toggle", aliases=["enabled"])
     async def starboard_toggle(self, ctx: commands.Context, value: bool):
@@ -280,6 +290,7 @@ class Configuration(commands.Cog):
         else:
             await util.send_success(ctx, "Starboard is now **disabled**")
         await self.bot.cache.cache_starboard_settings()
+        await self.bot.invalidation.publish("starboard", ctx.guild.id)
 
     @starboard.command(name="emoji")
     async def starboard_emoji(self, ctx: commands.Context, emoji):
@@ -329,6 +340,7 @@ class Configuration(commands.Cog):
             )
             await util.send_success(ctx, f"Starboard emoji is now {emoji}")
         await self.bot.cache.cache_starboard_settings()
+        await self.bot.invalidation.publish("starboard", ctx.guild.id)
 
     @starboard.command(name="log", usage="<channel | none>")
     async def starboard_log(self, ctx: commands.Context, channel: ChannelSetting):
@@ -340,6 +352,7 @@ class Configuration(commands.Cog):
             await queries.update_setting(ctx, "starboard_settings", "log_channel_id", channel.id)
             await util.send_success(ctx, f"Starboard log channel is now {channel.mention}")
         await self.bot.cache.cache_starboard_settings()
+        await self.bot.invalidation.publish("starboard", ctx.guild.id)
 
     @starboard.command(name="blacklist")
     async def starboard_blacklist(self, ctx: commands.Context, channel: discord.TextChannel):
@@ -356,6 +369,7 @@ class Configuration(commands.Cog):
         )
         await util.send_success(ctx, f"Stars are no longer counted in {channel.mention}")
         await self.bot.cache.cache_starboard_settings()
+        await self.bot.invalidation.publish("starboard", ctx.guild.id)
 
     @starboard.command(name="unblacklist")
     async def starboard_unblacklist(self, ctx: commands.Context, channel: discord.TextChannel):
@@ -369,23 +383,22 @@ class Configuration(commands.Cog):
         )
         await util.send_success(ctx, f"Stars are now again counted in {channel.mention}")
         await self.bot.cache.cache_starboard_settings()
+        await self.bot.invalidation.publish("starboard", ctx.guild.id)
 
     @starboard.command(name="current")
     async def starboard_current(self, ctx: commands.Context):
         """See the current starboard configuration"""
-        starboard_settings = self.bot.cache.starboard_settings.get(str(ctx.guild.id))
+        starboard_settings = self.bot.cache.starboard_settings.get(ctx.guild.id)
         if not starboard_settings:
             raise exceptions.CommandWarning("Nothing has been configured on this server yet!")
 
-        (
-            is_enabled,
-            board_channel_id,
-            required_reaction_count,
-            emoji_name,
-            emoji_id,
-            emoji_type,
-            log_channel_id,
-        ) = starboard_settings
+        is_enabled = starboard_settings.is_enabled
+        board_channel_id = starboard_settings.channel_id
+        required_reaction_count = starboard_settings.reaction_count
+        emoji_name = starboard_settings.emoji_name
+        emoji_id = starboard_settings.emoji_id
+        emoji_type = starboard_settings.emoji_type
+        log_channel_id = starboard_settings.log_channel_id
 
         if emoji_type == "custom":
             emoji = self.bot.get_emoji(emoji_id)
@@ -464,6 +477,7 @@ class Configuration(commands.Cog):
             channel_type,
         )
         self.bot.cache.votechannels.add(channel.id)
+        await self.bot.invalidation.publish("channels")
         await util.send_success(
             ctx, f"{channel.mention} is now a voting channel of type `{channel_type}`"
         )
@@ -477,6 +491,7 @@ class Configuration(commands.Cog):
             channel.id,
         )
         self.bot.cache.votechannels.discard(channel.id)
+        await self.bot.invalidation.publish("channels")
         await util.send_success(ctx, f"{channel.mention} is no longer a voting channel.")
 
     @votechannel.command(name="list")
@@ -523,6 +538,8 @@ class Configuration(commands.Cog):
             ctx.guild.id,
             role.id,
         )
+        await self.bot.cache.cache_autoroles()
+        await self.bot.invalidation.publish("autoroles", ctx.guild.id)
         await util.send_success(ctx, f"New members will now automatically get {role.mention}")
 
     @autorole.command(name="remove")
@@ -539,6 +556,7 @@ class Configuration(commands.Cog):
             role_id,
         )
         await self.bot.cache.cache_autoroles()
+        await self.bot.invalidation.publish("autoroles", ctx.guild.id)
         await util.send_success(ctx, f"No longer giving new members <@&{role_id}>")
 
     @autorole.command(name="list")
@@ -567,7 +585,8 @@ class Configuration(commands.Cog):
     async def autoresponses(self, ctx: commands.Context, value: bool):
         """Disable or enable automatic responses to certain message content"""
         await queries.update_setting(ctx, "guild_settings", "autoresponses", value)
-        self.bot.cache.autoresponse[str(ctx.guild.id)] = value
+        self.bot.cache.autoresponse[ctx.guild.id] = value
+        await self.bot.invalidation.publish("autoresponse", ctx.guild.id)
         if value:
             await util.send_success(ctx, "Automatic responses are now **enabled**")
         else:
@@ -678,6 +697,8 @@ class Configuration(commands.Cog):
                 self.bot.cache.blacklist["global"]["channel"].add(channel.id)
                 successes.append(f"Blacklisted {channel.mention}")
 
+        if successes:
+            await self.bot.invalidation.publish("blacklist")
         await util.send_tasks_result_list(ctx, successes, fails)
 
     @blacklist.command(name="member")
@@ -706,15 +727,11 @@ class Configuration(commands.Cog):
                     member.id,
                     ctx.guild.id,
                 )
-                try:
-                    self.bot.cache.blacklist[str(ctx.guild.id)]["member"].add(member.id)
-                except KeyError:
-                    self.bot.cache.blacklist[str(ctx.guild.id)] = {
-                        "member": {member.id},
-                        "command": set(),
-                    }
+                self.bot.cache.guild_blacklist(ctx.guild.id).member.add(member.id)
                 successes.append(f"Blacklisted {member.mention}")
 
+        if successes:
+            await self.bot.invalidation.publish("blacklist")
         await util.send_tasks_result_list(ctx, successes, fails)
 
     @blacklist.command(name="command")
@@ -730,13 +747,8 @@ class Configuration(commands.Cog):
             cmd.qualified_name,
             ctx.guild.id,
         )
-        try:
-            self.bot.cache.blacklist[str(ctx.guild.id)]["command"].add(cmd.qualified_name.lower())
-        except KeyError:
-            self.bot.cache.blacklist[str(ctx.guild.id)] = {
-                "member": set(),
-                "command": {cmd.qualified_name.lower()},
-            }
+        self.bot.cache.guild_blacklist(ctx.guild.id).command.add(cmd.qualified_name.lower())
+        await self.bot.invalidation.publish("blacklist")
         await util.send_success(
             ctx, f"`{ctx.prefix}{cmd}` is now a blacklisted command on this server."
         )
@@ -749,6 +761,7 @@ class Configuration(commands.Cog):
             "INSERT IGNORE blacklisted_user VALUES (%s, %s)", user.id, reason
         )
         self.bot.cache.blacklist["global"]["user"].add(user.id)
+        await self.bot.invalidation.publish("blacklist")
         await util.send_success(ctx, f"**{user}** can no longer use Miso Bot!")
 
     @blacklist.command(name="guild", hidden=True)
@@ -763,6 +776,7 @@ class Configuration(commands.Cog):
             "INSERT IGNORE blacklisted_guild VALUES (%s, %s)", guild.id, reason
         )
         self.bot.cache.blacklist["global"]["guild"].add(guild_id)
+        await self.bot.invalidation.publish("blacklist")
         await guild.leave()
         await util.send_success(ctx, f"**{guild}** can no longer use Miso Bot!")
 
@@ -791,6 +805,8 @@ class Configuration(commands.Cog):
                 self.bot.cache.blacklist["global"]["channel"].discard(channel.id)
                 successes.append(f"Unblacklisted {channel.mention}")
 
+        if successes:
+            await self.bot.invalidation.publish("blacklist")
         await util.send_tasks_result_list(ctx, successes, fails)
 
     @unblacklist.command(name="member")
@@ -810,9 +826,11 @@ class Configuration(commands.Cog):
                     ctx.guild.id,
                     member.id,
                 )
-                self.bot.cache.blacklist[str(ctx.guild.id)]["member"].discard(member.id)
+                self.bot.cache.guild_blacklist(ctx.guild.id).member.discard(member.id)
                 successes.append(f"Unblacklisted {member.mention}")
 
+        if successes:
+            await self.bot.invalidation.publish("blacklist")
         await util.send_tasks_result_list(ctx, successes, fails)
 
     @unblacklist.command(name="command")
@@ -828,7 +846,8 @@ class Configuration(commands.Cog):
             ctx.guild.id,
             cmd.qualified_name,
         )
-        self.bot.cache.blacklist[str(ctx.guild.id)]["command"].discard(cmd.qualified_name.lower())
+        self.bot.cache.guild_blacklist(ctx.guild.id).command.discard(cmd.qualified_name.lower())
+        await self.bot.invalidation.publish("blacklist")
         await util.send_success(ctx, f"`{ctx.prefix}{cmd}` is no longer blacklisted.")
 
     @unblacklist.command(name="global", hidden=True)
@@ -837,6 +856,7 @@ class Configuration(commands.Cog):
         """Unblacklist someone globally"""
         await self.bot.db.execute("DELETE FROM blacklisted_user WHERE user_id = %s", user.id)
         self.bot.cache.blacklist["global"]["user"].discard(user.id)
+        await self.bot.invalidation.publish("blacklist")
         await util.send_success(ctx, f"**{user}** can now use Miso Bot again!")
 
     @unblacklist.command(name="guild", hidden=True)
@@ -845,6 +865,7 @@ class Configuration(commands.Cog):
         """unblacklist a guild"""
         await self.bot.db.execute("DELETE FROM blacklisted_guild WHERE guild_id = %s", guild_id)
         self.bot.cache.blacklist["global"]["guild"].discard(guild_id)
+        await self.bot.invalidation.publish("blacklist")
         await util.send_success(ctx, f"Guild with id `{guild_id}` can use Miso Bot again!")
 
 
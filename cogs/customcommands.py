@@ -89,18 +89,7 @@ class CustomCommands(commands.Cog, name="Commands"):
             if response:
                 command_logger.info(log.custom_command_format(ctx, keyword))
                 await ctx.send(response)
-                await self.bot.db.execute(
-                    """
-                    INSERT INTO command_usage (guild_id, user_id, command_name, command_type)
-                        VALUES (%s, %s, %s, %s)
-                    ON DUPLICATE KEY UPDATE
-                        uses = uses + 1
-                    """,
-                    ctx.guild.id,
-                    ctx.author.id,
-                    keyword,
-                    "custom",
-                )
+                await queries.save_command_usage(ctx, keyword, "custom")
 
     @commands.group(aliases=["cmd"])
     @commands.guild_only()
@@ -151,7 +140,7 @@ class CustomCommands(commands.Cog, name="Commands"):
         if not owner_id:
             raise exceptions.CommandWarning(f"Custom command `{ctx.prefix}{name}` does not exist")
 
-        owner = ctx.guild.get_member(owner_id)
+        owner = await self.bot.member_cache.get_member(ctx.guild, owner_id)
         if (
             owner is not None
             and owner != ctx.author
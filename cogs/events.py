@@ -1,4 +1,5 @@
 import random
+from collections import defaultdict
 from itertools import cycle
 
 import arrow
@@ -6,12 +7,21 @@ import discord
 from discord.ext import commands, tasks
 
 from libraries import emoji_literals
-from modules import log, queries, util
+from modules import log, queries, stats, util
+from modules.message_store import MessageStore
 from modules.misobot import MisoBot
 
 logger = log.get_logger(__name__)
 command_logger = log.get_command_logger()
 
+ACTIVITY_TABLES = [
+    "user_activity",
+    "user_activity_day",
+    "user_activity_week",
+    "user_activity_month",
+    "user_activity_year",
+]
+
 
 class Events(commands.Cog):
     """Event handlers for various discord events"""
@@ -20,28 +30,174 @@ class Events(commands.Cog):
         self.bot: MisoBot = bot
         self.statuses = cycle(
             [
-                ("watching", lambda: f"{self.bot.guild_count:,} servers"),
-                ("listening", lambda: f"{self.bot.member_count:,} members"),
+                ("watching", lambda: f"{self.totals['guilds']:,} servers"),
+                ("listening", lambda: f"{self.totals['members']:,} members"),
                 ("playing", lambda: "misobot.xyz"),
             ]
         )
+        # counts of all clusters, refreshed before every status change
+        self.totals = {"guilds": 0, "members": 0}
         self.activity_id = {"playing": 0, "streaming": 1, "listening": 2, "watching": 3}
         self.guildlog = 652916681299066900
+        # (guild_id, user_id, hour) -> [is_bot, message_count, xp]
+        self.activity_buffer = defaultdict(lambda: [False, 0, 0])
+        # (guild_id, user_id, emoji_id) -> [emoji_name, uses]
+        self.custom_emoji_buffer = defaultdict(lambda: [None, 0])
+        # (guild_id, user_id, emoji_name) -> uses
+        self.unicode_emoji_buffer = defaultdict(int)
+        self.message_store = MessageStore(bot)
 
     async def cog_load(self):
         self.status_loop.start()
+        self.activity_loop.start()
+        self.stats_loop.start()
 
-    def cog_unload(self):
+    async def cog_unload(self):
         self.status_loop.cancel()
+        self.activity_loop.cancel()
+        self.stats_loop.cancel()
+        # flushed separately, so one failing doesn't lose the others
+        for name, flush in [
+            ("activity", self.write_activity),
+            ("emoji usage", self.write_emoji_usage),
+            ("stats", lambda: stats.write(self.bot)),
+        ]:
+            try:
+                await flush()
+            except Exception as e:
+                logger.error(f"Failed to write {name} on unload: {e}")
 
     @tasks.loop(minutes=3.0)
     async def status_loop(self):
+        try:
+            self.totals = await self.bot.cluster_stats()
+        except Exception as e:
+            # keep the last totals, the status is still rotated
+            logger.warning(f"Could not get cluster stats for status: {type(e).__name__} {e}")
         await self.next_status()
 
+    @tasks.loop(minutes=5)
+    async def stats_loop(self):
+        try:
+            await stats.write(self.bot)
+        except Exception as e:
+            logger.error(f"Failed to write stats: {e}")
+
     @status_loop.before_loop
+    @stats_loop.before_loop
     async def task_waiter(self):
         await self.bot.wait_until_ready()
 
+    @tasks.loop(minutes=1)
+    async def activity_loop(self):
+        try:
+            await self.write_activity()
+        except Exception as e:
+            logger.error(f"Failed to write user activity: {e}")
+        try:
+            await self.write_emoji_usage()
+        except Exception as e:
+            logger.error(f"Failed to write emoji usage: {e}")
+        self.message_store.prune()
+
+    def track_activity(self, message: discord.Message):
+        """Count the message towards the author's activity in the current hour"""
+        key = (message.guild.id, message.author.id, message.created_at.hour)
+        counter = self.activity_buffer[key]
+        counter[0] = message.author.bot
+        counter[1] += 1
+        counter[2] += util.xp_from_message(message)
+
+    def track_emojis(self, message: discord.Message):
+        """Count the emojis used in the message, each emoji once per message"""
+        for emoji_name, emoji_id in util.find_custom_emojis(message.content):
+            counter = self.custom_emoji_buffer[
+                (message.guild.id, message.author.id, int(emoji_id))
+            ]
+            counter[0] = emoji_name
+            counter[1] += 1
+
+        for emoji_name in util.find_unicode_emojis(message.content):
+            self.unicode_emoji_buffer[(message.guild.id, message.author.id, emoji_name)] += 1
+
+    async def write_emoji_usage(self):
+        """Flush the buffered emoji usage counters"""
+        if not self.custom_emoji_buffer and not self.unicode_emoji_buffer:
+            return
+
+        custom_buffer = self.custom_emoji_buffer
+        unicode_buffer = self.unicode_emoji_buffer
+        self.custom_emoji_buffer = defaultdict(lambda: [None, 0])
+        self.unicode_emoji_buffer = defaultdict(int)
+
+        try:
+            async with self.bot.db.transaction() as tx:
+                if custom_buffer:
+                    await tx.executemany(
+                        """
+                        INSERT INTO custom_emoji_usage (guild_id, user_id, emoji_id, emoji_name, uses)
+                            VALUES (%s, %s, %s, %s, %s)
+                        ON DUPLICATE KEY UPDATE
+                            emoji_name = VALUES(emoji_name),
+                            uses = uses + VALUES(uses)
+                        """,
+                        [key + (name, uses) for key, (name, uses) in custom_buffer.items()],
+                    )
+                if unicode_buffer:
+                    await tx.executemany(
+                        """
+                        INSERT INTO unicode_emoji_usage (guild_id, user_id, emoji_name, uses)
+                            VALUES (%s, %s, %s, %s)
+                        ON DUPLICATE KEY UPDATE
+                            uses = uses + VALUES(uses)
+                        """,
+                        [key + (uses,) for key, uses in unicode_buffer.items()],
+                    )
+        except Exception:
+            # put the counters back so they are retried on the next flush
+            for key, (name, uses) in custom_buffer.items():
+                counter = self.custom_emoji_buffer[key]
+                counter[0] = name
+                counter[1] += uses
+            for key, uses in unicode_buffer.items():
+                self.unicode_emoji_buffer[key] += uses
+            raise
+
+    async def write_activity(self):
+        """Flush the buffered activity counters into the activity tables"""
+        if not self.activity_buffer:
+            return
+
+        buffer = self.activity_buffer
+        self.activity_buffer = defaultdict(lambda: [False, 0, 0])
+
+        by_hour = defaultdict(list)
+        for (guild_id, user_id, hour), (is_bot, messages, xp) in buffer.items():
+            by_hour[hour].append((guild_id, user_id, is_bot, messages, xp))
+
+        try:
+            async with self.bot.db.transaction() as tx:
+                for hour, values in by_hour.items():
+                    for table in ACTIVITY_TABLES:
+                        await tx.executemany(
+                            f"""
+                            INSERT INTO {table} (guild_id, user_id, is_bot, message_count, h{hour})
+                                VALUES (%s, %s, %s, %s, %s)
+                            ON DUPLICATE KEY UPDATE
+                                message_count = message_count + VALUES(message_count),
+                                h{hour} = h{hour} + VALUES(h{hour})
+                            """,
+                            values,
+                        )
+        except Exception:
+            # put the counters back so they are retried on the next flush
+            for key, (is_bot, messages, xp) in buffer.items():
+                counter = self.activity_buffer[key]
+                counter[0] = is_bot
+                counter[1] += messages
+                counter[2] += xp
+            raise
+
     async def next_status(self):
         """switch to the next status message"""
         activity_type, status_func = next(self.statuses)
@@ -59,6 +215,7 @@ class Events(commands.Cog):
         # prevent double invocation for subcommands
         if ctx.invoked_subcommand is None:
             command_logger.info(log.log_command(ctx))
+            stats.increment("commands_used")
             if ctx.guild is not None:
                 await queries.save_command_usage(ctx)
 
@@ -114,9 +271,9 @@ class Events(commands.Cog):
         """Called when a new member joins a guild"""
         await self.bot.wait_until_ready()
         logging_channel_id = None
-        logging_settings = self.bot.cache.logging_settings.get(str(member.guild.id))
+        logging_settings = self.bot.cache.logging_settings.get(member.guild.id)
         if logging_settings:
-            logging_channel_id = logging_settings.get("member_log_channel_id")
+            logging_channel_id = logging_settings.member_log_channel_id
 
         if logging_channel_id:
             logging_channel = member.guild.get_channel(logging_channel_id)
@@ -129,7 +286,7 @@ class Events(commands.Cog):
                     pass
 
         # add autoroles
-        roles = self.bot.cache.autoroles.get(str(member.guild.id), [])
+        roles = self.bot.cache.autoroles.get(member.guild.id, [])
         for role_id in roles:
             role = member.guild.get_role(role_id)
             if role is None:
@@ -162,9 +319,9 @@ class Events(commands.Cog):
         """Called when user gets banned from a server"""
         await self.bot.wait_until_ready()
         logging_channel_id = None
-        logging_settings = self.bot.cache.logging_settings.get(str(guild.id))
+        logging_settings = self.bot.cache.logging_settings.get(guild.id)
         if logging_settings:
-            logging_channel_id = logging_settings.get("ban_log_channel_id")
+            logging_channel_id = logging_settings.ban_log_channel_id
 
         if logging_channel_id:
             channel = guild.get_channel(logging_channel_id)
@@ -185,9 +342,9 @@ class Events(commands.Cog):
         """Called when member leaves a guild"""
         await self.bot.wait_until_ready()
         logging_channel_id = None
-        logging_settings = self.bot.cache.logging_settings.get(str(member.guild.id))
+        logging_settings = self.bot.cache.logging_settings.get(member.guild.id)
         if logging_settings:
-            logging_channel_id = logging_settings.get("member_log_channel_id")
+            logging_channel_id = logging_settings.member_log_channel_id
 
         if logging_channel_id:
             logging_channel = member.guild.get_channel(logging_channel_id)
@@ -223,61 +380,53 @@ class Events(commands.Cog):
     @commands.Cog.listener()
     async def on_raw_message_delete(self, payload):
         """Listener that gets called when any message is deleted"""
-        await self.bot.wait_until_ready()
-
-        channel = self.bot.get_channel(payload.channel_id)
-        if channel is None:
-            return
-
-        message = payload.cached_message
+        message = self.message_store.pop(payload.channel_id, payload.message_id)
         if message is None:
             return
 
-        # ignore bots
-        if message.author.bot:
+        channel = self.bot.get_channel(payload.channel_id)
+        if channel is None:
             return
 
-        # ignore DMs
-        if message.guild is None:
+        channel_id = self.message_store.log_channel_id(payload.guild_id, payload.channel_id)
+        if channel_id is None:
             return
 
-        # ignore empty messages
-        if len(message.content) == 0 and len(message.attachments) == 0:
-            return
+        log_channel = channel.guild.get_channel(channel_id)
+        if log_channel is not None:
+            try:
+                await log_channel.send(embed=util.message_embed(message, channel))
+            except discord.errors.Forbidden:
+                pass
 
-        channel_id = None
-        logging_settings = self.bot.cache.logging_settings.get(str(message.guild.id))
-        if logging_settings:
-            channel_id = logging_settings.get("message_log_channel_id")
-        if channel_id:
-            log_channel = message.guild.get_channel(channel_id)
-            if log_channel is not None and message.channel != log_channel:
-                # ignored channels
-                ignored_channels = await self.bot.db.execute(
-                    "SELECT channel_id FROM message_log_ignore WHERE guild_id = %s",
-                    message.guild.id,
-                    as_list=True,
-                )
-                if message.channel.id not in ignored_channels:
-                    try:
-                        await log_channel.send(embed=util.message_embed(message))
-                    except discord.errors.Forbidden:
-                        pass
+    @commands.Cog.listener()
+    async def on_raw_message_edit(self, payload):
+        if "content" in payload.data:
+            self.message_store.edit(
+                payload.channel_id, payload.message_id, payload.data["content"]
+            )
 
     @commands.Cog.listener()
     async def on_message(self, message):
         """Listener that gets called on every message"""
         await self.bot.wait_until_ready()
 
+        stats.increment("messages")
+
         # ignore DMs
         if message.guild is None:
             return
 
+        self.track_activity(message)
+        self.message_store.add(message)
+
         # if bot account, ignore everything after this
         if message.author.bot:
             return
 
-        autoresponses = self.bot.cache.autoresponse.get(str(message.guild.id), True)
+        self.track_emojis(message)
+
+        autoresponses = self.bot.cache.autoresponse.get(message.guild.id, True)
         if autoresponses:
             await self.easter_eggs(message)
 
@@ -337,30 +486,25 @@ class Events(commands.Cog):
     async def on_raw_reaction_add(self, payload):
         """Starboard event handler"""
         await self.bot.wait_until_ready()
+        stats.increment("reactions")
 
-        user = self.bot.get_user(payload.user_id)
-        if user.bot:
+        user = payload.member or self.bot.get_user(payload.user_id)
+        if user is not None and user.bot:
             return
 
         if payload.channel_id in self.bot.cache.starboard_blacklisted_channels:
             return
 
-        starboard_settings = self.bot.cache.starboard_settings.get(str(payload.guild_id))
-        if not starboard_settings:
+        starboard_settings = self.bot.cache.starboard_settings.get(payload.guild_id)
+        if starboard_settings is None or not starboard_settings.is_enabled:
             return
 
-        (
-            is_enabled,
-            board_channel_id,
-            required_reaction_count,
-            emoji_name,
-            emoji_id,
-            emoji_type,
-            log_channel_id,
-        ) = starboard_settings
-
-        if not is_enabled:
-            return
+        board_channel_id = starboard_settings.channel_id
+        required_reaction_count = starboard_settings.reaction_count
+        emoji_name = starboard_settings.emoji_name
+        emoji_id = starboard_settings.emoji_id
+        emoji_type = starboard_settings.emoji_type
+        log_channel_id = starboard_settings.log_channel_id
 
         board_channel = self.bot.get_channel(board_channel_id)
         if board_channel is None:
@@ -132,40 +132,41 @@ class Fishy(commands.Cog):
             catch = random.choices(list(self.FISHTYPES.keys()), self.WEIGHTS)[0]
             amount = await self.FISHTYPES[catch](ctx, receiver, gift)
             self.ts_lock[str(ctx.author.id)] = ctx.message.created_at
-            await self.bot.db.execute(
-                """
-                INSERT INTO fishy (user_id, fishy_count, biggest_fish)
-                    VALUES (%s, %s, %s)
-                ON DUPLICATE KEY UPDATE
-                    fishy_count = fishy_count + VALUES(fishy_count),
-                    biggest_fish = GREATEST(biggest_fish, VALUES(biggest_fish))
-                """,
-                receiver.id,
-                amount,
-                amount,
-            )
-            await self.bot.db.execute(
-                f"""
-                INSERT INTO fish_type (user_id, {catch})
-                    VALUES (%s, 1)
-                ON DUPLICATE KEY
-                    UPDATE {catch} = {catch} + 1
-                """,
-                receiver.id,
-            )
+            async with self.bot.db.transaction() as tx:
+                await tx.execute(
+                    """
+                    INSERT INTO fishy (user_id, fishy_count, biggest_fish)
+                        VALUES (%s, %s, %s)
+                    ON DUPLICATE KEY UPDATE
+                        fishy_count = fishy_count + VALUES(fishy_count),
+                        biggest_fish = GREATEST(biggest_fish, VALUES(biggest_fish))
+                    """,
+                    receiver.id,
+                    amount,
+                    amount,
+                )
+                await tx.execute(
+                    f"""
+                    INSERT INTO fish_type (user_id, {catch})
+                        VALUES (%s, 1)
+                    ON DUPLICATE KEY
+                        UPDATE {catch} = {catch} + 1
+                    """,
+                    receiver.id,
+                )
 
-            await self.bot.db.execute(
-                """
-                INSERT INTO fishy (user_id, fishy_gifted_count, last_fishy)
-                    VALUES (%s, %s, %s)
-                ON DUPLICATE KEY UPDATE
-                    fishy_gifted_count = fishy_gifted_count + VALUES(fishy_gifted_count),
-                    last_fishy = VALUES(last_fishy)
-                """,
-                ctx.author.id,
-                amount if gift else 0,
-                ctx.message.created_at,
-            )
+                await tx.execute(
+                    """
+                    INSERT INTO fishy (user_id, fishy_gifted_count, last_fishy)
+                        VALUES (%s, %s, %s)
+                    ON DUPLICATE KEY UPDATE
+                        fishy_gifted_count = fishy_gifted_count + VALUES(fishy_gifted_count),
+                        last_fishy = VALUES(last_fishy)
+                    """,
+                    ctx.author.id,
+                    amount if gift else 0,
+                    ctx.message.created_at,
+                )
 
     @commands.command(aliases=["fintimer", "fisytimer", "foshytimer", "ft"])
     async def fishytimer(self, ctx: commands.Context):
@@ -2,9 +2,12 @@ import os
 
 import discord
 from discord.ext import commands
-from PIL import Image, ImageDraw, ImageFont
 
-from modules import util
+from modules import startup, util
+
+Image = startup.lazy_import("PIL.Image")
+ImageDraw = startup.lazy_import("PIL.ImageDraw")
+ImageFont = startup.lazy_import("PIL.ImageFont")
 
 
 class ImageObject:
@@ -8,12 +8,14 @@ import arrow
 import discord
 import humanize
 import orjson
-import psutil
 from discord.ext import commands
 
-from modules import emojis, exceptions, util
+from libraries import emoji_literals
+from modules import emojis, exceptions, startup, util
 from modules.misobot import MisoBot
 
+psutil = startup.lazy_import("psutil")
+
 
 class Information(commands.Cog):
     """See bot related information"""
@@ -82,14 +84,16 @@ class Information(commands.Cog):
         for user_id, is_active, amount, donating_since in sorted(
             patrons, key=lambda x: x[2], reverse=True
         ):
-            user = self.bot.get_user(user_id)
+            if not is_active:
+                continue
+
+            user = await self.bot.member_cache.get_user(user_id)
             if user is None:
                 continue
 
-            if is_active:
-                current.append(
-                    f"**${int(amount)}** by **{user}** (*for {humanize.naturaldelta(datetime.now() - donating_since)}*)"
-                )
+            current.append(
+                f"**${int(amount)}** by **{user}** (*for {humanize.naturaldelta(datetime.now() - donating_since)}*)"
+            )
 
         if current:
             content.description += "\n\n" + ("\n".join(current))
@@ -213,6 +217,7 @@ class Information(commands.Cog):
         await util.page_switcher(ctx, pages)
 
     @commands.command()
+    @util.requires_members()
     async def roleinfo(self, ctx: commands.Context, *, role: discord.Role):
         """Get information about a role"""
         content = discord.Embed(title=f"@{role.name} | #{role.id}")
@@ -268,25 +273,31 @@ class Information(commands.Cog):
             title=f":bar_chart: Most used commands in {ctx.guild.name}"
             + ("" if user is None else f" by {user}")
         )
-        opt = []
-        if user is not None:
-            opt = [user.id]
-
-        data = await self.bot.db.execute(
-            f"""
-            SELECT command_name, SUM(use_sum) as total FROM (
-                SELECT command_name, SUM(uses) as use_sum, user_id FROM command_usage
+        if user is None:
+            data = await self.bot.db.execute(
+                """
+                SELECT command_name, uses FROM command_usage_guild
                     WHERE command_type = 'internal'
                       AND guild_id = %s
-                    {'AND user_id = %s' if user is not None else ''}
-                GROUP BY command_name, user_id
-            ) as subq
-            GROUP BY command_name
-            ORDER BY total DESC
-            """,
-            ctx.guild.id,
-            *opt,
-        )
+                ORDER BY uses DESC
+                """,
+                ctx.guild.id,
+                read_only=True,
+            )
+        else:
+            data = await self.bot.db.execute(
+                """
+                SELECT command_name, SUM(uses) as total FROM command_usage
+                    WHERE command_type = 'internal'
+                      AND guild_id = %s
+                      AND user_id = %s
+                GROUP BY command_name
+                ORDER BY total DESC
+                """,
+                ctx.guild.id,
+                user.id,
+                read_only=True,
+            )
         rows = []
         total = 0
         for i, (command_name, count) in enumerate(data, start=1):
@@ -309,23 +320,27 @@ class Information(commands.Cog):
         content = discord.Embed(
             title=":bar_chart: Most used commands" + ("" if user is None else f" by {user}")
         )
-        opt = []
-        if user is not None:
-            opt = [user.id]
-
-        data = await self.bot.db.execute(
-            f"""
-            SELECT command_name, SUM(use_sum) as total FROM (
-                SELECT command_name, SUM(uses) as use_sum, user_id FROM command_usage
+        if user is None:
+            data = await self.bot.db.execute(
+                """
+                SELECT command_name, uses FROM command_usage_total
                     WHERE command_type = 'internal'
-                    {'AND user_id = %s' if user is not None else ''}
-                GROUP BY command_name, user_id
-            ) as subq
-            GROUP BY command_name
-            ORDER BY total DESC
-            """,
-            *opt,
-        )
+                ORDER BY uses DESC
+                """,
+                read_only=True,
+            )
+        else:
+            data = await self.bot.db.execute(
+                """
+                SELECT command_name, SUM(uses) as total FROM command_usage
+                    WHERE command_type = 'internal'
+                      AND user_id = %s
+                GROUP BY command_name
+                ORDER BY total DESC
+                """,
+                user.id,
+                read_only=True,
+            )
         rows = []
         total = 0
         for i, (command_name, count) in enumerate(data, start=1):
@@ -358,44 +373,66 @@ class Information(commands.Cog):
         else:
             command_name = command.qualified_name
 
-        (total_uses, most_used_by_user_id, most_used_by_user_amount,) = await self.bot.db.execute(
+        total_uses = await self.bot.db.execute(
             f"""
-            SELECT SUM(use_sum) as total, user_id, MAX(use_sum) FROM (
-                SELECT SUM(uses) as use_sum, user_id FROM command_usage
+            SELECT SUM(uses) FROM command_usage_total
+                WHERE command_type = 'internal'
+                  AND command_name {'IN %s' if group else '= %s'}
+            """,
+            command_name,
+            one_value=True,
+            read_only=True,
+        )
+
+        most_used_by_user_id, most_used_by_user_amount = (
+            await self.bot.db.execute(
+                f"""
+                SELECT user_id, SUM(uses) as use_sum FROM command_usage
                     WHERE command_type = 'internal'
                       AND command_name {'IN %s' if group else '= %s'}
                 GROUP BY user_id
-            ) as subq
-            """,
-            command_name,
-            one_row=True,
+                ORDER BY use_sum DESC
+                LIMIT 1
+                """,
+                command_name,
+                one_row=True,
+                read_only=True,
+            )
+            or (None, None)
         )
+        most_used_by_user = None
+        if most_used_by_user_id is not None:
+            most_used_by_user = await self.bot.member_cache.get_user(most_used_by_user_id)
 
-        most_used_by_guild_id, most_used_by_guild_amount = await self.bot.db.execute(
-            f"""
-            SELECT guild_id, MAX(use_sum) FROM (
-                SELECT guild_id, SUM(uses) as use_sum FROM command_usage
+        most_used_by_guild_id, most_used_by_guild_amount = (
+            await self.bot.db.execute(
+                f"""
+                SELECT guild_id, SUM(uses) as use_sum FROM command_usage_guild
                     WHERE command_type = 'internal'
                       AND command_name {'IN %s' if group else '= %s'}
                 GROUP BY guild_id
-            ) as subq
-            """,
-            command_name,
-            one_row=True,
+                ORDER BY use_sum DESC
+                LIMIT 1
+                """,
+                command_name,
+                one_row=True,
+                read_only=True,
+            )
+            or (None, None)
         )
 
         uses_in_this_server = (
             await self.bot.db.execute(
                 f"""
-                SELECT SUM(uses) FROM command_usage
+                SELECT SUM(uses) FROM command_usage_guild
                     WHERE command_type = 'internal'
                       AND command_name {'IN %s' if group else '= %s'}
                       AND guild_id = %s
-                GROUP BY guild_id
                 """,
                 command_name,
                 ctx.guild.id,
                 one_value=True,
+                read_only=True,
             )
             or 0
         )
@@ -410,7 +447,7 @@ class Information(commands.Cog):
         )
         content.add_field(
             name="Most total uses by",
-            value=f"{self.bot.get_user(most_used_by_user_id)} ({most_used_by_user_amount or 0})",
+            value=f"{most_used_by_user} ({most_used_by_user_amount or 0})",
         )
 
         # additional data for command groups
@@ -419,12 +456,13 @@ class Information(commands.Cog):
             subcommands_tuple = tuple([f"{command.name} {x.name}" for x in command.commands])
             subcommand_usage = await self.bot.db.execute(
                 """
-                SELECT command_name, SUM(uses) FROM command_usage
+                SELECT command_name, uses FROM command_usage_total
                     WHERE command_type = 'internal'
                       AND command_name IN %s
-                GROUP BY command_name ORDER BY SUM(uses) DESC
+                ORDER BY uses DESC
                 """,
                 subcommands_tuple,
+                read_only=True,
             )
             content.add_field(
                 name="Subcommand usage",
@@ -434,6 +472,60 @@ class Information(commands.Cog):
 
         await ctx.send(embed=content)
 
+    @commands.command(aliases=["emojiusage"])
+    @commands.guild_only()
+    async def emojistats(self, ctx: commands.Context, user: discord.Member = None):
+        """Most used emojis in this server"""
+        content = discord.Embed(
+            title=f":bar_chart: Most used emojis in {ctx.guild.name}"
+            + ("" if user is None else f" by {user}")
+        )
+        user_filter = "" if user is None else "AND user_id = %s"
+        params = [ctx.guild.id] if user is None else [ctx.guild.id, user.id]
+        custom_data = await self.bot.db.execute(
+            f"""
+            SELECT emoji_id, MAX(emoji_name), SUM(uses) AS total FROM custom_emoji_usage
+                WHERE guild_id = %s {user_filter}
+            GROUP BY emoji_id
+            ORDER BY total DESC
+            LIMIT 150
+            """,
+            *params,
+            read_only=True,
+        )
+        unicode_data = await self.bot.db.execute(
+            f"""
+            SELECT emoji_name, SUM(uses) AS total FROM unicode_emoji_usage
+                WHERE guild_id = %s {user_filter}
+            GROUP BY emoji_name
+            ORDER BY total DESC
+            LIMIT 150
+            """,
+            *params,
+            read_only=True,
+        )
+
+        usage = []
+        for emoji_id, emoji_name, count in custom_data:
+            emoji = self.bot.get_emoji(emoji_id)
+            usage.append((int(count), str(emoji) if emoji else f"`:{emoji_name}:`"))
+        for emoji_name, count in unicode_data:
+            usage.append((int(count), emoji_literals.NAME_TO_UNICODE.get(emoji_name, emoji_name)))
+        usage.sort(key=lambda x: x[0], reverse=True)
+
+        rows = []
+        total = 0
+        for i, (count, emoji) in enumerate(usage[:150], start=1):
+            total += count
+            rows.append(f"`#{i:2}` **{count}** use{'' if count == 1 else 's'} : {emoji}")
+
+        if rows:
+            content.set_footer(text=f"Total {total} uses")
+            await util.send_as_pages(ctx, content, rows)
+        else:
+            content.description = "No data :("
+            await ctx.send(embed=content)
+
     @commands.command(aliases=["serverdp", "sdp", "guildicon"])
     async def servericon(self, ctx: commands.Context, guild: int = None):
         """Get the icon of the server"""
@@ -8,10 +8,11 @@ import arrow
 import async_cse
 import discord
 import humanize
-from bs4 import BeautifulSoup
 from discord.ext import commands
 
-from modules import exceptions, util
+from modules import exceptions, startup, util
+
+bs4 = startup.lazy_import("bs4")
 
 GCS_DEVELOPER_KEY = os.environ.get("GOOGLE_KEY")
 
@@ -198,7 +199,7 @@ class Kpop(commands.Cog):
         async def scrape(category, url):
             artists = []
             async with self.bot.session.get(url) as response:
-                soup = BeautifulSoup(await response.text(), "html.parser")
+                soup = bs4.BeautifulSoup(await response.text(), "html.parser")
                 content = soup.find("div", {"class": "entry-content herald-entry-content"})
                 outer = content.find_all("p")
                 for p in outer:
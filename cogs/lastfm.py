@@ -9,15 +9,17 @@ import urllib.parse
 
 import aiohttp
 import arrow
-import colorgram
 import discord
-import kdtree
 import orjson
-from bs4 import BeautifulSoup
 from discord.ext import commands
-from PIL import Image
 
-from modules import emojis, exceptions, log, util
+from modules import emojis, exceptions, log, startup, stats, util
+
+# only needed by a few commands, imported on first use
+bs4 = startup.lazy_import("bs4")
+colorgram = startup.lazy_import("colorgram")
+kdtree = startup.lazy_import("kdtree")
+Image = startup.lazy_import("PIL.Image")
 
 LASTFM_APPID = os.environ.get("LASTFM_APIKEY")
 LASTFM_TOKEN = os.environ.get("LASTFM_SECRET")
@@ -33,7 +35,7 @@ def is_small_server():
     async def predicate(ctx):
         if ctx.guild is None:
             return True
-        await util.require_chunked(ctx.guild)
+        await ctx.bot.chunker.require(ctx.guild)
         users = await ctx.bot.db.execute(
             """
             SELECT count(*) FROM user_settings WHERE user_id IN %s
@@ -678,7 +680,7 @@ class LastFm(commands.Cog):
         if data is None:
             raise exceptions.LastFMError(404, "Album page not found")
 
-        soup = BeautifulSoup(data, "html.parser")
+        soup = bs4.BeautifulSoup(data, "html.parser")
 
         album = {
             "image_url": soup.find("header", {"class": "library-header"})
@@ -707,7 +709,7 @@ class LastFm(commands.Cog):
         if data is None:
             raise exceptions.LastFMError(404, "Artist page not found")
 
-        soup = BeautifulSoup(data, "html.parser")
+        soup = bs4.BeautifulSoup(data, "html.parser")
 
         artist = {
             "image_url": soup.find("span", {"class": "library-header-image"})
@@ -737,7 +739,7 @@ class LastFm(commands.Cog):
         if data is None:
             raise exceptions.LastFMError(404, "Artist page not found")
 
-        soup = BeautifulSoup(data, "html.parser")
+        soup = bs4.BeautifulSoup(data, "html.parser")
         try:
             albumsdiv, tracksdiv, _ = soup.findAll("tbody", {"data-playlisting-add-entries": ""})
 
@@ -1154,6 +1156,7 @@ class LastFm(commands.Cog):
         return await util.render_html(self.bot, payload)
 
     async def server_lastfm_usernames(self, ctx: commands.Context, filter_cheaters=False):
+        await self.bot.chunker.require(ctx.guild)
         guild_user_ids = [user.id for user in ctx.guild.members]
         data = await self.bot.db.execute(
             """
@@ -1859,6 +1862,7 @@ class LastFm(commands.Cog):
             """,
             ctx.guild.id,
             user.id,
+            read_only=True,
         )
         if not crownartists:
             return await ctx.send(
@@ -2114,6 +2118,7 @@ class LastFm(commands.Cog):
         tries = 0
         max_tries = 2
         while True:
+            stats.increment("lastfm_api_requests")
             async with self.bot.session.get(url, params=params) as response:
                 try:
                     content = await response.json(loads=orjson.loads)
@@ -2395,7 +2400,7 @@ class LastFm(commands.Cog):
         if data is None:
             return None
 
-        soup = BeautifulSoup(data, "html.parser")
+        soup = bs4.BeautifulSoup(data, "html.parser")
         image = soup.find("img", {"class": "image-list-image"})
         if image is None:
             try:
@@ -2420,7 +2425,7 @@ class LastFm(commands.Cog):
             if len(images) >= amount:
                 break
 
-            soup = BeautifulSoup(data, "html.parser")
+            soup = bs4.BeautifulSoup(data, "html.parser")
             imagedivs = soup.findAll("td", {"class": "chartlist-image"})
             images += [
                 div.find("img")["src"].replace("/avatar70s/", "/300x300/") for div in imagedivs
@@ -2641,7 +2646,7 @@ async def get_additional_pages(session, soup, url):
     async def get_additional_page(n):
         new_url = url + f"&page={n}"
         data = await fetch(session, new_url, handling="text")
-        soup = BeautifulSoup(data, "html.parser")
+        soup = bs4.BeautifulSoup(data, "html.parser")
         return get_list_contents(soup)
 
     tasks = []
@@ -3,22 +3,23 @@ import io
 import os
 import random
 import re
+from functools import cached_property
 
 import arrow
 import discord
 import orjson
 import regex
-import tweepy
 import yarl
-from bs4 import BeautifulSoup
 from discord.ext import commands
-from tweepy import OAuthHandler
 
-from modules import exceptions, instagram, log, util
+from modules import exceptions, instagram, log, startup, util
 from modules.views import LinkButton
 
 logger = log.get_logger(__name__)
 
+bs4 = startup.lazy_import("bs4")
+tweepy = startup.lazy_import("tweepy")
+
 TWITTER_CKEY = os.environ.get("TWITTER_CONSUMER_KEY")
 TWITTER_CSECRET = os.environ.get("TWITTER_CONSUMER_SECRET")
 IG_SESSION_ID = os.environ.get("IG_SESSION_ID")
@@ -37,7 +38,6 @@ class Media(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.icon = "🌐"
-        self.twitter_api = tweepy.API(OAuthHandler(TWITTER_CKEY, TWITTER_CSECRET))
         self.ig = instagram.Instagram(
             self.bot.session,
             IG_SESSION_ID,
@@ -47,6 +47,10 @@ class Media(commands.Cog):
             proxy_pass=PROXY_PASS,
         )
 
+    @cached_property
+    def twitter_api(self):
+        return tweepy.API(tweepy.OAuthHandler(TWITTER_CKEY, TWITTER_CSECRET))
+
     @commands.command(aliases=["yt"])
     async def youtube(self, ctx: commands.Context, *, query):
         """Search for videos from youtube"""
@@ -377,7 +381,7 @@ class Media(commands.Cog):
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:65.0) Gecko/20100101 Firefox/65.0",
         }
         async with self.bot.session.get(url, headers=headers) as response:
-            soup = BeautifulSoup(await response.text(), "html.parser")
+            soup = bs4.BeautifulSoup(await response.text(), "html.parser")
 
         song_titles = [
             util.escape_md(x.find("span").find("a").text)
@@ -434,7 +438,7 @@ async def setup(bot):
 async def extract_scripts(session, url):
     async with session.get(url) as response:
         data = await response.text()
-        soup = BeautifulSoup(data, "html.parser")
+        soup = bs4.BeautifulSoup(data, "html.parser")
         return soup.find_all("script", {"type": "application/ld+json"})
 
 
@@ -447,7 +451,7 @@ class GGSoup:
             f"https://{region}.op.gg/summoner/{sub_url}userName={summoner_name}"
         ) as response:
             data = await response.text()
-            self.soup = BeautifulSoup(data, "html.parser")
+            self.soup = bs4.BeautifulSoup(data, "html.parser")
 
     def text(self, obj, classname, source=None):
         if source is None:
@@ -39,8 +39,14 @@ class Mod(commands.Cog):
         """Check all current mutes"""
         if self.cache_needs_refreshing:
             self.cache_needs_refreshing = False
+            # every cluster only handles the guilds on its own shards
+            shard_filter, params = self.bot.shard_filter()
             self.unmute_list = await self.bot.db.execute(
-                "SELECT user_id, guild_id, channel_id, unmute_on FROM muted_user WHERE unmute_on IS NOT NULL"
+                f"""
+                SELECT user_id, guild_id, channel_id, unmute_on FROM muted_user
+                WHERE unmute_on IS NOT NULL AND {shard_filter}
+                """,
+                *params,
             )
 
         if not self.unmute_list:
@@ -53,11 +59,11 @@ class Mod(commands.Cog):
                 continue
 
             guild = self.bot.get_guild(guild_id)
-            if guild is not None:
-                await util.require_chunked(guild)
-                user = guild.get_member(user_id)
-            else:
-                user = None
+            if guild is None:
+                # unavailable or not on this cluster, try again once it can be seen
+                continue
+
+            user = await self.bot.member_cache.get_member(guild, user_id)
             if user is not None:
                 mute_role_id = await self.bot.db.execute(
                     """
@@ -87,9 +93,7 @@ class Mod(commands.Cog):
                             "Unable to send unmuting message due to missing permissions!"
                         )
             else:
-                logger.info(
-                    f"Deleted expired mute of unknown user {user_id} or unknown guild {guild_id}"
-                )
+                logger.info(f"Deleted expired mute of user {user_id} who left guild {guild_id}")
 
             await self.bot.db.execute(
                 """
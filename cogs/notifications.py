@@ -4,7 +4,7 @@ import discord
 import regex
 from discord.ext import commands
 
-from modules import emojis, exceptions, util
+from modules import emojis, exceptions, startup, stats, util
 
 
 class Notifications(commands.Cog):
@@ -17,6 +17,13 @@ class Notifications(commands.Cog):
         self.notifications_cache = {}
 
     async def cog_load(self):
+        await startup.warm_cache(self.create_cache())
+        self.bot.invalidation.subscribe("notifications", self.on_invalidate)
+
+    async def cog_unload(self):
+        self.bot.invalidation.unsubscribe("notifications", self.on_invalidate)
+
+    async def on_invalidate(self, _guild_id):
         await self.create_cache()
 
     async def create_cache(self):
@@ -51,6 +58,7 @@ class Notifications(commands.Cog):
 
         try:
             await member.send(embed=content)
+            stats.increment("notifications_sent")
             self.bot.logger.info(f"Sending notification for words {keywords} to {member}")
             if not test:
                 for keyword in keywords:
@@ -121,6 +129,7 @@ class Notifications(commands.Cog):
                     keyword,
                 )
                 await self.create_cache()
+                await self.bot.invalidation.publish("notifications", message.guild.id)
                 continue
 
             if member is not None and message.channel.permissions_for(member).read_messages:
@@ -192,6 +201,7 @@ class Notifications(commands.Cog):
             self.notifications_cache[str(guild_id)][keyword].append(ctx.author.id)
         except KeyError:
             self.notifications_cache[str(guild_id)][keyword] = [ctx.author.id]
+        await self.bot.invalidation.publish("notifications", guild_id)
 
         await util.send_success(ctx, f"New notification set! Check your DM {emojis.VIVISMIRK}")
 
@@ -242,6 +252,7 @@ class Notifications(commands.Cog):
 
         # remake notification cache
         await self.create_cache()
+        await self.bot.invalidation.publish("notifications", guild_id)
         await util.send_success(ctx, f"Removed a notification! Check your DM {emojis.VIVISMIRK}")
 
     @notification.command(name="list")
@@ -252,6 +263,7 @@ class Notifications(commands.Cog):
             SELECT guild_id, keyword, times_triggered FROM notification WHERE user_id = %s ORDER BY keyword
             """,
             ctx.author.id,
+            read_only=True,
         )
 
         if not words:
@@ -300,6 +312,7 @@ class Notifications(commands.Cog):
 
         # remake notification cache
         await self.create_cache()
+        await self.bot.invalidation.publish("notifications")
 
     @notification.command(name="test")
     async def notification_test(self, ctx: commands.Context, message: discord.Message = None):
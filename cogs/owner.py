@@ -1,13 +1,16 @@
 import asyncio
+import io
 
 import arrow
 import discord
 from discord.ext import commands
 
-from modules import log, util
+from modules import cpu_profiler, exceptions, log, startup, stats, util
 
 logger = log.get_logger(__name__)
 
+plotter = startup.lazy_import("libraries.plotter")
+
 
 class Owner(commands.Cog):
     """Bot owner only, you shouldn't be able to see this"""
@@ -32,39 +35,46 @@ class Owner(commands.Cog):
     @commands.command()
     async def guilds(self, ctx: commands.Context):
         """Show all connected guilds"""
+        totals = await self.bot.cluster_stats()
         content = discord.Embed(
-            title=f"Total **{self.bot.guild_count}** guilds, **{self.bot.member_count}** members"
+            title=f"Total **{totals['guilds']}** guilds, **{totals['members']}** members"
         )
-
-        rows = []
-        for guild in sorted(self.bot.guilds, key=lambda x: x.member_count, reverse=True):
-            rows.append(f"[`{guild.id}`] **{guild.member_count}** members : **{guild.name}**")
-
+        rows = await self.cluster_guild_rows()
         await util.send_as_pages(ctx, content, rows)
 
     @commands.command()
     async def findguild(self, ctx: commands.Context, *, search_term):
-        """Find a guild by name"""
-        rows = []
-        for guild in sorted(self.bot.guilds, key=lambda x: x.member_count, reverse=True):
-            if search_term.lower() in guild.name.lower():
-                rows.append(f"[`{guild.id}`] **{guild.member_count}** members : **{guild.name}**")
-
+        """Find a guild by name or id"""
+        if search_term.isdigit():
+            guild_id = int(search_term)
+            results = await self.bot.cluster_request("find_guild", guild_id, guild_id=guild_id)
+            for cluster, guild in results.items():
+                if guild is not None:
+                    return await ctx.send(
+                        f"[`{guild['id']}`] **{guild['member_count']}** members : "
+                        f"**{guild['name']}** (shard {guild['shard_id']}, cluster `{cluster}`)"
+                    )
+
+        rows = await self.cluster_guild_rows({"search": search_term})
         content = discord.Embed(title=f"Found **{len(rows)}** guilds matching search term")
         await util.send_as_pages(ctx, content, rows)
 
     @commands.command()
     async def userguilds(self, ctx: commands.Context, user: discord.User):
         """Get all guilds user is part of"""
-        rows = []
-        for guild in sorted(self.bot.guilds, key=lambda x: x.member_count, reverse=True):
-            guildmember = guild.get_member(user.id)
-            if guildmember is not None:
-                rows.append(f"[`{guild.id}`] **{guild.member_count}** members : **{guild.name}**")
-
+        rows = await self.cluster_guild_rows({"user_id": user.id})
         content = discord.Embed(title=f"User **{user}** found in **{len(rows)}** guilds")
         await util.send_as_pages(ctx, content, rows)
 
+    async def cluster_guild_rows(self, data=None):
+        """Guild rows of every cluster, largest first"""
+        results = await self.bot.cluster_request("guild_list", data)
+        guilds = [guild for cluster_guilds in results.values() for guild in cluster_guilds]
+        return [
+            f"[`{guild_id}`] **{member_count}** members : **{name}**"
+            for guild_id, name, member_count in sorted(guilds, key=lambda x: x[2], reverse=True)
+        ]
+
     @commands.command()
     async def logout(self, ctx: commands.Context):
         """Shut down the bot"""
@@ -155,7 +165,13 @@ class Owner(commands.Cog):
     @commands.is_owner()
     async def database_query(self, ctx: commands.Context, *, statement):
         """Execute something against the local MariaDB instance"""
-        data = await self.bot.db.execute(statement)
+        data = []
+        async with self.bot.db.stream(statement) as rows:
+            async for row in rows:
+                data.append(row)
+                if len(data) >= 10000:
+                    # stop reading, there's no way anyone is paging through more than this
+                    break
         try:
             if data:
                 content = "\n".join(str(r) for r in data)
@@ -193,6 +209,168 @@ class Owner(commands.Cog):
             functions = {"⬅": previous_page, "➡": next_page}
             asyncio.ensure_future(util.reaction_buttons(ctx, msg, functions))
 
+    @commands.command(name="dbstats")
+    async def database_stats(self, ctx: commands.Context, sort_by="total"):
+        """Show the most expensive database queries since startup
+
+        Sort by one of: total, avg, max, calls, rows
+        """
+        keys = {
+            "total": "total_time",
+            "avg": "avg_time",
+            "max": "max_time",
+            "calls": "calls",
+            "rows": "rows",
+        }
+        if sort_by not in keys:
+            raise exceptions.CommandWarning(f"Can only sort by one of {', '.join(keys)}")
+
+        rows = []
+        for query in self.bot.db.top_queries(keys[sort_by]):
+            rows.append(
+                f"`{query.query_id}` **{query.total_time:.2f}s** total | {query.calls} calls | "
+                f"{query.avg_time*1000:.1f}ms avg | {query.max_time*1000:.0f}ms max | "
+                f"{query.rows} rows\n```sql\n{query.statement[:200]}\n```"
+            )
+
+        content = discord.Embed(
+            title=f"Top database queries by {sort_by}",
+        )
+        content.set_footer(text=f"{len(self.bot.db.slow_queries)} recent slow queries")
+        await util.send_as_pages(ctx, content, rows, maxrows=5)
+
+    @commands.command(name="statsgraph")
+    async def stats_graph(self, ctx: commands.Context, column, days: int = 7):
+        """Chart a column of the stats table over time
+
+        Column is one of: messages, reactions, commands_used, guild_count, member_count,
+        notifications_sent, lastfm_api_requests, html_rendered
+        """
+        if column not in stats.COLUMNS:
+            raise exceptions.CommandWarning(f"Column must be one of {', '.join(stats.COLUMNS)}")
+
+        # aim for roughly a hundred points on the graph
+        bucket_minutes = max(5, days * 24 * 60 // 100)
+        data = await stats.query(
+            self.bot, column, arrow.utcnow().shift(days=-days).datetime, bucket_minutes
+        )
+        if not data:
+            raise exceptions.CommandInfo("No stats have been recorded for this timeframe yet")
+
+        frame, values = zip(*data)
+        buffer = io.BytesIO()
+        await self.bot.loop.run_in_executor(
+            None,
+            lambda: plotter.time_series_graph(
+                frame,
+                values,
+                "#ffffff",
+                title=f"{column}, last {days} days ({bucket_minutes} minute buckets)",
+                output=buffer,
+            ),
+        )
+        buffer.seek(0)
+        await ctx.send(file=discord.File(fp=buffer, filename=f"{column}.png"))
+
+    @commands.group(case_insensitive=True)
+    async def memory(self, ctx: commands.Context):
+        """Trace memory allocations of this cluster to find leaks"""
+        await util.command_group_help(ctx)
+
+    async def memory_action(self, action, **options):
+        report = await self.bot.memory_profiler.run(action, **options)
+        if "error" in report:
+            raise exceptions.CommandWarning(report["error"])
+        return report
+
+    def memory_status_embed(self, report, title):
+        content = discord.Embed(title=title)
+        content.add_field(name="Traced", value=format_size(report["traced_bytes"]))
+        content.add_field(name="Peak", value=format_size(report["peak_bytes"]))
+        content.add_field(name="Tracemalloc overhead", value=format_size(report["overhead_bytes"]))
+        content.set_footer(text=f"Tracing {report['frames']} frames")
+        return content
+
+    @memory.command(name="start")
+    async def memory_start(self, ctx: commands.Context, frames: int = 1):
+        """Start tracing allocations, keeping this many frames of traceback"""
+        report = await self.memory_action("start", frames=frames)
+        await ctx.send(embed=self.memory_status_embed(report, "Started tracing memory"))
+
+    @memory.command(name="status")
+    async def memory_status(self, ctx: commands.Context):
+        """Show how much memory is traced"""
+        report = await self.memory_action("status")
+        tracing = "Tracing memory" if report["tracing"] else "Not tracing memory"
+        await ctx.send(embed=self.memory_status_embed(report, tracing))
+
+    @memory.command(name="stop")
+    async def memory_stop(self, ctx: commands.Context):
+        """Stop tracing allocations"""
+        report = await self.memory_action("stop")
+        await ctx.send(embed=self.memory_status_embed(report, "Stopped tracing memory"))
+
+    @memory.command(name="snapshot", aliases=["diff"])
+    async def memory_snapshot(self, ctx: commands.Context, limit: int = 25):
+        """Show what allocated memory since the previous snapshot"""
+        report = await self.memory_action("snapshot", limit=limit)
+        rows = []
+        for site in report["sites"]:
+            traceback = "\n".join(site["traceback"])
+            rows.append(
+                f"**{format_size(site['size_diff'], sign=True)}** "
+                f"({site['count_diff']:+} blocks) | {format_size(site['size'])} total\n"
+                f"```{traceback}```"
+            )
+        content = self.memory_status_embed(
+            report,
+            f"Memory change since last snapshot: {format_size(report['size_diff'], sign=True)}",
+        )
+        await util.send_as_pages(ctx, content, rows, maxrows=5)
+
+    @memory.command(name="census")
+    async def memory_census(self, ctx: commands.Context, limit: int = 25):
+        """Count discord.py objects and measure the size of caches"""
+        report = await self.memory_action("census", limit=limit)
+        rows = [
+            f"`{cache['name']}` **{format_size(cache['size'])}** | {cache['items']} items"
+            for cache in report["caches"]
+        ]
+        rows += [
+            f"`{row['type']}` **{format_size(row['size'])}** | {row['count']} objects"
+            for row in report["types"]
+        ]
+        content = discord.Embed(title=f"Census of {report['objects']} objects")
+        await util.send_as_pages(ctx, content, rows)
+
+    @commands.command(name="cpuprofile", aliases=["flamegraph"])
+    async def cpu_profile(self, ctx: commands.Context, seconds: int = 10, threads="loop"):
+        """Sample where this cluster spends cpu time and upload a flame graph
+
+        Samples only the event loop thread by default, use `all` to sample every thread.
+        """
+        if threads not in ["loop", "all"]:
+            raise exceptions.CommandWarning("Threads must be either `loop` or `all`")
+
+        await ctx.send(f"Profiling for {seconds} seconds :stopwatch:")
+        result = await self.bot.cpu_profiler.profile(seconds, all_threads=threads == "all")
+        if "error" in result:
+            raise exceptions.CommandWarning(result["error"])
+
+        stacks = result["stacks"]
+        title = f"{result['samples']} samples over {seconds} seconds ({threads} threads)"
+        svg = cpu_profiler.flamegraph_svg(stacks, title)
+        await ctx.send(
+            title,
+            files=[
+                discord.File(fp=io.BytesIO(svg.encode()), filename="profile.svg"),
+                discord.File(
+                    fp=io.BytesIO(cpu_profiler.collapsed(stacks).encode()),
+                    filename="profile.collapsed.txt",
+                ),
+            ],
+        )
+
     @commands.command(aliases=["fmban"])
     async def fmflag(self, ctx: commands.Context, lastfm_username, *, reason):
         """Flag LastFM account as a cheater"""
@@ -214,6 +392,17 @@ class Owner(commands.Cog):
         await util.send_success(ctx, f"`{lastfm_username}` is no longer flagged as a cheater.")
 
 
+def format_size(size, sign=False):
+    """Human readable amount of bytes"""
+    for unit in ["B", "KiB", "MiB"]:
+        if abs(size) < 1024:
+            break
+        size /= 1024
+    else:
+        unit = "GiB"
+    return f"{size:+.1f}{unit}" if sign else f"{size:.1f}{unit}"
+
+
 def clean_codeblock(text):
     """Remove codeblocks and empty lines, return lines"""
     text = text.strip(" `")
@@ -1,14 +1,16 @@
 from time import time
 
-import psutil
 from discord.ext import commands, tasks
 from prometheus_client import Counter, Gauge, Histogram, Summary
 
-from modules import log
+from modules import log, startup
+from modules.loop_monitor import LoopMonitor
 from modules.misobot import MisoBot
 
 logger = log.get_logger(__name__)
 
+psutil = startup.lazy_import("psutil")
+
 
 class Prometheus(commands.Cog):
     """Collects prometheus metrics"""
@@ -35,6 +37,12 @@ class Prometheus(commands.Cog):
             ["command"],
             buckets=(0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0),
         )
+        self.command_span_histogram = Histogram(
+            "miso_command_span_time_seconds",
+            "Time spent per span type (db, http, render, other) within a command in seconds.",
+            ["command", "span"],
+            buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0),
+        )
         self.shard_latency_summary = Summary(
             "miso_shard_latency_seconds",
             "Latency of a shard in seconds.",
@@ -52,16 +60,42 @@ class Prometheus(commands.Cog):
             "miso_cached_user_count",
             "Total amount of users cached",
         )
+        self.loop_lag_histogram = Histogram(
+            "miso_event_loop_lag_seconds",
+            "Scheduling lag of the event loop in seconds.",
+            buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+        )
+        self.loop_block_counter = Counter(
+            "miso_event_loop_blocks_total",
+            "Number of times a callback blocked the event loop over the threshold.",
+            ["location"],
+        )
+        self.loop_block_histogram = Histogram(
+            "miso_event_loop_block_duration_seconds",
+            "Duration of detected event loop blocks in seconds.",
+            buckets=(0.5, 1.0, 2.0, 5.0, 10.0, 30.0),
+        )
+        self.loop_monitor = LoopMonitor(
+            on_lag=self.loop_lag_histogram.observe,
+            on_block=self.record_loop_block,
+        )
 
     async def cog_load(self):
         self.log_system_metrics.start()
         self.log_shard_latencies.start()
         self.log_cache_contents.start()
+        self.loop_monitor.start()
 
     def cog_unload(self):
         self.log_system_metrics.cancel()
         self.log_shard_latencies.cancel()
         self.log_cache_contents.cancel()
+        self.loop_monitor.stop()
+
+    def record_loop_block(self, event):
+        """Called from the loop monitor watchdog thread when the event loop is blocked"""
+        self.loop_block_counter.labels(event.location).inc()
+        self.loop_block_histogram.observe(event.duration)
 
     @commands.Cog.listener()
     async def on_socket_event_type(self, event_type):
@@ -98,6 +132,11 @@ class Prometheus(commands.Cog):
             took = time() - ctx.timer
             command = str(ctx.command)
             self.command_histogram.labels(command).observe(took)
+            trace = getattr(ctx, "trace", None)
+            if trace is not None:
+                trace.finish()
+                for span, duration in trace.breakdown().items():
+                    self.command_span_histogram.labels(command, span).observe(duration)
 
 
 async def setup(bot):
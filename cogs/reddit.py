@@ -1,12 +1,14 @@
 import os
+from functools import cached_property
 
 import arrow
-import asyncpraw
-import asyncprawcore
 import discord
 from discord.ext import commands
 
-from modules import emojis, util
+from modules import emojis, startup, util
+
+asyncpraw = startup.lazy_import("asyncpraw")
+asyncprawcore = startup.lazy_import("asyncprawcore")
 
 CLIENT_ID = os.environ.get("REDDIT_CLIENT_ID")
 CLIENT_SECRET = os.environ.get("REDDIT_CLIENT_SECRET")
@@ -31,7 +33,10 @@ class Reddit(commands.Cog):
             "month": "monthly",
             "year": "yearly",
         }
-        self.client = asyncpraw.Reddit(
+
+    @cached_property
+    def client(self):
+        return asyncpraw.Reddit(
             client_id=CLIENT_ID,
             client_secret=CLIENT_SECRET,
             user_agent="discord:miso_bot",
@@ -73,6 +73,7 @@ class Rolepicker(commands.Cog):
         """Set the channel you want to add and remove roles in"""
         await queries.update_setting(ctx, "rolepicker_settings", "channel_id", channel.id)
         self.bot.cache.rolepickers.add(channel.id)
+        await self.bot.invalidation.publish("channels")
         await util.send_success(
             ctx,
             f"Rolepicker channel set to {channel.mention}\n"
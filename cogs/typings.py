@@ -132,16 +132,16 @@ class Typings(commands.Cog):
         await enter_message.add_reaction(note_emoji)
         await enter_message.add_reaction(check_emoji)
 
-        def check(_reaction, _user):
+        def check(payload):
             return (
-                _reaction.message.id == enter_message.id
-                and _reaction.emoji in [note_emoji, check_emoji]
-                and not _user == ctx.bot.user
+                payload.message_id == enter_message.id
+                and str(payload.emoji) in [note_emoji, check_emoji]
+                and payload.user_id != ctx.bot.user.id
             )
 
         while not race_in_progress:
             try:
-                reaction, user = await ctx.bot.wait_for("reaction_add", timeout=120.0, check=check)
+                payload = await ctx.bot.wait_for("raw_reaction_add", timeout=120.0, check=check)
             except asyncio.TimeoutError:
                 try:
                     for emoji in [note_emoji, check_emoji]:
@@ -150,7 +150,10 @@ class Typings(commands.Cog):
                     pass
                 break
             else:
-                if reaction.emoji == note_emoji:
+                # the bot doesn't cache messages, so only raw reaction events are received
+                user = payload.member or await ctx.bot.fetch_user(payload.user_id)
+                emoji = str(payload.emoji)
+                if emoji == note_emoji:
                     if user in players:
                         continue
                     players.add(user)
@@ -160,7 +163,7 @@ class Typings(commands.Cog):
                         value="\n".join(f"**{util.displayname(x)}**" for x in players),
                     )
                     await enter_message.edit(embed=content)
-                elif reaction.emoji == check_emoji:
+                elif emoji == check_emoji:
                     if user == ctx.author:
                         if len(players) < 2:
                             cant_race_alone = await ctx.send("You can't race alone!")
@@ -301,8 +304,9 @@ class Typings(commands.Cog):
         msg = await ctx.send(embed=content)
 
         async def confirm():
-            await self.bot.db.execute("DELETE FROM typing_stats WHERE user_id = %s", ctx.author.id)
-            await self.bot.db.execute("DELETE FROM typing_race WHERE user_id = %s", ctx.author.id)
+            async with self.bot.db.transaction() as tx:
+                await tx.execute("DELETE FROM typing_stats WHERE user_id = %s", ctx.author.id)
+                await tx.execute("DELETE FROM typing_race WHERE user_id = %s", ctx.author.id)
             content.title = ":white_check_mark: Cleared your data"
             content.color = int("77b255", 16)
             content.description = ""
@@ -335,6 +339,7 @@ class Typings(commands.Cog):
             """,
             user.id,
             one_row=True,
+            read_only=True,
         )
         if not data:
             raise exceptions.CommandInfo(
@@ -1,4 +1,6 @@
 import asyncio
+import io
+from time import time
 
 import arrow
 import bleach
@@ -6,16 +8,36 @@ import discord
 import humanize
 from discord.ext import commands
 
-from modules import emojis, exceptions, queries, util
+from modules import emojis, exceptions, log, queries, startup, util
+
+plotter = startup.lazy_import("libraries.plotter")
+
+ACTIVITY_HOURS = ", ".join(f"h{hour}" for hour in range(24))
+ACTIVITY_TIMEFRAMES = {
+    "day": "user_activity_day",
+    "week": "user_activity_week",
+    "month": "user_activity_month",
+    "year": "user_activity_year",
+    "all": "user_activity",
+}
+
+logger = log.get_logger(__name__)
 
 
 class User(commands.Cog):
     """User related commands"""
 
+    # rows that fit on the pages of send_as_pages with default settings
+    LEADERBOARD_MAX_ROWS = 15 * 10
+    LEADERBOARD_CACHE_TTL = 60
+    # extra global rows to read, to fill the leaderboard when some of the users were deleted
+    LEADERBOARD_EXTRA_ROWS = 20
+
     def __init__(self, bot):
         self.bot = bot
         self.icon = "👤"
         self.proposals = set()
+        self.leaderboard_cache = {}
         self.medal_emoji = [":first_place:", ":second_place:", ":third_place:"]
         with open("html/profile.min.html", "r", encoding="utf-8") as file:
             self.profile_html = file.read()
@@ -27,7 +49,7 @@ class User(commands.Cog):
             user = ctx.author
 
         assets = []
-        member = ctx.guild.get_member(user.id)
+        member = await self.bot.member_cache.get_member(ctx.guild, user.id)
         if member and member.guild_avatar:
             assets.append((member.guild_avatar, "Server avatar"))
         if user.avatar:
@@ -69,6 +91,7 @@ class User(commands.Cog):
 
     @commands.command(aliases=["uinfo"])
     @commands.cooldown(3, 30, type=commands.BucketType.user)
+    @util.requires_members()
     async def userinfo(self, ctx: commands.Context, *, user: discord.User = None):
         """Get information about discord user"""
         if user is None:
@@ -148,6 +171,7 @@ class User(commands.Cog):
             await ctx.send(f"{emoji}")
 
     @commands.command()
+    @util.requires_members()
     async def members(self, ctx: commands.Context):
         """Show the newest members of this server"""
         sorted_members = sorted(ctx.guild.members, key=lambda x: x.joined_at, reverse=True)
@@ -270,6 +294,7 @@ class User(commands.Cog):
         await ctx.send(embed=content)
 
     @commands.command(aliases=["roles"])
+    @util.requires_members()
     async def roleslist(self, ctx: commands.Context):
         """List the roles of this server"""
         content = discord.Embed(title=f"Roles in {ctx.message.guild.name}")
@@ -282,31 +307,155 @@ class User(commands.Cog):
 
         await util.send_as_pages(ctx, content, rows)
 
+    async def activity_data(self, guild_id, user_id=None, timeframe="all"):
+        """Hourly xp gained in a guild, either by a single user or by everyone combined"""
+        table = ACTIVITY_TIMEFRAMES[timeframe]
+        if user_id is None:
+            sums = ", ".join(f"SUM(h{hour})" for hour in range(24))
+            data = await self.bot.db.execute(
+                f"SELECT {sums} FROM {table} WHERE guild_id = %s",
+                guild_id,
+                one_row=True,
+                read_only=True,
+            )
+        else:
+            data = await self.bot.db.execute(
+                f"SELECT {ACTIVITY_HOURS} FROM {table} WHERE guild_id = %s AND user_id = %s",
+                guild_id,
+                user_id,
+                one_row=True,
+                read_only=True,
+            )
+        return [int(value or 0) for value in data] if data else [0] * 24
+
+    async def send_activity_graph(self, ctx: commands.Context, data, title, color):
+        if not any(data):
+            raise exceptions.CommandInfo("No activity recorded for this timeframe yet!")
+
+        buffer = io.BytesIO()
+        await self.bot.loop.run_in_executor(
+            None,
+            lambda: plotter.create_graph(data, str(color), title=title, output=buffer),
+        )
+        buffer.seek(0)
+        await ctx.send(file=discord.File(fp=buffer, filename="activity.png"))
+
+    @commands.command()
+    @commands.guild_only()
+    async def activity(self, ctx: commands.Context, user: discord.Member = None, timeframe="all"):
+        """
+        See your hourly activity on this server
+
+        Timeframe can be one of [day | week | month | year | all]
+        """
+        if user is None:
+            user = ctx.author
+
+        timeframe = timeframe.lower()
+        if timeframe not in ACTIVITY_TIMEFRAMES:
+            raise exceptions.CommandWarning(f"Unknown timeframe `{timeframe}`")
+
+        data = await self.activity_data(ctx.guild.id, user.id, timeframe)
+        color = user.color if user.color.value else "#ffffff"
+        await self.send_activity_graph(
+            ctx, data, f"{user.name} | {timeframe} | {sum(data)} XP", color
+        )
+
+    @commands.command(aliases=["guildactivity"])
+    @commands.guild_only()
+    async def serveractivity(self, ctx: commands.Context, timeframe="all"):
+        """
+        See the hourly activity of this server
+
+        Timeframe can be one of [day | week | month | year | all]
+        """
+        timeframe = timeframe.lower()
+        if timeframe not in ACTIVITY_TIMEFRAMES:
+            raise exceptions.CommandWarning(f"Unknown timeframe `{timeframe}`")
+
+        data = await self.activity_data(ctx.guild.id, timeframe=timeframe)
+        await self.send_activity_graph(
+            ctx, data, f"{ctx.guild.name} | {timeframe} | {sum(data)} XP", "#ffffff"
+        )
+
     @commands.group(case_insensitive=True, aliases=["lb"])
     async def leaderboard(self, ctx: commands.Context):
         """Show various leaderboards"""
         await util.command_group_help(ctx)
 
+    async def leaderboard_data(
+        self, ctx: commands.Context, name, global_data, global_statement, guild_statement
+    ):
+        """Get rows for a leaderboard, limited to the current guild's members unless global.
+        The user id of each row is replaced with the user.
+
+        Global leaderboards are streamed and filtered to users that still exist, looked up once
+        the cursor is closed since uncached users are fetched from the api.
+        Guild leaderboards are filtered in the database by joining against the member ids.
+        """
+        key = (name, None if global_data else ctx.guild.id)
+        cached = self.leaderboard_cache.get(key)
+        if cached is not None and cached[0] > time():
+            return cached[1]
+
+        if global_data:
+            candidates = []
+            async with self.bot.db.stream(global_statement, read_only=True) as rows:
+                async for row in rows:
+                    candidates.append(row)
+                    if len(candidates) > self.LEADERBOARD_MAX_ROWS + self.LEADERBOARD_EXTRA_ROWS:
+                        break
+
+            users = await asyncio.gather(
+                *(self.bot.member_cache.get_user(row[0]) for row in candidates),
+                return_exceptions=True,
+            )
+            data = []
+            for row, user in zip(candidates, users):
+                if isinstance(user, Exception):
+                    logger.warning(
+                        f"Could not get user {row[0]} for the {name} leaderboard: {user}"
+                    )
+                elif user is not None:
+                    data.append((user, *row[1:]))
+            data = data[: self.LEADERBOARD_MAX_ROWS + 1]
+        else:
+            rows = await queries.guild_member_query(
+                self.bot, ctx.guild, guild_statement, self.LEADERBOARD_MAX_ROWS + 1
+            )
+            data = [
+                (member, *row[1:])
+                for row in rows
+                if (member := ctx.guild.get_member(row[0])) is not None
+            ]
+
+        now = time()
+        if len(self.leaderboard_cache) > 1000:
+            self.leaderboard_cache = {
+                k: v for k, v in self.leaderboard_cache.items() if v[0] > now
+            }
+        self.leaderboard_cache[key] = (now + self.LEADERBOARD_CACHE_TTL, data)
+        return data
+
     @leaderboard.command(name="fishy")
     async def leaderboard_fishy(self, ctx: commands.Context, scope=""):
         """Fishy leaderboard"""
         global_data = scope.lower() == "global"
-        data = await self.bot.db.execute(
-            "SELECT user_id, fishy_count FROM fishy ORDER BY fishy_count DESC"
+        data = await self.leaderboard_data(
+            ctx,
+            "fishy",
+            global_data,
+            "SELECT user_id, fishy_count FROM fishy WHERE fishy_count > 0 ORDER BY fishy_count DESC",
+            """
+            SELECT user_id, fishy_count FROM fishy JOIN guild_member USING (user_id)
+            WHERE fishy_count > 0 ORDER BY fishy_count DESC LIMIT %s
+            """,
         )
 
         rows = []
         medal_emoji = [":first_place:", ":second_place:", ":third_place:"]
         i = 1
-        for user_id, fishy_count in data:
-            if global_data:
-                user = self.bot.get_user(user_id)
-            else:
-                user = ctx.guild.get_member(user_id)
-
-            if user is None or fishy_count == 0:
-                continue
-
+        for user, fishy_count in data:
             if i <= len(medal_emoji):
                 ranking = medal_emoji[i - 1]
             else:
@@ -328,25 +477,24 @@ class User(commands.Cog):
     async def leaderboard_wpm(self, ctx: commands.Context, scope=""):
         """Typing speed leaderboard"""
         _global_ = scope == "global"
-
-        data = await self.bot.db.execute(
+        data = await self.leaderboard_data(
+            ctx,
+            "wpm",
+            _global_,
             """
             SELECT user_id, MAX(wpm) as wpm, test_date, word_count FROM typing_stats
             GROUP BY user_id ORDER BY wpm DESC
+            """,
             """
+            SELECT user_id, MAX(wpm) as wpm, test_date, word_count
+                FROM typing_stats JOIN guild_member USING (user_id)
+            GROUP BY user_id ORDER BY wpm DESC LIMIT %s
+            """,
         )
 
         rows = []
         i = 1
-        for userid, wpm, test_date, word_count in data:
-            if _global_:
-                user = self.bot.get_user(userid)
-            else:
-                user = ctx.guild.get_member(userid)
-
-            if user is None:
-                continue
-
+        for user, wpm, test_date, word_count in data:
             if i <= len(self.medal_emoji):
                 ranking = self.medal_emoji[i - 1]
             else:
@@ -367,6 +515,7 @@ class User(commands.Cog):
         await util.send_as_pages(ctx, content, rows)
 
     @leaderboard.command(name="crowns")
+    @util.requires_members()
     async def leaderboard_crowns(self, ctx: commands.Context):
         """Last.fm artist crowns leaderboard"""
         data = await self.bot.db.execute(
@@ -375,6 +524,7 @@ class User(commands.Cog):
             WHERE guild_id = %s GROUP BY user_id ORDER BY amount DESC
             """,
             ctx.guild.id,
+            read_only=True,
         )
         rows = []
         for i, (user_id, amount) in enumerate(data, start=1):
@@ -495,6 +645,16 @@ class User(commands.Cog):
             one_value=True,
         )
 
+        activity = await self.activity_data(ctx.guild.id, user.id) if ctx.guild else [0] * 24
+        global_xp = await self.bot.db.execute(
+            f"SELECT SUM({' + '.join(f'h{hour}' for hour in range(24))}) "
+            "FROM user_activity WHERE user_id = %s",
+            user.id,
+            one_value=True,
+            read_only=True,
+        )
+        show_graph = bool(profile_data and profile_data[3]) and any(activity)
+
         replacements = {
             "BACKGROUND_IMAGE": background_url,
             "WRAPPER_CLASS": "custom-bg" if background_url != "" else "",
@@ -506,15 +666,15 @@ class User(commands.Cog):
             "DISCRIMINATOR": f"#{user.discriminator}",
             "DESCRIPTION": description,
             "FISHY_AMOUNT": fishy or 0,
-            "SERVER_LEVEL": 0,
-            "GLOBAL_LEVEL": 0,
-            "ACTIVITY_DATA": [],
-            "CHART_MAX": 0,
+            "SERVER_LEVEL": util.get_level(sum(activity)),
+            "GLOBAL_LEVEL": util.get_level(int(global_xp or 0)),
+            "ACTIVITY_DATA": activity,
+            "CHART_MAX": max(activity),
             "COMMANDS_USED": command_uses or 0,
             "BADGES": "\n".join(badges),
             "USERNAME_SIZE": get_font_size(user.name),
-            "SHOW_GRAPH": "false",
-            "DESCRIPTION_HEIGHT": "350px",
+            "SHOW_GRAPH": "true" if show_graph else "false",
+            "DESCRIPTION_HEIGHT": "210px" if show_graph else "350px",
         }
 
         payload = {
@@ -571,7 +731,7 @@ class User(commands.Cog):
         await util.send_success(ctx, "Profile background image updated!")
 
     @util.patrons_only()
-    @editprofile.command(name="graph", hidden=True, enabled=False)
+    @editprofile.command(name="graph")
     async def editprofile_graph(self, ctx: commands.Context, value: bool):
         """Toggle whether to show activity graph on your profile or not"""
         await self.bot.db.execute(
@@ -624,22 +784,20 @@ class User(commands.Cog):
         """Marry someone"""
         if user == ctx.author:
             return await ctx.send("You cannot marry yourself...")
-        if {user.id, ctx.author.id} in self.bot.cache.marriages:
+        partner_id = self.bot.cache.partner(ctx.author.id)
+        if partner_id == user.id:
             return await ctx.send("You two are already married!")
-        for el in self.bot.cache.marriages:
-            if ctx.author.id in el:
-                pair = list(el)
-                if ctx.author.id == pair[0]:
-                    partner = ctx.guild.get_member(pair[1]) or self.bot.get_user(pair[1])
-                else:
-                    partner = ctx.guild.get_member(pair[0]) or self.bot.get_user(pair[0])
-                return await ctx.send(
-                    f":confused: You are already married to **{util.displayname(partner)}**! You must divorce before marrying someone else..."
-                )
-            if user.id in el:
-                return await ctx.send(
-                    f":grimacing: **{user}** is already married to someone else, sorry!"
-                )
+        if partner_id is not None:
+            partner = await self.bot.member_cache.get_member(
+                ctx.guild, partner_id
+            ) or await self.bot.member_cache.get_user(partner_id)
+            return await ctx.send(
+                f":confused: You are already married to **{util.displayname(partner)}**! You must divorce before marrying someone else..."
+            )
+        if self.bot.cache.partner(user.id) is not None:
+            return await ctx.send(
+                f":grimacing: **{user}** is already married to someone else, sorry!"
+            )
 
         if (user.id, ctx.author.id) in self.proposals:
             await self.bot.db.execute(
@@ -648,7 +806,8 @@ class User(commands.Cog):
                 ctx.author.id,
                 arrow.now().datetime,
             )
-            self.bot.cache.marriages.append({user.id, ctx.author.id})
+            self.bot.cache.add_marriage(user.id, ctx.author.id)
+            await self.bot.invalidation.publish("marriages")
             await ctx.send(
                 embed=discord.Embed(
                     color=int("dd2e44", 16),
@@ -672,20 +831,14 @@ class User(commands.Cog):
     @commands.command()
     async def divorce(self, ctx: commands.Context):
         """End your marriage"""
-        partner = ""
-        to_remove = []
-        for el in self.bot.cache.marriages:
-            if ctx.author.id in el:
-                to_remove.append(el)
-                pair = list(el)
-                if ctx.author.id == pair[0]:
-                    partner = ctx.guild.get_member(pair[1]) or self.bot.get_user(pair[1])
-                else:
-                    partner = ctx.guild.get_member(pair[0]) or self.bot.get_user(pair[0])
-
-        if partner == "":
+        partner_id = self.bot.cache.partner(ctx.author.id)
+        if partner_id is None:
             return await ctx.send(":thinking: You are not married!")
 
+        partner = await self.bot.member_cache.get_member(
+            ctx.guild, partner_id
+        ) or await self.bot.member_cache.get_user(partner_id)
+
         content = discord.Embed(
             description=f":broken_heart: Divorce **{util.displayname(partner)}**?",
             color=int("dd2e44", 16),
@@ -693,13 +846,13 @@ class User(commands.Cog):
         msg = await ctx.send(embed=content)
 
         async def confirm():
-            for x in to_remove:
-                self.bot.cache.marriages.remove(x)
+            self.bot.cache.remove_marriage(ctx.author.id)
             await self.bot.db.execute(
                 "DELETE FROM marriage WHERE first_user_id = %s OR second_user_id = %s",
                 ctx.author.id,
                 ctx.author.id,
             )
+            await self.bot.invalidation.publish("marriages")
             await ctx.send(
                 embed=discord.Embed(
                     color=int("ffcc4d", 16),
@@ -729,9 +882,13 @@ class User(commands.Cog):
         )
         if data:
             if data[0] == ctx.author.id:
-                partner = ctx.guild.get_member(data[1]) or self.bot.get_user(data[1])
+                partner = await self.bot.member_cache.get_member(
+                    ctx.guild, data[1]
+                ) or await self.bot.member_cache.get_user(data[1])
             else:
-                partner = ctx.guild.get_member(data[0]) or self.bot.get_user(data[0])
+                partner = await self.bot.member_cache.get_member(
+                    ctx.guild, data[0]
+                ) or await self.bot.member_cache.get_user(data[0])
             marriage_date = data[2]
             length = humanize.naturaldelta(
                 arrow.utcnow().timestamp() - marriage_date.timestamp(), months=False
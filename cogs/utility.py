@@ -8,10 +8,11 @@ import aiohttp
 import arrow
 import discord
 import orjson
-from bs4 import BeautifulSoup
 from discord.ext import commands, tasks
 
-from modules import emojis, exceptions, log, queries, util
+from modules import emojis, exceptions, log, queries, startup, util
+
+bs4 = startup.lazy_import("bs4")
 
 GOOGLE_API_KEY = os.environ.get("GOOGLE_KEY")
 DARKSKY_API_KEY = os.environ.get("DARK_SKY_KEY")
@@ -112,11 +113,14 @@ class Utility(commands.Cog):
         """Check all current reminders"""
         if self.cache_needs_refreshing:
             self.cache_needs_refreshing = False
+            # every cluster only handles the reminders set in guilds on its own shards
+            shard_filter, params = self.bot.shard_filter()
             self.reminder_list = await self.bot.db.execute(
-                """
+                f"""
                 SELECT user_id, guild_id, created_on, reminder_date, content, original_message_url
-                FROM reminder
-                """
+                FROM reminder WHERE {shard_filter}
+                """,
+                *params,
             )
 
         if not self.reminder_list:
@@ -135,7 +139,13 @@ class Utility(commands.Cog):
             if reminder_ts > now_ts:
                 continue
 
-            user = self.bot.get_user(user_id)
+            try:
+                user = await self.bot.member_cache.get_user(user_id)
+            except discord.HTTPException as e:
+                # try again on the next loop instead of losing the reminder
+                logger.warning(f"Unable to fetch user {user_id} for a reminder: {e}")
+                continue
+
             if user is not None:
                 guild = self.bot.get_guild(guild_id)
                 if guild is None:
@@ -650,7 +660,7 @@ class Utility(commands.Cog):
         await asyncio.sleep(5)
         while True:
             async with self.bot.session.get(link) as response:
-                soup = BeautifulSoup(await response.text(), "html.parser")
+                soup = bs4.BeautifulSoup(await response.text(), "html.parser")
                 meta = soup.find("meta", {"property": "og:url"})
 
                 if meta:
@@ -795,6 +805,7 @@ class Utility(commands.Cog):
         await util.send_success(ctx, "Your timezone is no longer saved.")
 
     @timezone.command(name="list")
+    @util.requires_members()
     async def tz_list(self, ctx: commands.Context):
         """List current time of all server members who have it saved"""
         content = discord.Embed(
@@ -1,12 +1,14 @@
+import hmac
 import os
 import ssl
 
 import aiohttp_cors
 from aiohttp import web
 from discord.ext import commands, tasks
-from prometheus_async import aio
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Metric, generate_latest
+from prometheus_client.parser import text_string_to_metric_families
 
-from modules import log
+from modules import cpu_profiler, log
 
 logger = log.get_logger(__name__)
 
@@ -15,6 +17,8 @@ HOST = os.environ.get("WEBSERVER_HOSTNAME")
 PORT = int(os.environ.get("WEBSERVER_PORT", 0))
 SSL_CERT = os.environ.get("WEBSERVER_SSL_CERT")
 SSL_KEY = os.environ.get("WEBSERVER_SSL_KEY")
+# bearer token for the /debug endpoints, they are disabled without one
+DEBUG_TOKEN = os.environ.get("WEBSERVER_DEBUG_TOKEN")
 
 
 class WebServer(commands.Cog):
@@ -35,7 +39,11 @@ class WebServer(commands.Cog):
         self.app.router.add_get("/stats", self.website_statistics)
         self.app.router.add_get("/documentation", self.command_list)
         self.app.router.add_get("/donators", self.donator_list)
-        self.app.router.add_get("/metrics", aio.web.server_stats)
+        self.app.router.add_get("/metrics", self.metrics)
+        self.app.router.add_get("/debug/memory", self.memory_profile)
+        self.app.router.add_get("/debug/memory/{action:snapshot|census}", self.memory_profile)
+        self.app.router.add_post("/debug/memory/{action:start|stop}", self.memory_profile)
+        self.app.router.add_get("/debug/profile", self.cpu_profile)
         # Configure default CORS settings.
         self.cors = aiohttp_cors.setup(
             self.app,
@@ -71,10 +79,11 @@ class WebServer(commands.Cog):
     @tasks.loop(minutes=1)
     async def cache_stats(self):
         self.cached["commands"] = int(
-            await self.bot.db.execute("SELECT SUM(uses) FROM command_usage", one_value=True)
+            await self.bot.db.execute("SELECT SUM(uses) FROM command_usage_total", one_value=True)
         )
-        self.cached["guilds"] = self.bot.guild_count
-        self.cached["users"] = self.bot.member_count
+        totals = await self.bot.cluster_stats()
+        self.cached["guilds"] = totals["guilds"]
+        self.cached["users"] = totals["members"]
         self.cached["donators"] = await self.update_donator_list()
 
     @cache_stats.before_loop
@@ -133,6 +142,67 @@ class WebServer(commands.Cog):
     async def website_statistics(self, request):
         return web.json_response(self.cached)
 
+    async def metrics(self, request):
+        """Prometheus metrics of every cluster, labeled with the cluster they came from"""
+        expositions = await self.bot.cluster_request("metrics")
+        return web.Response(
+            body=merge_expositions(expositions),
+            headers={"Content-Type": CONTENT_TYPE_LATEST},
+        )
+
+    async def memory_profile(self, request):
+        """Memory profiler reports of every cluster, or the one given with ?cluster=
+
+        Optional query parameters are `limit` for the number of rows and `frames` for start.
+        """
+        check_debug_token(request)
+        data = {"action": request.match_info.get("action", "status")}
+        for option in ["limit", "frames"]:
+            if option in request.query:
+                try:
+                    data[option] = int(request.query[option])
+                except ValueError:
+                    raise web.HTTPBadRequest(text=f"{option} must be an integer")
+        # snapshots and census of a large heap can take a while
+        results = await self.bot.cluster_request(
+            "memory", data, target=request.query.get("cluster"), timeout=60
+        )
+        return web.json_response(results)
+
+    async def cpu_profile(self, request):
+        """Sampling cpu profile of every cluster, or the one given with ?cluster=
+
+        Query parameters are `seconds` (default 10), `threads` as `loop` or `all`, and `format`
+        as `collapsed` (default) for collapsed stacks or `svg` for a flame graph.
+        """
+        check_debug_token(request)
+        try:
+            seconds = float(request.query.get("seconds", 10))
+        except ValueError:
+            raise web.HTTPBadRequest(text="seconds must be a number")
+        output_format = request.query.get("format", "collapsed")
+        if output_format not in ["collapsed", "svg"]:
+            raise web.HTTPBadRequest(text="format must be collapsed or svg")
+
+        data = {"seconds": seconds, "all_threads": request.query.get("threads") == "all"}
+        results = await self.bot.cluster_request(
+            "cpu_profile", data, target=request.query.get("cluster"), timeout=seconds + 5
+        )
+        errors = [result["error"] for result in results.values() if "error" in result]
+        if errors:
+            raise web.HTTPConflict(text=errors[0])
+        if not results:
+            raise web.HTTPNotFound(text="No such cluster")
+
+        stacks = cpu_profiler.merge_stacks(results)
+        if output_format == "svg":
+            samples = sum(result["samples"] for result in results.values())
+            title = f"{samples} samples over {seconds:g} seconds in {', '.join(results)}"
+            return web.Response(
+                text=cpu_profiler.flamegraph_svg(stacks, title), content_type="image/svg+xml"
+            )
+        return web.Response(text=cpu_profiler.collapsed(stacks))
+
     async def command_list(self, request):
         return web.json_response(self.cached_command_list)
 
@@ -188,5 +258,44 @@ class WebServer(commands.Cog):
         return result
 
 
+def check_debug_token(request):
+    if not DEBUG_TOKEN:
+        raise web.HTTPNotFound()
+    authorization = request.headers.get("Authorization", "")
+    if not hmac.compare_digest(authorization.encode(), f"Bearer {DEBUG_TOKEN}".encode()):
+        raise web.HTTPUnauthorized()
+
+
+class StaticCollector:
+    def __init__(self, metrics):
+        self.metrics = metrics
+
+    def collect(self):
+        return self.metrics
+
+
+def merge_expositions(expositions: dict) -> bytes:
+    """Combine the text expositions of multiple clusters into one, adding a `cluster` label"""
+    metrics = {}
+    for cluster, text in expositions.items():
+        for family in text_string_to_metric_families(text):
+            metric = metrics.get(family.name)
+            if metric is None:
+                metric = metrics[family.name] = Metric(
+                    family.name, family.documentation, family.type, family.unit
+                )
+            for sample in family.samples:
+                metric.add_sample(
+                    sample.name,
+                    {**sample.labels, "cluster": cluster},
+                    sample.value,
+                    sample.timestamp,
+                )
+
+    registry = CollectorRegistry(auto_describe=False)
+    registry.register(StaticCollector(list(metrics.values())))
+    return generate_latest(registry)
+
+
 async def setup(bot):
     await bot.add_cog(WebServer(bot))
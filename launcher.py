@@ -0,0 +1,259 @@
+"""
+Runs the bot as multiple processes, each one a MisoCluster with its own range of shards.
+
+usage:
+    python launcher.py [dev] [maintenance]
+
+CLUSTER_COUNT sets the amount of processes (defaults to the number of cpu cores), and
+SHARD_COUNT the total amount of shards (defaults to the amount recommended by discord).
+The clusters talk to each other through an IPC broker on the unix socket IPC_SOCKET_PATH.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+from time import monotonic
+
+import aiohttp
+
+from modules import ipc, log
+
+logger = log.get_logger("launcher")
+
+# seconds per shard to wait for a cluster to identify before starting the next one anyway
+IDENTIFY_INTERVAL = 5.5
+RESTART_BACKOFF_MAX = 300
+# a cluster that ran for this many seconds before crashing is considered healthy again
+HEALTHY_UPTIME = 600
+
+
+def shard_ranges(shard_count, cluster_count):
+    """Split shards into `cluster_count` contiguous ranges of as equal size as possible"""
+    cluster_count = max(1, min(cluster_count, shard_count))
+    size, remainder = divmod(shard_count, cluster_count)
+    ranges = []
+    start = 0
+    for cluster_id in range(cluster_count):
+        end = start + size + (1 if cluster_id < remainder else 0)
+        ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+
+async def recommended_shard_count(token):
+    async with aiohttp.ClientSession() as session:
+        async with session.get(
+            "https://discord.com/api/v10/gateway/bot",
+            headers={"Authorization": f"Bot {token}"},
+        ) as response:
+            response.raise_for_status()
+            data = await response.json()
+            return data["shards"]
+
+
+def run_cluster(cluster_id, shard_ids, shard_count, ready_event, log_queue, ipc_path, argv):
+    """Entry point of a cluster process"""
+    sys.argv = argv
+    log.send_to_queue(log_queue, f"#{cluster_id}")
+
+    # imported here so the launcher process doesn't have to load the whole bot
+    import main
+    from modules.misobot import MisoCluster
+
+    # recording frames from one cluster is enough
+    main.patch_gateway(record=cluster_id == 0)
+    extensions = main.extensions
+    if cluster_id != 0:
+        # only one process can bind the webserver port
+        extensions = [e for e in extensions if e != "webserver"]
+
+    bot = MisoCluster(
+        cluster_name=f"#{cluster_id}",
+        cluster_id=cluster_id,
+        ready_event=ready_event,
+        ipc_path=ipc_path,
+        extensions=extensions,
+        default_prefix=main.prefix,
+        shard_ids=shard_ids,
+        shard_count=shard_count,
+    )
+    try:
+        bot.run(
+            main.TOKEN,
+            log_handler=log.make_handler(None),
+            log_formatter=logging.Formatter("{message}", style="{"),
+            root_logger=False,
+        )
+    except asyncio.CancelledError:
+        # stopped by SIGTERM from the launcher, the bot has been closed already
+        pass
+
+
+class Cluster:
+    def __init__(self, launcher, cluster_id, shard_ids):
+        self.launcher = launcher
+        self.cluster_id = cluster_id
+        self.shard_ids = shard_ids
+        self.process = None
+        self.ready_event = None
+        self.started_at = None
+        self.failures = 0
+
+    @property
+    def name(self):
+        return f"#{self.cluster_id}"
+
+    def start(self):
+        context = self.launcher.context
+        self.ready_event = context.Event()
+        self.process = context.Process(
+            target=run_cluster,
+            name=f"miso-cluster-{self.cluster_id}",
+            args=(
+                self.cluster_id,
+                self.shard_ids,
+                self.launcher.shard_count,
+                self.ready_event,
+                self.launcher.log_queue,
+                self.launcher.broker.path,
+                sys.argv,
+            ),
+        )
+        self.process.start()
+        self.started_at = monotonic()
+        logger.info(
+            f"Started cluster {self.name} (pid {self.process.pid}) "
+            f"with shards {self.shard_ids[0]}-{self.shard_ids[-1]}"
+        )
+
+    async def wait_until_ready(self):
+        """Wait until all shards of the cluster have identified, or it's taking too long"""
+        timeout = IDENTIFY_INTERVAL * len(self.shard_ids) + 60
+        ready = await asyncio.get_running_loop().run_in_executor(
+            None, self.ready_event.wait, timeout
+        )
+        if not ready:
+            logger.warning(f"Cluster {self.name} did not become ready in {timeout:.0f}s")
+
+    async def stop(self, timeout=10):
+        if self.process is None or not self.process.is_alive():
+            return
+        loop = asyncio.get_running_loop()
+        self.process.terminate()
+        await loop.run_in_executor(None, self.process.join, timeout)
+        if self.process.is_alive():
+            logger.warning(f"Cluster {self.name} did not stop in time, killing it")
+            self.process.kill()
+            await loop.run_in_executor(None, self.process.join)
+
+    def restart_delay(self):
+        if monotonic() - self.started_at > HEALTHY_UPTIME:
+            self.failures = 0
+        self.failures += 1
+        return min(RESTART_BACKOFF_MAX, 2**self.failures)
+
+
+class Launcher:
+    def __init__(self, token, shard_count=None, cluster_count=None, ipc_path=None):
+        self.token = token
+        self.shard_count = shard_count
+        self.cluster_count = cluster_count or os.cpu_count() or 1
+        self.context = multiprocessing.get_context("spawn")
+        self.log_queue = self.context.Queue()
+        self.clusters = []
+        self.stopping = False
+        self.restart_tasks = set()
+        self.broker = ipc.Broker(ipc_path or "/tmp/miso-ipc.sock")
+        # only one cluster may be identifying shards at a time
+        self.identify_lock = asyncio.Lock()
+
+    async def start(self):
+        if self.shard_count is None:
+            self.shard_count = await recommended_shard_count(self.token)
+
+        ranges = shard_ranges(self.shard_count, self.cluster_count)
+        logger.info(f"Launching {self.shard_count} shards in {len(ranges)} clusters")
+        self.clusters = [
+            Cluster(self, cluster_id, shard_ids) for cluster_id, shard_ids in enumerate(ranges)
+        ]
+        for cluster in self.clusters:
+            if self.stopping:
+                return
+            await self.launch(cluster)
+
+    async def launch(self, cluster):
+        async with self.identify_lock:
+            cluster.start()
+            await cluster.wait_until_ready()
+
+    async def supervise(self):
+        """Restart clusters that exited while the launcher is still running"""
+        while not self.stopping:
+            await asyncio.sleep(5)
+            for cluster in self.clusters:
+                if self.stopping or cluster.process is None or cluster.process.is_alive():
+                    continue
+
+                delay = cluster.restart_delay()
+                logger.error(
+                    f"Cluster {cluster.name} exited with code {cluster.process.exitcode}, "
+                    f"restarting in {delay}s"
+                )
+                cluster.process = None
+                task = asyncio.create_task(self.restart(cluster, delay))
+                self.restart_tasks.add(task)
+                task.add_done_callback(self.restart_tasks.discard)
+
+    async def restart(self, cluster, delay):
+        await asyncio.sleep(delay)
+        if not self.stopping:
+            await self.launch(cluster)
+
+    async def stop(self):
+        self.stopping = True
+        logger.info("Stopping all clusters...")
+        await asyncio.gather(*(cluster.stop() for cluster in self.clusters))
+
+    async def run(self):
+        listener = log.queue_listener(self.log_queue)
+        listener.start()
+        loop = asyncio.get_running_loop()
+        stop_event = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop_event.set)
+
+        if os.path.exists(self.broker.path):
+            # left behind by a previous launcher that didn't exit cleanly
+            os.remove(self.broker.path)
+        await self.broker.start()
+        tasks = [asyncio.create_task(self.start()), asyncio.create_task(self.supervise())]
+        try:
+            await stop_event.wait()
+        finally:
+            await self.stop()
+            for task in tasks:
+                task.cancel()
+            await self.broker.close()
+            listener.stop()
+
+
+def main():
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    token = os.environ["MISO_BOT_TOKEN_BETA" if "dev" in sys.argv else "MISO_BOT_TOKEN"]
+    shard_count = os.environ.get("SHARD_COUNT")
+    cluster_count = os.environ.get("CLUSTER_COUNT")
+    launcher = Launcher(
+        token,
+        shard_count=int(shard_count) if shard_count else None,
+        cluster_count=int(cluster_count) if cluster_count else None,
+        ipc_path=os.environ.get("IPC_SOCKET_PATH"),
+    )
+    asyncio.run(launcher.run())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import json
+import re
 
 LITERALS = {}
 with open("data/emoji_map.json") as f:
@@ -6,3 +7,87 @@ with open("data/emoji_map.json") as f:
 
 NAME_TO_UNICODE = {f":{k}:": v for k, v in LITERALS.items()}
 UNICODE_TO_NAME = {v: k for k, v in NAME_TO_UNICODE.items()}
+
+VARIATION_SELECTOR = "\ufe0f"
+
+
+class EmojiScanner:
+    """
+    Finds unicode emojis in text using a trie of the emoji codepoint sequences.
+
+    A compiled pattern matching every possible first codepoint is used to jump to candidates,
+    so text without emojis is rejected at regex engine speed, and from each candidate the trie is
+    walked to find the longest emoji that starts there.
+    Variation selectors are optional, so emojis match with or without them.
+    """
+
+    def __init__(self, unicode_to_name):
+        self.trie = {}
+        for emoji, name in unicode_to_name.items():
+            node = self.trie
+            for char in emoji.replace(VARIATION_SELECTOR, ""):
+                node = node.setdefault(char, {})
+            node[None] = name
+
+        # characters that are not emojis by themselves (keycap digits) only start a candidate
+        # when followed by something that can continue them, so plain numbers are skipped quickly
+        complete = [char for char, node in self.trie.items() if None in node]
+        partial = {char: node for char, node in self.trie.items() if None not in node}
+        pattern = f"[{character_ranges(complete)}]"
+        if partial:
+            continuations = {char for node in partial.values() for char in node}
+            pattern += (
+                f"|[{character_ranges(partial)}]"
+                f"(?={re.escape(VARIATION_SELECTOR)}?[{character_ranges(continuations)}])"
+            )
+        self.start = re.compile(pattern)
+
+    def scan(self, text):
+        """Yield the names of all emojis in text, in order of appearance"""
+        search = self.start.search
+        match = search(text)
+        while match is not None:
+            node = self.trie
+            name = None
+            end = position = match.start()
+            while position < len(text):
+                char = text[position]
+                if char == VARIATION_SELECTOR and char not in node:
+                    position += 1
+                    continue
+                node = node.get(char)
+                if node is None:
+                    break
+                position += 1
+                if None in node:
+                    name = node[None]
+                    end = position
+
+            if name is not None:
+                yield name
+                match = search(text, end)
+            else:
+                match = search(text, match.start() + 1)
+
+
+def character_ranges(chars):
+    """Collapse characters into a regex character class body of ranges.
+
+    A class of a thousand loose astral plane characters is checked one by one by the regex engine,
+    while ranges are checked with a couple of comparisons each.
+    """
+    codepoints = sorted(set(map(ord, chars)))
+    ranges = []
+    for codepoint in codepoints:
+        if ranges and ranges[-1][1] == codepoint - 1:
+            ranges[-1][1] = codepoint
+        else:
+            ranges.append([codepoint, codepoint])
+
+    return "".join(
+        re.escape(chr(start)) if start == end else f"{re.escape(chr(start))}-{re.escape(chr(end))}"
+        for start, end in ranges
+    )
+
+
+SCANNER = EmojiScanner(UNICODE_TO_NAME)
@@ -1,6 +1,6 @@
-import matplotlib.pyplot as plt
 import matplotlib.ticker as plticker
 import numpy as np
+from matplotlib.figure import Figure
 from scipy.interpolate import make_interp_spline
 
 
@@ -9,29 +9,26 @@ def create_graph(
     usercolor,
     title=None,
     dimensions=(6, 3),
-    draw=False,
     background_color="#2f3136",
+    output="downloads/graph.png",
 ):
-    plt.rcParams["figure.figsize"] = [dimensions[0], dimensions[1]]
+    """Draw a smoothed graph of hourly values into `output` (a path or a file-like object).
+
+    Uses a standalone Figure instead of pyplot state so it can be called from a worker thread.
+    """
     T = np.array(list(range(0, len(data))))
     xnew = np.linspace(T.min(), T.max(), 240)
     spl = make_interp_spline(T, data, k=3)
-    power_smooth = spl(xnew)
-
-    # remove under 0
-    power = []
-    for x in power_smooth:
-        power.append(min(x, 0))
-
-    power_smooth = np.array(power)
+    # the spline can overshoot below zero between hours, clip it
+    power_smooth = np.clip(spl(xnew), 0, None)
 
-    fig = plt.figure()
+    fig = Figure(figsize=dimensions)
     fig.patch.set_facecolor(background_color)
     if title is not None:
         fig.suptitle(title, color="white")
-    plt.autoscale(tight=True)
-    plt.plot(xnew, power_smooth, color=usercolor)
-    ax = plt.gca()
+    ax = fig.add_subplot()
+    ax.autoscale(tight=True)
+    ax.plot(xnew, power_smooth, color=usercolor)
     loc = plticker.MultipleLocator(base=1.0)
     ax.xaxis.set_major_locator(loc)
     ax.set_facecolor(background_color)
@@ -46,22 +43,23 @@ def create_graph(
     ax.spines["top"].set_visible(False)
     ax.tick_params(axis="x", colors="white")
     ax.tick_params(axis="y", colors="white")
-    plt.fill_between(xnew, power_smooth, color=usercolor, alpha=0.2)
-    if draw:
-        plt.show()
-    plt.savefig("downloads/graph.png", facecolor=background_color, bbox_inches="tight")
-    plt.close()
+    ax.fill_between(xnew, power_smooth, color=usercolor, alpha=0.2)
+    fig.savefig(output, format="png", facecolor=background_color, bbox_inches="tight")
 
 
-def time_series_graph(frame, data, color, background_color="#2f3136"):
+def time_series_graph(
+    frame, data, color, background_color="#2f3136", title=None, output="downloads/graph.png"
+):
     x = np.array(frame)
     y = np.array(data)
-    fig = plt.figure()
+    fig = Figure()
     fig.patch.set_facecolor(background_color)
-    plt.autoscale(tight=True)
-    plt.plot(x, y, color=color)
+    if title is not None:
+        fig.suptitle(title, color="white")
+    ax = fig.add_subplot()
+    ax.autoscale(tight=True)
+    ax.plot(x, y, color=color)
 
-    ax = plt.gca()
     ax.set_facecolor(background_color)
 
     ax.spines["bottom"].set_color("white")
@@ -75,7 +73,6 @@ def time_series_graph(frame, data, color, background_color="#2f3136"):
     ax.ticklabel_format(useOffset=False, style="plain", axis="y")
     ax.get_yaxis().get_major_formatter().set_useOffset(False)
     ax.get_yaxis().get_major_formatter().set_scientific(False)
-    plt.xticks(rotation=45)
+    ax.tick_params(axis="x", labelrotation=45)
 
-    plt.savefig("downloads/graph.png", facecolor=background_color, bbox_inches="tight")
-    plt.close()
+    fig.savefig(output, format="png", facecolor=background_color, bbox_inches="tight")
@@ -60,7 +60,21 @@ if maintenance_mode:
     ]
 
 
+def patch_gateway(record=True):
+    """Connect through the gateway proxy if one is configured"""
+    gateway_url = os.environ.get("GATEWAY_PROXY_URL")
+    if gateway_url:
+        from modules import gateway_proxy
+
+        logger.info(f"Connecting to the gateway through proxy {gateway_url}")
+        gateway_proxy.patch_with_gateway(
+            gateway_url,
+            record_path=os.environ.get("GATEWAY_RECORD_PATH") if record else None,
+        )
+
+
 def main():
+    patch_gateway()
     bot = MisoBot(
         extensions=extensions,
         default_prefix=prefix,
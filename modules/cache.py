@@ -1,9 +1,92 @@
+import asyncio
+import hashlib
+import os
+import zlib
+from time import perf_counter
+
+import arrow
+import orjson
+
 from modules import log
 
 logger = log.get_logger(__name__)
 
+SNAPSHOT_PATH = os.environ.get("SETTINGS_SNAPSHOT_PATH", "cache/settings.snapshot")
+# bump this whenever the shape of the cached data changes, old snapshots are then ignored
+SNAPSHOT_VERSION = 3
+
+
+class SnapshotError(Exception):
+    pass
+
+
+class StarboardSettings:
+    __slots__ = (
+        "is_enabled",
+        "channel_id",
+        "reaction_count",
+        "emoji_name",
+        "emoji_id",
+        "emoji_type",
+        "log_channel_id",
+    )
+
+    def __init__(
+        self,
+        is_enabled,
+        channel_id,
+        reaction_count,
+        emoji_name,
+        emoji_id,
+        emoji_type,
+        log_channel_id,
+    ):
+        self.is_enabled = is_enabled
+        self.channel_id = channel_id
+        self.reaction_count = reaction_count
+        self.emoji_name = emoji_name
+        self.emoji_id = emoji_id
+        self.emoji_type = emoji_type
+        self.log_channel_id = log_channel_id
+
+
+class LoggingSettings:
+    __slots__ = ("member_log_channel_id", "ban_log_channel_id", "message_log_channel_id")
+
+    def __init__(self, member_log_channel_id, ban_log_channel_id, message_log_channel_id):
+        self.member_log_channel_id = member_log_channel_id
+        self.ban_log_channel_id = ban_log_channel_id
+        self.message_log_channel_id = message_log_channel_id
+
+
+class GuildBlacklist:
+    __slots__ = ("member", "command")
+
+    def __init__(self, member=None, command=None):
+        self.member = member or set()
+        self.command = command or set()
+
+
+RECORD_TYPES = {
+    "starboard_settings": StarboardSettings,
+    "logging_settings": LoggingSettings,
+}
+
+# invalidations of these kinds only reload the one guild instead of the whole table
+GUILD_QUERIES = {
+    "prefixes": "SELECT prefix FROM guild_prefix WHERE guild_id = %s",
+    "autoresponse": "SELECT autoresponses FROM guild_settings WHERE guild_id = %s",
+}
+
 
 class Cache:
+    """
+    In memory copy of the settings that are needed on hot paths.
+
+    Per guild maps are keyed by the integer guild id, and their values are __slots__ records.
+    `marriages` maps each married user's id to their partner's id, in both directions.
+    """
+
     def __init__(self, bot):
         self.bot = bot
         self.log_emoji = False
@@ -13,32 +96,79 @@ class Cache:
         self.autoresponse = {}
         self.blacklist = {}
         self.logging_settings = {}
+        self.message_log_ignored = {}
         self.autoroles = {}
-        self.marriages = set()
+        self.marriages = {}
         self.starboard_settings = {}
         self.starboard_blacklisted_channels = set()
+        self.reconcile_task = None
 
-    async def cache_starboard_settings(self):
-        data = await self.bot.db.execute(
+    async def load_prefixes(self):
+        prefixes = {}
+        async with self.bot.db.stream("SELECT guild_id, prefix FROM guild_prefix") as data:
+            async for guild_id, prefix in data:
+                prefixes[guild_id] = prefix
+        return {"prefixes": prefixes}
+
+    async def load_channel_sets(self):
+        rolepickers, votechannels = await asyncio.gather(
+            self.bot.db.execute("SELECT channel_id FROM rolepicker_settings", as_list=True),
+            self.bot.db.execute("SELECT channel_id FROM voting_channel", as_list=True),
+        )
+        return {"rolepickers": set(rolepickers), "votechannels": set(votechannels)}
+
+    async def load_autoresponses(self):
+        autoresponse = {}
+        async with self.bot.db.stream(
+            "SELECT guild_id, autoresponses FROM guild_settings"
+        ) as guild_settings:
+            async for guild_id, autoresponses in guild_settings:
+                autoresponse[guild_id] = autoresponses
+        return {"autoresponse": autoresponse}
+
+    async def load_blacklist(self):
+        users, guilds, channels, members, commands = await asyncio.gather(
+            self.bot.db.execute("SELECT user_id FROM blacklisted_user", as_list=True),
+            self.bot.db.execute("SELECT guild_id FROM blacklisted_guild", as_list=True),
+            self.bot.db.execute("SELECT channel_id FROM blacklisted_channel", as_list=True),
+            self.bot.db.execute("SELECT guild_id, user_id FROM blacklisted_member"),
+            self.bot.db.execute("SELECT guild_id, command_name FROM blacklisted_command"),
+        )
+        blacklist = {
+            "global": {
+                "user": set(users),
+                "guild": set(guilds),
+                "channel": set(channels),
+            }
+        }
+        for guild_id, user_id in members:
+            blacklist.setdefault(guild_id, GuildBlacklist()).member.add(user_id)
+
+        for guild_id, command_name in commands:
+            blacklist.setdefault(guild_id, GuildBlacklist()).command.add(command_name.lower())
+
+        return {"blacklist": blacklist}
+
+    async def load_marriages(self):
+        marriages = {}
+        for first_user_id, second_user_id in await self.bot.db.execute(
+            "SELECT first_user_id, second_user_id FROM marriage"
+        ):
+            marriages[first_user_id] = second_user_id
+            marriages[second_user_id] = first_user_id
+        return {"marriages": marriages}
+
+    async def load_starboard_settings(self):
+        starboard_settings = {}
+        async with self.bot.db.stream(
             """
             SELECT guild_id, is_enabled, channel_id, reaction_count,
                 emoji_name, emoji_id, emoji_type, log_channel_id
             FROM starboard_settings
             """
-        )
-        if not data:
-            return
-        for (
-            guild_id,
-            is_enabled,
-            channel_id,
-            reaction_count,
-            emoji_name,
-            emoji_id,
-            emoji_type,
-            log_channel_id,
-        ) in data:
-            self.starboard_settings[str(guild_id)] = [
+        ) as data:
+            async for (
+                guild_id,
                 is_enabled,
                 channel_id,
                 reaction_count,
@@ -46,107 +176,291 @@ class Cache:
                 emoji_id,
                 emoji_type,
                 log_channel_id,
-            ]
+            ) in data:
+                starboard_settings[guild_id] = StarboardSettings(
+                    is_enabled,
+                    channel_id,
+                    reaction_count,
+                    emoji_name,
+                    emoji_id,
+                    emoji_type,
+                    log_channel_id,
+                )
 
-        self.starboard_blacklisted_channels = set(
-            await self.bot.db.execute(
-                "SELECT channel_id FROM starboard_blacklist",
-                as_list=True,
-            )
+        blacklisted_channels = await self.bot.db.execute(
+            "SELECT channel_id FROM starboard_blacklist",
+            as_list=True,
         )
+        return {
+            "starboard_settings": starboard_settings,
+            "starboard_blacklisted_channels": set(blacklisted_channels),
+        }
 
-    async def cache_logging_settings(self):
-        logging_settings = await self.bot.db.execute(
+    async def load_logging_settings(self):
+        settings = {}
+        async with self.bot.db.stream(
             """
             SELECT guild_id, member_log_channel_id, ban_log_channel_id, message_log_channel_id
             FROM logging_settings
             """
-        )
-        for (
-            guild_id,
-            member_log_channel_id,
-            ban_log_channel_id,
-            message_log_channel_id,
-        ) in logging_settings:
-            self.logging_settings[str(guild_id)] = {
-                "member_log_channel_id": member_log_channel_id,
-                "ban_log_channel_id": ban_log_channel_id,
-                "message_log_channel_id": message_log_channel_id,
-            }
+        ) as logging_settings:
+            async for (
+                guild_id,
+                member_log_channel_id,
+                ban_log_channel_id,
+                message_log_channel_id,
+            ) in logging_settings:
+                settings[guild_id] = LoggingSettings(
+                    member_log_channel_id,
+                    ban_log_channel_id,
+                    message_log_channel_id,
+                )
 
-    async def cache_autoroles(self):
-        for guild_id, role_id in await self.bot.db.execute(
-            "SELECT guild_id, role_id FROM autorole"
+        ignored = {}
+        for guild_id, channel_id in await self.bot.db.execute(
+            "SELECT guild_id, channel_id FROM message_log_ignore"
         ):
-            try:
-                self.autoroles[str(guild_id)].add(role_id)
-            except KeyError:
-                self.autoroles[str(guild_id)] = set([role_id])
+            ignored.setdefault(guild_id, set()).add(channel_id)
+        return {"logging_settings": settings, "message_log_ignored": ignored}
 
-    async def initialize_settings_cache(self):
-        logger.info("Caching settings...")
-        prefixes = await self.bot.db.execute("SELECT guild_id, prefix FROM guild_prefix")
-        for guild_id, prefix in prefixes:
-            self.prefixes[str(guild_id)] = prefix
+    async def load_autoroles(self):
+        autoroles = {}
+        async with self.bot.db.stream("SELECT guild_id, role_id FROM autorole") as data:
+            async for guild_id, role_id in data:
+                autoroles.setdefault(guild_id, set()).add(role_id)
+        return {"autoroles": autoroles}
 
-        self.rolepickers = set(
-            await self.bot.db.execute("SELECT channel_id FROM rolepicker_settings", as_list=True)
-        )
+    async def cache_starboard_settings(self):
+        self.apply(await self.load_starboard_settings())
 
-        self.votechannels = set(
-            await self.bot.db.execute("SELECT channel_id FROM voting_channel", as_list=True)
-        )
+    async def cache_logging_settings(self):
+        self.apply(await self.load_logging_settings())
 
-        guild_settings = await self.bot.db.execute(
-            "SELECT guild_id, autoresponses FROM guild_settings"
+    async def cache_autoroles(self):
+        self.apply(await self.load_autoroles())
+
+    async def load_from_database(self):
+        """Run all the settings queries concurrently and return the combined results"""
+        start = perf_counter()
+        results = await asyncio.gather(
+            self.load_prefixes(),
+            self.load_channel_sets(),
+            self.load_autoresponses(),
+            self.load_blacklist(),
+            self.load_marriages(),
+            self.load_starboard_settings(),
+            self.load_logging_settings(),
+            self.load_autoroles(),
         )
-        for guild_id, autoresponses in guild_settings:
-            self.autoresponse[str(guild_id)] = autoresponses
+        data = {}
+        for result in results:
+            data.update(result)
+        logger.info(f"Loaded settings from the database in {perf_counter() - start:.2f}s")
+        return data
 
-        self.blacklist = {
-            "global": {
-                "user": set(
-                    await self.bot.db.execute("SELECT user_id FROM blacklisted_user", as_list=True)
-                ),
-                "guild": set(
-                    await self.bot.db.execute(
-                        "SELECT guild_id FROM blacklisted_guild", as_list=True
-                    )
-                ),
-                "channel": set(
-                    await self.bot.db.execute(
-                        "SELECT channel_id FROM blacklisted_channel", as_list=True
-                    )
-                ),
-            }
+    def loaders(self):
+        """The loader of every kind of invalidation event"""
+        return {
+            "prefixes": self.load_prefixes,
+            "channels": self.load_channel_sets,
+            "autoresponse": self.load_autoresponses,
+            "blacklist": self.load_blacklist,
+            "marriages": self.load_marriages,
+            "starboard": self.load_starboard_settings,
+            "logging": self.load_logging_settings,
+            "autoroles": self.load_autoroles,
         }
 
-        self.marriages = [
-            set(pair)
-            for pair in await self.bot.db.execute(
-                "SELECT first_user_id, second_user_id FROM marriage"
-            )
+    async def invalidate(self, kind, guild_id=None):
+        """Reload the part of the cache that was changed by another process"""
+        if guild_id is not None and kind in GUILD_QUERIES:
+            value = await self.bot.db.execute(GUILD_QUERIES[kind], guild_id, one_value=True)
+            cached = getattr(self, kind)
+            if value is None:
+                cached.pop(guild_id, None)
+            else:
+                cached[guild_id] = value
+        else:
+            self.apply(await self.loaders()[kind]())
+
+    def guild_blacklist(self, guild_id) -> GuildBlacklist:
+        """Get the blacklist of a guild, creating an empty one if it doesn't exist yet"""
+        return self.blacklist.setdefault(guild_id, GuildBlacklist())
+
+    def partner(self, user_id):
+        """Get the user id of the given user's spouse, or None if they are not married"""
+        return self.marriages.get(user_id)
+
+    def add_marriage(self, first_user_id, second_user_id):
+        self.marriages[first_user_id] = second_user_id
+        self.marriages[second_user_id] = first_user_id
+
+    def remove_marriage(self, user_id):
+        partner_id = self.marriages.pop(user_id, None)
+        if partner_id is not None:
+            self.marriages.pop(partner_id, None)
+        return partner_id
+
+    def apply(self, data):
+        for name, value in data.items():
+            setattr(self, name, value)
+
+    async def initialize_settings_cache(self):
+        """Fill the settings cache.
+
+        If a valid snapshot from a previous run exists it's used right away and the cache is
+        reconciled with the database in the background, otherwise the database is waited for.
+        """
+        logger.info("Caching settings...")
+        try:
+            data = read_snapshot(SNAPSHOT_PATH)
+        except FileNotFoundError:
+            logger.info("No settings snapshot found")
+        except SnapshotError as e:
+            logger.warning(f"Ignoring settings snapshot: {e}")
+        else:
+            self.apply(data)
+            self.reconcile_task = asyncio.create_task(self.reconcile())
+            return
+
+        self.apply(await self.load_from_database())
+        await self.save_snapshot()
+
+    async def reconcile(self):
+        """Replace the snapshot data with fresh data from the database"""
+        try:
+            data = await self.load_from_database()
+        except Exception as e:
+            logger.error(f"Failed to reconcile settings cache: {e}")
+            return
+
+        changed = [
+            name
+            for name, value in data.items()
+            if comparable(getattr(self, name)) != comparable(value)
         ]
+        self.apply(data)
+        if changed:
+            logger.info(f"Settings cache reconciled, changed: {', '.join(changed)}")
+        else:
+            logger.info("Settings cache reconciled, snapshot was up to date")
+        await self.save_snapshot()
 
-        for guild_id, user_id in await self.bot.db.execute(
-            "SELECT guild_id, user_id FROM blacklisted_member"
-        ):
-            try:
-                self.blacklist[str(guild_id)]["member"].add(user_id)
-            except KeyError:
-                self.blacklist[str(guild_id)] = {"member": {user_id}, "command": set()}
+    def snapshot_data(self):
+        return {
+            "prefixes": self.prefixes,
+            "rolepickers": self.rolepickers,
+            "votechannels": self.votechannels,
+            "autoresponse": self.autoresponse,
+            "blacklist": self.blacklist,
+            "marriages": self.marriages,
+            "starboard_settings": self.starboard_settings,
+            "starboard_blacklisted_channels": self.starboard_blacklisted_channels,
+            "logging_settings": self.logging_settings,
+            "message_log_ignored": self.message_log_ignored,
+            "autoroles": self.autoroles,
+        }
 
-        for guild_id, command_name in await self.bot.db.execute(
-            "SELECT guild_id, command_name FROM blacklisted_command"
-        ):
-            try:
-                self.blacklist[str(guild_id)]["command"].add(command_name.lower())
-            except KeyError:
-                self.blacklist[str(guild_id)] = {
-                    "member": set(),
-                    "command": {command_name.lower()},
-                }
-
-        await self.cache_starboard_settings()
-        await self.cache_logging_settings()
-        await self.cache_autoroles()
+    async def save_snapshot(self):
+        try:
+            payload = encode_snapshot(self.snapshot_data())
+            await self.bot.loop.run_in_executor(None, write_snapshot, SNAPSHOT_PATH, payload)
+        except Exception as e:
+            logger.error(f"Failed to save settings snapshot: {e}")
+
+
+def encode_default(obj):
+    """Store sets as lists and records as lists of their slot values"""
+    if isinstance(obj, set):
+        return list(obj)
+    if hasattr(obj, "__slots__"):
+        return [getattr(obj, name) for name in obj.__slots__]
+    raise TypeError
+
+
+def comparable(value):
+    """Turn records into tuples so cached data can be compared with =="""
+    if isinstance(value, dict):
+        return {key: comparable(item) for key, item in value.items()}
+    if hasattr(value, "__slots__"):
+        return tuple(getattr(value, name) for name in value.__slots__)
+    return value
+
+
+def encode_value(value):
+    return orjson.dumps(value, default=encode_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+def encode_snapshot(data):
+    """Serialize the cache data into a compressed snapshot with a version and checksum header.
+
+    Sets and records are stored as lists, and turned back into them by `decode_snapshot`.
+    """
+    body = zlib.compress(encode_value(data))
+    header = {
+        "version": SNAPSHOT_VERSION,
+        "created": arrow.utcnow().int_timestamp,
+        "checksum": hashlib.sha256(body).hexdigest(),
+    }
+    return orjson.dumps(header) + b"\n" + body
+
+
+def decode_snapshot(payload):
+    header, _, body = payload.partition(b"\n")
+    try:
+        header = orjson.loads(header)
+    except orjson.JSONDecodeError as e:
+        raise SnapshotError("invalid header") from e
+    if header.get("version") != SNAPSHOT_VERSION:
+        raise SnapshotError(f"version {header.get('version')} != {SNAPSHOT_VERSION}")
+    if hashlib.sha256(body).hexdigest() != header.get("checksum"):
+        raise SnapshotError("checksum mismatch")
+
+    try:
+        data = orjson.loads(zlib.decompress(body))
+        for name in ["rolepickers", "votechannels", "starboard_blacklisted_channels"]:
+            data[name] = set(data[name])
+        # json object keys are always strings
+        for name in ["prefixes", "autoresponse", "marriages"]:
+            data[name] = {int(key): value for key, value in data[name].items()}
+        for name, record in RECORD_TYPES.items():
+            data[name] = {int(key): record(*values) for key, values in data[name].items()}
+        for name in ["autoroles", "message_log_ignored"]:
+            data[name] = {int(key): set(ids) for key, ids in data[name].items()}
+        global_blacklist = data["blacklist"].pop("global")
+        data["blacklist"] = {
+            int(key): GuildBlacklist(set(member), set(command))
+            for key, (member, command) in data["blacklist"].items()
+        }
+        data["blacklist"]["global"] = {kind: set(ids) for kind, ids in global_blacklist.items()}
+    except (
+        zlib.error,
+        orjson.JSONDecodeError,
+        KeyError,
+        TypeError,
+        ValueError,
+        AttributeError,
+    ) as e:
+        raise SnapshotError(f"corrupted data: {e}") from e
+
+    return data, header["created"]
+
+
+def read_snapshot(path):
+    start = perf_counter()
+    with open(path, "rb") as f:
+        data, created = decode_snapshot(f.read())
+    logger.info(
+        f"Loaded settings snapshot from {arrow.get(created).humanize()} "
+        f"in {perf_counter() - start:.3f}s"
+    )
+    return data
+
+
+def write_snapshot(path, payload):
+    """Write the snapshot atomically so a crash can't leave a partial file behind"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(payload)
+    os.replace(tmp_path, path)
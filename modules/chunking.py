@@ -0,0 +1,132 @@
+"""
+Requesting the member lists of guilds (chunking) without making commands wait for it.
+
+Guilds are chunked one at a time from a priority queue by a background worker: guilds where
+commands were recently used first, then the rest from the smallest to the largest. Only guilds
+that the member cache policy wants members for are queued. Commands that need the full member
+list, marked with `util.requires_members()`, wait for their guild to be chunked.
+"""
+import asyncio
+import heapq
+import itertools
+from time import perf_counter
+
+from prometheus_client import Gauge, Histogram
+
+from modules import log
+
+logger = log.get_logger(__name__)
+
+# seconds to wait between background chunk requests, they count towards the gateway rate limit
+CHUNK_INTERVAL = 1.0
+ACTIVE = 0
+BACKGROUND = 1
+
+chunk_duration_histogram = Histogram(
+    "miso_guild_chunk_duration_seconds",
+    "Time taken to chunk a guild in seconds, by what caused the chunk.",
+    ["reason"],
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0),
+)
+queue_length_gauge = Gauge(
+    "miso_chunk_queue_length",
+    "Guilds waiting to be chunked in the background.",
+)
+
+
+class ChunkingService:
+    def __init__(self, bot):
+        self.bot = bot
+        # heap of (priority, order, guild_id), entries whose priority changed are skipped
+        self.queue = []
+        self.priorities = {}
+        self.order = itertools.count()
+        self.tasks = {}
+        self.wakeup = asyncio.Event()
+        self.worker_task = None
+        bot.add_listener(self.on_ready)
+        bot.add_listener(self.on_guild_join)
+
+    def start(self):
+        self.worker_task = asyncio.create_task(self.worker())
+
+    def stop(self):
+        if self.worker_task is not None:
+            self.worker_task.cancel()
+
+    async def on_ready(self):
+        for guild in self.bot.guilds:
+            self.enqueue_background(guild)
+
+    async def on_guild_join(self, guild):
+        self.enqueue_background(guild)
+
+    def enqueue_background(self, guild):
+        if self.bot.member_cache.wants_members(guild.id):
+            self.enqueue(guild, (BACKGROUND, guild.member_count or 0))
+
+    def enqueue(self, guild, priority):
+        if guild.chunked or guild.id in self.tasks:
+            return
+        current = self.priorities.get(guild.id)
+        if current is not None and current <= priority:
+            return
+
+        self.priorities[guild.id] = priority
+        heapq.heappush(self.queue, (priority, next(self.order), guild.id))
+        queue_length_gauge.set(len(self.priorities))
+        self.wakeup.set()
+
+    def mark_active(self, guild):
+        """Move a guild where a command was just used ahead of the background chunking"""
+        if guild is not None and self.bot.member_cache.wants_members(guild.id):
+            self.enqueue(guild, (ACTIVE, 0))
+
+    async def require(self, guild):
+        """Wait until the guild is chunked, chunking it right away if it's not yet"""
+        if guild is None:
+            return
+        self.bot.member_cache.mark_used(guild.id)
+        if not guild.chunked:
+            await self.chunk(guild, "command")
+
+    async def chunk(self, guild, reason):
+        task = self.tasks.get(guild.id)
+        if task is None:
+            task = self.tasks[guild.id] = asyncio.create_task(self.run_chunk(guild, reason))
+            task.add_done_callback(lambda _: self.tasks.pop(guild.id, None))
+        # a cancelled command must not cancel the chunk other commands might be waiting for
+        await asyncio.shield(task)
+
+    async def run_chunk(self, guild, reason):
+        start = perf_counter()
+        await guild.chunk(cache=True)
+        duration = perf_counter() - start
+        chunk_duration_histogram.labels(reason).observe(duration)
+        logger.info(
+            f"Chunked [{guild}] with {guild.member_count} members in {duration:.2f} seconds "
+            f"({reason})"
+        )
+
+    async def worker(self):
+        await self.bot.wait_until_ready()
+        while True:
+            if not self.queue:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+
+            priority, _, guild_id = heapq.heappop(self.queue)
+            if self.priorities.get(guild_id) != priority:
+                continue
+            del self.priorities[guild_id]
+            queue_length_gauge.set(len(self.priorities))
+
+            guild = self.bot.get_guild(guild_id)
+            if guild is None or guild.chunked:
+                continue
+            try:
+                await self.chunk(guild, "active" if priority[0] == ACTIVE else "background")
+            except Exception as e:
+                logger.error(f"Failed to chunk [{guild}]: {e}")
+            await asyncio.sleep(CHUNK_INTERVAL)
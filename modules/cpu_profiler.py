@@ -0,0 +1,140 @@
+"""
+Sampling CPU profiler for finding out where time goes in a running bot.
+
+A background thread looks at the stack of the event loop thread (or every thread) a hundred times
+a second and counts how often each stack was seen, so the profiled code runs at full speed over
+live traffic and nothing has to be restarted. Time spent waiting for events shows up under the
+selector of the event loop.
+
+Stacks are kept in the collapsed format used by flame graph tools, one `root;...;leaf` string
+per distinct stack, and can be rendered to a flame graph svg with `flamegraph_svg`.
+"""
+import asyncio
+import sys
+import threading
+import zlib
+from collections import Counter
+from html import escape
+from time import monotonic, sleep
+
+from modules.memory_profiler import short_path
+
+INTERVAL = 0.01
+MAX_SECONDS = 300
+
+SVG_WIDTH = 1200
+SVG_ROW_HEIGHT = 16
+SVG_FONT_WIDTH = 7
+
+
+class CPUProfiler:
+    def __init__(self):
+        self.lock = asyncio.Lock()
+
+    async def profile(self, seconds, interval=INTERVAL, all_threads=False):
+        """Sample stacks for `seconds`, by default only those of the event loop thread"""
+        if not 0 < seconds <= MAX_SECONDS:
+            return {"error": f"Can only profile for up to {MAX_SECONDS} seconds"}
+        if self.lock.locked():
+            return {"error": "A profile is already being recorded"}
+
+        async with self.lock:
+            thread_ids = None if all_threads else {threading.get_ident()}
+            samples, stacks = await asyncio.to_thread(sample, seconds, interval, thread_ids)
+        return {"seconds": seconds, "samples": samples, "stacks": dict(stacks)}
+
+
+def sample(seconds, interval, thread_ids=None):
+    """Count the collapsed stacks of the given threads, or all other threads if None"""
+    own_id = threading.get_ident()
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    labels = {}
+    stacks = Counter()
+    samples = 0
+    end = monotonic() + seconds
+    while monotonic() < end:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id or (thread_ids is not None and thread_id not in thread_ids):
+                continue
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                label = labels.get(code)
+                if label is None:
+                    label = labels[code] = f"{short_path(code.co_filename)}:{code.co_name}"
+                frames.append(label)
+                frame = frame.f_back
+            frames.append(names.get(thread_id, str(thread_id)))
+            stacks[";".join(reversed(frames))] += 1
+        samples += 1
+        sleep(interval)
+    return samples, stacks
+
+
+def merge_stacks(results):
+    """Combine the stacks of multiple clusters, under a root frame per cluster if many"""
+    if len(results) == 1:
+        return Counter(next(iter(results.values()))["stacks"])
+
+    stacks = Counter()
+    for cluster, result in results.items():
+        for stack, count in result["stacks"].items():
+            stacks[f"cluster {cluster};{stack}"] += count
+    return stacks
+
+
+def collapsed(stacks):
+    return "\n".join(f"{stack} {count}" for stack, count in sorted(stacks.items()))
+
+
+def frame_color(name):
+    """Warm colour that stays the same for the same frame"""
+    value = zlib.crc32(name.encode())
+    return f"rgb({205 + value % 50},{(value >> 8) % 230},{(value >> 16) % 55})"
+
+
+def flamegraph_svg(stacks, title="Flame graph"):
+    """Render collapsed stacks as a flame graph, hover over a frame to see its full name"""
+    root = {"count": 0, "children": {}}
+    depth = 0
+    for stack, count in stacks.items():
+        node = root
+        node["count"] += count
+        frames = stack.split(";")
+        depth = max(depth, len(frames))
+        for frame in frames:
+            node = node["children"].setdefault(frame, {"count": 0, "children": {}})
+            node["count"] += count
+
+    total = root["count"] or 1
+    height = (depth + 1) * SVG_ROW_HEIGHT + 2 * SVG_ROW_HEIGHT
+    elements = []
+    pending = [("all", root, 0.0, 0)]
+    while pending:
+        name, node, x, level = pending.pop()
+        width = node["count"] / total * SVG_WIDTH
+        if width < 0.5:
+            continue
+
+        y = height - (level + 1) * SVG_ROW_HEIGHT
+        text = name if len(name) * SVG_FONT_WIDTH < width - 6 else ""
+        if not text and width > 6 * SVG_FONT_WIDTH:
+            text = name[: int(width / SVG_FONT_WIDTH) - 3] + ".."
+        elements.append(
+            f'<g><title>{escape(name)} ({node["count"]} samples, '
+            f'{node["count"] / total:.1%})</title>'
+            f'<rect x="{x:.1f}" y="{y}" width="{width:.1f}" height="{SVG_ROW_HEIGHT - 1}" '
+            f'fill="{frame_color(name)}" rx="2"/>'
+            f'<text x="{x + 3:.1f}" y="{y + SVG_ROW_HEIGHT - 4}">{escape(text)}</text></g>'
+        )
+        for child_name, child in sorted(node["children"].items()):
+            pending.append((child_name, child, x, level + 1))
+            x += child["count"] / total * SVG_WIDTH
+
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{SVG_WIDTH}" height="{height}" '
+        f'font-family="monospace" font-size="11">'
+        f'<rect width="100%" height="100%" fill="#eeeeee"/>'
+        f'<text x="{SVG_WIDTH / 2}" y="{SVG_ROW_HEIGHT}" text-anchor="middle" '
+        f'font-size="14">{escape(title)}</text>' + "".join(elements) + "</svg>"
+    )
@@ -1,7 +1,53 @@
+"""
+Running the bot behind a gateway proxy, that keeps the gateway connections open between restarts.
+
+patch_with_gateway() points discord.py at the proxy instead of discord, and replaces the
+parsing of incoming gateway frames with a GatewayDecoder that uses orjson and records per shard
+metrics. Connections always ask for zlib-stream compression, so the proxy has to support it too.
+
+The patches target the internals of discord.py 2.4 and newer, the version in requirements.txt.
+"""
+import struct
+import zlib
+from time import perf_counter
+
 import discord
+import orjson
+import yarl
+from prometheus_client import Counter
 
+from modules import log
 from modules.misobot import MisoBot
 
+logger = log.get_logger(__name__)
+
+ZLIB_SUFFIX = b"\x00\x00\xff\xff"
+# first version with compression contexts and the current get_bot_gateway signature
+MIN_DISCORD_VERSION = (2, 4)
+# frames to record when recording is enabled
+RECORD_LIMIT = 10_000
+
+received_bytes_counter = Counter(
+    "miso_gateway_received_bytes_total",
+    "Bytes received from the gateway per shard, before decompression.",
+    ["shard"],
+)
+payload_bytes_counter = Counter(
+    "miso_gateway_payload_bytes_total",
+    "Bytes of gateway payloads per shard, after decompression.",
+    ["shard"],
+)
+decompress_seconds_counter = Counter(
+    "miso_gateway_decompress_seconds_total",
+    "Time spent decompressing gateway frames per shard in seconds.",
+    ["shard"],
+)
+decode_seconds_counter = Counter(
+    "miso_gateway_decode_seconds_total",
+    "Time spent parsing gateway payloads per shard in seconds.",
+    ["shard"],
+)
+
 
 class ProxiedBot(MisoBot):
     # def __init__(self, **kwargs):
@@ -24,17 +70,153 @@ class ProxiedBot(MisoBot):
         return False
 
 
-def patch_with_gateway(gateway_url):
-    class ProxyHTTPClient(discord.http.HTTPClient):
-        async def get_gateway(self, **_):
-            return f"{gateway_url}?encoding=json&v=9"
+class GatewayDecoder:
+    """Decompresses and parses the frames of a single gateway connection.
+
+    Compressed connections share one zlib context for their whole lifetime, so every new
+    connection needs a new decoder.
+    """
+
+    def __init__(self, shard_id, recorder=None):
+        shard = str(shard_id)
+        self.inflator = zlib.decompressobj()
+        self.buffer = bytearray()
+        self.recorder = recorder
+        # resolving the labels once instead of on every frame
+        self.received_bytes = received_bytes_counter.labels(shard)
+        self.payload_bytes = payload_bytes_counter.labels(shard)
+        self.decompress_seconds = decompress_seconds_counter.labels(shard)
+        self.decode_seconds = decode_seconds_counter.labels(shard)
+
+    def feed(self, frame):
+        """Return the parsed payload, or None if the frame was only a part of one"""
+        if self.recorder is not None:
+            self.recorder.write(frame)
+
+        self.received_bytes.inc(len(frame))
+        if type(frame) is bytes:
+            self.buffer.extend(frame)
+            if len(frame) < 4 or frame[-4:] != ZLIB_SUFFIX:
+                return None
+
+            start = perf_counter()
+            payload = self.inflator.decompress(self.buffer)
+            self.decompress_seconds.inc(perf_counter() - start)
+            self.buffer = bytearray()
+        else:
+            # uncompressed text frame, counted in characters
+            payload = frame
+
+        self.payload_bytes.inc(len(payload))
+        start = perf_counter()
+        data = orjson.loads(payload)
+        self.decode_seconds.inc(perf_counter() - start)
+        return data
+
+
+class ZlibStreamContext:
+    """Decompression context for discord.py that always asks for zlib-stream.
+
+    discord.py only defines its own zlib context when zstandard isn't installed. Frames are
+    decoded by GatewayDecoder in proxy mode, this only decompresses if something bypasses it.
+    """
+
+    COMPRESSION_TYPE = "zlib-stream"
+
+    def __init__(self):
+        self.inflator = zlib.decompressobj()
+        self.buffer = bytearray()
+
+    def decompress(self, data, /):
+        self.buffer.extend(data)
+        if len(data) < 4 or data[-4:] != ZLIB_SUFFIX:
+            return None
+        payload = self.inflator.decompress(self.buffer)
+        self.buffer = bytearray()
+        return payload.decode("utf-8")
 
-        async def get_bot_gateway(self, **_):
+
+class FrameRecorder:
+    """Writes the raw frames of a gateway connection into a file for benchmarks.gateway_replay.
+
+    Frames are written synchronously, so this is only meant to be enabled for a short while.
+    """
+
+    def __init__(self, path, limit=RECORD_LIMIT):
+        self.file = open(path, "wb")
+        self.remaining = limit
+        logger.info(f"Recording {limit} gateway frames into {path}")
+
+    def write(self, frame):
+        if self.file is None:
+            return
+        if type(frame) is str:
+            frame = frame.encode()
+        self.file.write(struct.pack(">I", len(frame)) + frame)
+        self.remaining -= 1
+        if self.remaining == 0:
+            self.file.close()
+            self.file = None
+            logger.info("Finished recording gateway frames")
+
+
+def read_frames(path):
+    """Read the frames written by a FrameRecorder"""
+    frames = []
+    with open(path, "rb") as f:
+        while header := f.read(4):
+            (length,) = struct.unpack(">I", header)
+            frames.append(f.read(length))
+    return frames
+
+
+def from_json(data):
+    # payloads already parsed by a GatewayDecoder are passed through as they are
+    if type(data) is dict:
+        return data
+    return orjson.loads(data)
+
+
+def patch_message_decoding(record_path=None):
+    """Parse gateway frames with GatewayDecoder.
+
+    If `record_path` is given, the frames of the first connection are recorded there.
+    """
+    original_received_message = discord.gateway.DiscordWebSocket.received_message
+
+    async def received_message(self, msg, /):
+        nonlocal record_path
+        decoder = self.__dict__.get("miso_decoder")
+        if decoder is None:
+            recorder = None
+            if record_path:
+                recorder = FrameRecorder(record_path)
+                record_path = None
+            decoder = self.miso_decoder = GatewayDecoder(self.shard_id, recorder)
+
+        data = decoder.feed(msg)
+        if data is not None:
+            await original_received_message(self, data)
+
+    discord.gateway.DiscordWebSocket.received_message = received_message
+    discord.utils._from_json = from_json
+
+
+def patch_with_gateway(gateway_url, record_path=None):
+    if tuple(discord.version_info[:2]) < MIN_DISCORD_VERSION:
+        raise RuntimeError(
+            f"The gateway proxy needs discord.py 2.4 or newer, found {discord.__version__}"
+        )
+    gateway = yarl.URL(gateway_url)
+
+    class ProxyHTTPClient(discord.http.HTTPClient):
+        async def get_bot_gateway(self):
             try:
                 data = await self.request(discord.http.Route("GET", "/gateway/bot"))
             except discord.HTTPException as exc:
                 raise discord.GatewayNotFound() from exc
-            return data["shards"], f"{gateway_url}?encoding=json&v=9"
+            # DiscordWebSocket.from_client adds the version, encoding and compression
+            return data["shards"], str(gateway), data["session_start_limit"]
 
     class ProxyDiscordWebSocket(discord.gateway.DiscordWebSocket):
         def is_ratelimited(self):
@@ -46,8 +228,12 @@ def patch_with_gateway(gateway_url):
             self.resume = False
             self.op = "IDENTIFY"
 
-    discord.http.HTTPClient.get_gateway = ProxyHTTPClient.get_gateway
     discord.http.HTTPClient.get_bot_gateway = ProxyHTTPClient.get_bot_gateway
     discord.http._set_api_version(9)
+    # reconnecting without resuming connects to the default gateway
+    discord.gateway.DiscordWebSocket.DEFAULT_GATEWAY = gateway
     discord.gateway.DiscordWebSocket.is_ratelimited = ProxyDiscordWebSocket.is_ratelimited
     discord.gateway.ReconnectWebSocket.__init__ = ProxyReconnectWebSocket.__init__
+    # discord.py asks for zstd-stream when zstandard is installed, GatewayDecoder only does zlib
+    discord.utils._ActiveDecompressionContext = ZlibStreamContext
+    patch_message_decoding(record_path)
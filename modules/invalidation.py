@@ -0,0 +1,134 @@
+"""
+Keeps the settings caches of all clusters in sync.
+
+Whenever a process changes cached settings it publishes an invalidation event of some kind
+(see `Cache.loaders`), optionally limited to one guild. The event is broadcast to the other
+clusters over IPC, where every subscriber of that kind reloads its data from the database.
+
+Every process numbers its events, so a receiver that notices a gap in the sequence of some
+process, or reconnects to IPC after losing the connection, reloads everything instead.
+"""
+import os
+from collections import defaultdict
+from time import time
+
+from prometheus_client import Counter
+
+from modules import log
+
+logger = log.get_logger(__name__)
+
+events_counter = Counter(
+    "miso_cache_invalidations_total",
+    "Cache invalidation events by kind and direction",
+    ["kind", "direction"],
+)
+resync_counter = Counter(
+    "miso_cache_resyncs_total",
+    "Full cache reloads caused by missed invalidation events",
+)
+
+
+class InvalidationEvent:
+    __slots__ = ("kind", "guild_id", "origin", "session", "seq")
+
+    def __init__(self, kind, guild_id, origin, session, seq):
+        self.kind = kind
+        self.guild_id = guild_id
+        self.origin = origin
+        self.session = session
+        self.seq = seq
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(*(data[name] for name in cls.__slots__))
+
+
+class InvalidationBus:
+    def __init__(self, bot):
+        self.bot = bot
+        # a process restart starts the sequence over in a new session
+        self.session = f"{os.getpid()}-{int(time())}"
+        self.seq = 0
+        # origin -> (session, last sequence number seen)
+        self.last_seen = {}
+        self.subscribers = defaultdict(list)
+        for kind in bot.cache.loaders():
+            self.subscribe(kind, lambda guild_id, kind=kind: bot.cache.invalidate(kind, guild_id))
+        bot.add_listener(self.on_ipc_invalidate)
+        bot.add_listener(self.on_ipc_reconnect)
+
+    @property
+    def origin(self):
+        return getattr(self.bot, "cluster_name", "main")
+
+    def subscribe(self, kind, callback):
+        """Call the coroutine function `callback(guild_id)` on every event of this kind.
+
+        The guild id is None when the change was not limited to one guild, or when the whole
+        cache is being resynced.
+        """
+        self.subscribers[kind].append(callback)
+
+    def unsubscribe(self, kind, callback):
+        self.subscribers[kind].remove(callback)
+
+    async def publish(self, kind, guild_id=None):
+        """Tell the other processes that settings of this kind have changed.
+
+        Call this after the database write, the local cache should already be up to date.
+        """
+        self.seq += 1
+        events_counter.labels(kind, "sent").inc()
+        if self.bot.ipc is None:
+            return
+
+        event = InvalidationEvent(kind, guild_id, self.origin, self.session, self.seq)
+        try:
+            await self.bot.ipc.broadcast("invalidate", event.to_dict())
+        except Exception as e:
+            # the receivers will see a gap in the sequence and resync
+            logger.error(f"Failed to publish {kind} invalidation: {e}")
+
+    async def on_ipc_invalidate(self, data):
+        event = InvalidationEvent.from_dict(data)
+        events_counter.labels(event.kind, "received").inc()
+        previous = self.last_seen.get(event.origin)
+        self.last_seen[event.origin] = (event.session, event.seq)
+        # events from before we first heard of a process are covered by our initial load
+        if previous is not None:
+            session, last_seq = previous
+            # a restarted process starts over from 1
+            expected = last_seq + 1 if session == event.session else 1
+            if event.seq != expected:
+                logger.warning(
+                    f"Missed invalidation events from {event.origin} "
+                    f"(expected {expected}, got {event.seq}), resyncing"
+                )
+                await self.resync()
+                return
+
+        await self.dispatch(event.kind, event.guild_id)
+
+    async def on_ipc_reconnect(self):
+        # anything broadcast while we were disconnected is lost, and waiting for the next event
+        # from every process to notice the gap could take arbitrarily long
+        logger.info("Reconnected to IPC, resyncing")
+        # the resync covers everything up to now, like the initial load does
+        self.last_seen.clear()
+        await self.resync()
+
+    async def dispatch(self, kind, guild_id):
+        for callback in self.subscribers[kind]:
+            try:
+                await callback(guild_id)
+            except Exception as e:
+                logger.error(f"Failed to apply {kind} invalidation: {e}")
+
+    async def resync(self):
+        resync_counter.inc()
+        for kind in list(self.subscribers):
+            await self.dispatch(kind, None)
@@ -0,0 +1,359 @@
+"""
+Inter-process communication between the clusters started by launcher.py.
+
+The launcher runs a `Broker` on a unix socket and every cluster connects to it with an
+`IPCClient`. Messages are newline delimited json objects:
+
+    {"op": "hello", "cluster": name, "shard_ids": [...], "shard_count": n}
+    {"op": "request", "id": id, "handler": name, "data": ..., "target": name, "guild_id": id,
+     "timeout": seconds}
+    {"op": "response", "id": id, "data": ..., "error": message}
+    {"op": "broadcast", "event": name, "data": ...}
+
+A request without a target goes to every cluster, and the requester gets back a single
+response with the results of all clusters keyed by cluster name, once they all answered or the
+timeout of the request passed. Requests with a `guild_id` are routed to the cluster that runs
+the shard of that guild. Broadcasts are dispatched as `on_ipc_<event>` events in every other
+cluster.
+
+If the connection to the broker is lost, the client fails its pending requests and reconnects
+with exponential backoff, dispatching `on_ipc_reconnect` once it's back. Broadcasts sent in the
+meantime are lost. Requests made while disconnected raise ConnectionError.
+"""
+import asyncio
+import itertools
+
+import orjson
+
+from modules import log
+
+logger = log.get_logger(__name__)
+
+# guild lists and metrics can be large
+STREAM_LIMIT = 2**24
+DEFAULT_TIMEOUT = 5.0
+RECONNECT_MAX_DELAY = 60
+
+
+def encode(message):
+    return orjson.dumps(message) + b"\n"
+
+
+def shard_id_for_guild(guild_id, shard_count):
+    return (guild_id >> 22) % shard_count
+
+
+class BrokerClient:
+    def __init__(self, name, writer, shard_ids, shard_count):
+        self.name = name
+        self.writer = writer
+        self.shard_ids = set(shard_ids)
+        self.shard_count = shard_count
+
+    def send(self, message):
+        self.writer.write(encode(message))
+
+
+class Broker:
+    """Routes messages between the cluster processes"""
+
+    def __init__(self, path, timeout=DEFAULT_TIMEOUT):
+        self.path = path
+        self.timeout = timeout
+        self.clients = {}
+        self.pending = {}
+        self.ids = itertools.count()
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_unix_server(self.handle, self.path, limit=STREAM_LIMIT)
+        logger.info(f"IPC broker listening on {self.path}")
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def handle(self, reader, writer):
+        client = None
+        try:
+            hello = orjson.loads(await reader.readline())
+            client = BrokerClient(
+                hello["cluster"], writer, hello.get("shard_ids", []), hello.get("shard_count")
+            )
+            self.clients[client.name] = client
+            logger.info(f"Cluster {client.name} connected to IPC")
+            while line := await reader.readline():
+                message = orjson.loads(line)
+                op = message.get("op")
+                if op == "request":
+                    asyncio.create_task(self.route_request(client, message))
+                elif op == "response":
+                    future = self.pending.get((message["id"], client.name))
+                    if future is not None and not future.done():
+                        future.set_result(message)
+                elif op == "broadcast":
+                    for other in list(self.clients.values()):
+                        if other is not client:
+                            other.send(message)
+        except Exception as e:
+            # includes the ValueError of readline when a line is over STREAM_LIMIT
+            logger.warning(f"IPC connection error: {type(e).__name__}: {e}")
+        finally:
+            if client is not None and self.clients.get(client.name) is client:
+                del self.clients[client.name]
+                logger.info(f"Cluster {client.name} disconnected from IPC")
+            writer.close()
+
+    def targets(self, message):
+        if message.get("target") is not None:
+            client = self.clients.get(message["target"])
+            return [client] if client else []
+        if message.get("guild_id") is not None:
+            for client in self.clients.values():
+                if client.shard_count and (
+                    shard_id_for_guild(message["guild_id"], client.shard_count) in client.shard_ids
+                ):
+                    return [client]
+            return []
+        return list(self.clients.values())
+
+    async def route_request(self, requester, message):
+        request_id = next(self.ids)
+        targets = self.targets(message)
+        futures = {}
+        for client in targets:
+            future = asyncio.get_running_loop().create_future()
+            self.pending[(request_id, client.name)] = future
+            futures[client.name] = future
+            client.send(
+                {
+                    "op": "request",
+                    "id": request_id,
+                    "handler": message["handler"],
+                    "data": message.get("data"),
+                }
+            )
+
+        results = {}
+        errors = {}
+        try:
+            done, _ = await asyncio.wait(
+                futures.values(), timeout=message.get("timeout") or self.timeout
+            )
+            for name, future in futures.items():
+                if future not in done:
+                    errors[name] = "timed out"
+                elif future.result().get("error") is not None:
+                    errors[name] = future.result()["error"]
+                else:
+                    results[name] = future.result().get("data")
+        finally:
+            for name in futures:
+                self.pending.pop((request_id, name), None)
+
+        # the requester could have reconnected, the response belongs to the old connection
+        if self.clients.get(requester.name) is requester:
+            requester.send(
+                {"op": "response", "id": message["id"], "data": results, "errors": errors}
+            )
+
+
+class IPCClient:
+    """Connection of a single cluster to the broker"""
+
+    def __init__(self, bot, name, path, shard_ids, shard_count):
+        self.bot = bot
+        self.name = name
+        self.path = path
+        self.shard_ids = shard_ids
+        self.shard_count = shard_count
+        self.pending = {}
+        self.ids = itertools.count()
+        self.writer = None
+        self.reader_task = None
+        self.closed = False
+
+    async def connect(self):
+        reader, self.writer = await asyncio.open_unix_connection(self.path, limit=STREAM_LIMIT)
+        self.writer.write(
+            encode(
+                {
+                    "op": "hello",
+                    "cluster": self.name,
+                    "shard_ids": self.shard_ids,
+                    "shard_count": self.shard_count,
+                }
+            )
+        )
+        await self.writer.drain()
+        self.reader_task = asyncio.create_task(self.run(reader))
+
+    async def close(self):
+        self.closed = True
+        if self.reader_task is not None:
+            self.reader_task.cancel()
+        if self.writer is not None:
+            self.writer.close()
+
+    async def run(self, reader):
+        """Read messages until the connection is lost, then reconnect"""
+        try:
+            await self.read(reader)
+        except Exception as e:
+            # anything that stops the reader, like the ValueError of readline when a line is over
+            # STREAM_LIMIT, has to go through the reconnect below or the cluster stays deaf
+            logger.error(f"IPC connection error: {type(e).__name__}: {e}")
+        if self.closed:
+            return
+
+        logger.error("Lost connection to the IPC broker")
+        self.writer.close()
+        self.writer = None
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError("Lost connection to the IPC broker"))
+        self.pending.clear()
+        await self.reconnect()
+
+    async def reconnect(self):
+        delay = 1
+        while not self.closed:
+            await asyncio.sleep(delay)
+            try:
+                await self.connect()
+                logger.info("Reconnected to the IPC broker")
+                self.bot.dispatch("ipc_reconnect")
+                return
+            except OSError as e:
+                delay = min(delay * 2, RECONNECT_MAX_DELAY)
+                logger.warning(f"Could not reconnect to the IPC broker, retrying in {delay}s: {e}")
+
+    def ensure_connected(self):
+        if self.writer is None:
+            raise ConnectionError("Not connected to the IPC broker")
+
+    async def read(self, reader):
+        while line := await reader.readline():
+            message = orjson.loads(line)
+            op = message.get("op")
+            if op == "request":
+                asyncio.create_task(self.respond(message))
+            elif op == "response":
+                future = self.pending.pop(message["id"], None)
+                if future is not None and not future.done():
+                    future.set_result(message)
+            elif op == "broadcast":
+                self.bot.dispatch(f"ipc_{message['event']}", message.get("data"))
+
+    async def respond(self, message):
+        response = {"op": "response", "id": message["id"]}
+        try:
+            response["data"] = await self.bot.run_ipc_handler(
+                message["handler"], message.get("data")
+            )
+        except Exception as e:
+            logger.error(f"Error in IPC handler {message['handler']}: {e}")
+            response["error"] = f"{type(e).__name__}: {e}"
+        if self.writer is not None:
+            self.writer.write(encode(response))
+
+    async def request(self, handler, data=None, target=None, guild_id=None, timeout=None):
+        """Run a handler in other clusters and return a dict of results by cluster name"""
+        self.ensure_connected()
+        request_id = next(self.ids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        self.writer.write(
+            encode(
+                {
+                    "op": "request",
+                    "id": request_id,
+                    "handler": handler,
+                    "data": data,
+                    "target": target,
+                    "guild_id": guild_id,
+                    "timeout": timeout,
+                }
+            )
+        )
+        try:
+            # the broker gives up on slow clusters after the timeout, wait for it to answer
+            response = await asyncio.wait_for(
+                future, (timeout or DEFAULT_TIMEOUT) + DEFAULT_TIMEOUT
+            )
+        finally:
+            self.pending.pop(request_id, None)
+
+        for cluster, error in response.get("errors", {}).items():
+            logger.warning(f"IPC request {handler} failed in cluster {cluster}: {error}")
+        return response["data"]
+
+    async def broadcast(self, event, data=None):
+        self.ensure_connected()
+        self.writer.write(encode({"op": "broadcast", "event": event, "data": data}))
+        await self.writer.drain()
+
+
+# handlers that every cluster answers, they take the bot and the request data
+
+
+async def stats_handler(bot, _data):
+    return {
+        "guilds": bot.guild_count,
+        "members": bot.member_count,
+        "users": len(bot.users),
+        # json object keys have to be strings
+        "shards": {str(shard_id): shard.latency for shard_id, shard in bot.shards.items()},
+    }
+
+
+async def guild_list_handler(bot, data):
+    """List guilds, optionally only ones matching a name search or containing a user"""
+    data = data or {}
+    search = data.get("search", "").lower()
+    user_id = data.get("user_id")
+    return [
+        [guild.id, guild.name, guild.member_count]
+        for guild in bot.guilds
+        if search in guild.name.lower() and (user_id is None or guild.get_member(user_id))
+    ]
+
+
+async def find_guild_handler(bot, guild_id):
+    guild = bot.get_guild(guild_id)
+    if guild is None:
+        return None
+    return {
+        "id": guild.id,
+        "name": guild.name,
+        "member_count": guild.member_count,
+        "shard_id": guild.shard_id,
+    }
+
+
+async def metrics_handler(_bot, _data):
+    from prometheus_client import generate_latest
+
+    return generate_latest().decode()
+
+
+async def memory_handler(bot, data):
+    """Run a memory profiler action, data is {"action": name, **options}"""
+    options = dict(data)
+    return await bot.memory_profiler.run(options.pop("action"), **options)
+
+
+async def cpu_profile_handler(bot, data):
+    """Record a cpu profile, data holds the keyword arguments of CPUProfiler.profile"""
+    return await bot.cpu_profiler.profile(**data)
+
+
+HANDLERS = {
+    "stats": stats_handler,
+    "guild_list": guild_list_handler,
+    "find_guild": find_guild_handler,
+    "metrics": metrics_handler,
+    "memory": memory_handler,
+    "cpu_profile": cpu_profile_handler,
+}
@@ -1,6 +1,31 @@
 import logging
+import logging.handlers
 from time import time
 
+# set in cluster processes, so that all logging goes to the launcher process instead of stderr
+log_queue = None
+cluster_name = None
+
+
+class ClusterFilter(logging.Filter):
+    """Tags records with the name of the cluster they were logged in"""
+
+    def filter(self, record):
+        record.cluster = cluster_name
+        return True
+
+
+def make_handler(fmt):
+    if log_queue is not None:
+        # the formatting is done by the launcher, so the message is sent as is
+        handler = logging.handlers.QueueHandler(log_queue)
+        handler.addFilter(ClusterFilter())
+        return handler
+
+    handler = logging.StreamHandler()
+    handler.setFormatter(fmt)
+    return handler
+
 
 def get_logger(logger_name):
     logger = logging.getLogger(logger_name)
@@ -14,9 +39,7 @@ def get_logger(logger_name):
         style="{",
         datefmt="%Y-%m-%d %H:%M:%S",
     )
-    handler = logging.StreamHandler()
-    handler.setFormatter(fmt)
-    logger.addHandler(handler)
+    logger.addHandler(make_handler(fmt))
 
     return logger
 
@@ -33,13 +56,43 @@ def get_command_logger():
         style="{",
         datefmt="%Y-%m-%d %H:%M:%S",
     )
-    handler = logging.StreamHandler()
-    handler.setFormatter(fmt)
-    logger.addHandler(handler)
+    logger.addHandler(make_handler(fmt))
 
     return logger
 
 
+def send_to_queue(queue, name):
+    """Send all logging of this process into `queue`, to be written by the launcher process.
+
+    Loggers that were already created have their handlers replaced.
+    """
+    global log_queue, cluster_name
+    log_queue = queue
+    cluster_name = name
+    for logger in [logging.getLogger()] + [
+        logger
+        for logger in logging.root.manager.loggerDict.values()
+        if isinstance(logger, logging.Logger)
+    ]:
+        if logger.handlers:
+            for handler in logger.handlers[:]:
+                logger.removeHandler(handler)
+            logger.addHandler(make_handler(None))
+
+
+def queue_listener(queue):
+    """Listener for the launcher process that writes the records sent by clusters to stderr"""
+    handler = logging.StreamHandler()
+    handler.setFormatter(
+        logging.Formatter(
+            fmt="{asctime} | {levelname:7} {cluster:>4} {name:>17} > {message}",
+            style="{",
+            datefmt="%Y-%m-%d %H:%M:%S",
+        )
+    )
+    return logging.handlers.QueueListener(queue, handler)
+
+
 def log_command(ctx, extra=""):
     try:
         took = time() - ctx.timer
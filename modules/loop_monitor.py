@@ -0,0 +1,142 @@
+import asyncio
+import os
+import sys
+import threading
+import traceback
+from collections import deque
+from time import monotonic
+
+from modules import log
+
+logger = log.get_logger(__name__)
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class BlockingEvent:
+    """A single detected stall of the event loop"""
+
+    def __init__(self, duration, location, task_name, stack):
+        self.duration = duration
+        self.location = location
+        self.task_name = task_name
+        self.stack = stack
+
+
+class LoopMonitor:
+    """
+    Measures event loop scheduling lag and detects callbacks that block the loop.
+
+    A probe coroutine running on the loop sleeps for `interval` and records how late it woke up.
+    A watchdog thread looks at the time of the last probe wakeup, and if the loop has been stuck
+    for longer than `threshold`, grabs the stack of the loop thread so the blocking code can be found.
+    """
+
+    def __init__(self, interval=0.25, threshold=0.5, on_lag=None, on_block=None, history=50):
+        self.interval = interval
+        self.threshold = threshold
+        self.on_lag = on_lag
+        self.on_block = on_block
+        self.recent_blocks = deque(maxlen=history)
+        self.loop = None
+        self.last_beat = monotonic()
+        self._loop_thread_id = None
+        self._probe_task = None
+        self._watchdog = None
+        self._stop = threading.Event()
+
+    def start(self, loop=None):
+        if self._probe_task is not None:
+            return
+        self.loop = loop or asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self.last_beat = monotonic()
+        self._stop.clear()
+        self._probe_task = self.loop.create_task(self.probe())
+        self._watchdog = threading.Thread(
+            target=self.watch, name="loop-monitor-watchdog", daemon=True
+        )
+        self._watchdog.start()
+        logger.info(
+            f"Event loop monitor started (interval {self.interval}s, threshold {self.threshold}s)"
+        )
+
+    def stop(self):
+        self._stop.set()
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            self._probe_task = None
+        if self._watchdog is not None:
+            self._watchdog.join(timeout=self.interval + self.threshold)
+            self._watchdog = None
+
+    async def probe(self):
+        while True:
+            start = self.loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, self.loop.time() - start - self.interval)
+            self.last_beat = monotonic()
+            if self.on_lag is not None:
+                self.on_lag(lag)
+
+    def watch(self):
+        """Watchdog thread main loop"""
+        pending = None
+        pending_beat = None
+        while not self._stop.wait(self.threshold / 2):
+            beat = self.last_beat
+            if pending is not None:
+                if beat == pending_beat:
+                    continue
+                # the loop is running again, report how long the stall lasted in total
+                pending.duration = beat - pending_beat - self.interval
+                self.report(pending)
+                pending = None
+
+            stalled_for = monotonic() - beat - self.interval
+            if stalled_for < self.threshold:
+                continue
+
+            pending = self.capture(stalled_for)
+            pending_beat = beat
+            if pending is not None:
+                logger.warning(
+                    f"Event loop blocked for over {stalled_for:.2f}s in task [{pending.task_name}] "
+                    f"at {pending.location}\n{''.join(pending.stack)}"
+                )
+
+    def report(self, event):
+        self.recent_blocks.append(event)
+        logger.warning(f"Event loop was blocked for {event.duration:.2f}s at {event.location}")
+        if self.on_block is not None:
+            try:
+                self.on_block(event)
+            except Exception as e:
+                logger.error(f"Error in loop monitor block handler: {e}")
+
+    def capture(self, stalled_for):
+        """Capture the current stack of the event loop thread"""
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return None
+
+        stack = traceback.format_stack(frame)
+        location = find_location(frame)
+        try:
+            task = asyncio.current_task(self.loop)
+        except RuntimeError:
+            task = None
+        task_name = task.get_name() if task is not None else "<callback>"
+        return BlockingEvent(stalled_for, location, task_name, stack)
+
+
+def find_location(frame):
+    """Return file:function of the innermost frame that belongs to this project"""
+    innermost = frame
+    while frame is not None:
+        filename = os.path.abspath(frame.f_code.co_filename)
+        if filename.startswith(PROJECT_ROOT) and "site-packages" not in filename:
+            return f"{os.path.relpath(filename, PROJECT_ROOT)}:{frame.f_code.co_name}"
+        frame = frame.f_back
+
+    return f"{os.path.basename(innermost.f_code.co_filename)}:{innermost.f_code.co_name}"
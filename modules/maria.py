@@ -1,27 +1,278 @@
 import asyncio
+import hashlib
 import os
+import re
+from collections import deque
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from time import perf_counter
 
 import aiomysql
+from discord.ext import tasks
+from prometheus_client import Counter, Gauge, Histogram
 
-from modules import exceptions, log
+from modules import exceptions, log, tracing
 
 logger = log.get_logger(__name__)
+slow_query_logger = log.get_logger("slowquery")
 log.get_logger("aiomysql")
 
+SLOW_QUERY_THRESHOLD = float(os.environ.get("DB_SLOW_QUERY_THRESHOLD", 1.0))
+REPLICA_MAX_LAG = int(os.environ.get("DB_REPLICA_MAX_LAG", 30))
+# access denied errors, the database user lacks a privilege rather than the replica being down
+ACCESS_DENIED_ERRORS = {1044, 1045, 1142, 1143, 1227}
+
+QUERY_NORMALIZERS = [
+    # string literals
+    (re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.|\"\")*\""), "?"),
+    # numeric literals, not parts of identifiers such as h23
+    (re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b"), "?"),
+    # query parameters
+    (re.compile(r"%s"), "?"),
+    # IN-lists of any length
+    (re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE), "IN (...)"),
+    # multi-row VALUES
+    (
+        re.compile(r"\bVALUES\s*(\([^()]*\))(?:\s*,\s*\([^()]*\))+", re.IGNORECASE),
+        r"VALUES \1, ...",
+    ),
+    (re.compile(r"\s+"), " "),
+]
+
+query_duration_histogram = Histogram(
+    "miso_db_query_duration_seconds",
+    "Execution time of database queries in seconds, by query fingerprint.",
+    ["query"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+query_rows_counter = Counter(
+    "miso_db_query_rows_total",
+    "Rows returned or affected by database queries, by query fingerprint.",
+    ["query"],
+)
+pool_acquire_histogram = Histogram(
+    "miso_db_pool_acquire_seconds",
+    "Time spent waiting for a connection from the database pool in seconds.",
+    ["pool"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0),
+)
+pool_connections_gauge = Gauge(
+    "miso_db_pool_connections",
+    "Connections of the database pool by state (in_use, free).",
+    ["pool", "state"],
+)
+pool_waiters_gauge = Gauge(
+    "miso_db_pool_waiters",
+    "Number of tasks currently waiting for a connection from the database pool.",
+    ["pool"],
+)
+pool_queries_counter = Counter(
+    "miso_db_pool_queries_total",
+    "Queries executed per database pool.",
+    ["pool"],
+)
+replica_lag_gauge = Gauge(
+    "miso_db_replica_lag_seconds",
+    "Replication lag of the read replica in seconds, -1 if unavailable.",
+)
+pool_maxsize_gauge = Gauge(
+    "miso_db_pool_max_size",
+    "Current maximum size of the database pool.",
+    ["pool"],
+)
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(statement):
+    """Normalize a statement so that queries differing only by literals are grouped together.
+    Returns tuple of (short id, normalized statement)
+    """
+    for pattern, replacement in QUERY_NORMALIZERS:
+        statement = pattern.sub(replacement, statement)
+    statement = statement.strip()
+    return hashlib.md5(statement.encode()).hexdigest()[:8], statement
+
+
+class QueryStats:
+    """Aggregated statistics of a single query fingerprint"""
+
+    def __init__(self, query_id, statement):
+        self.query_id = query_id
+        self.statement = statement
+        self.calls = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.rows = 0
+        self.acquire_time = 0.0
+
+    @property
+    def avg_time(self):
+        return self.total_time / self.calls if self.calls else 0.0
+
+
+class ConnectionPool:
+    """
+    Wrapper around an aiomysql pool that exports telemetry and adapts its maximum size.
+
+    The pool grows when tasks had to wait for a connection during the last interval,
+    and shrinks back towards `minsize` after staying mostly idle for a while.
+    """
+
+    GROW_STEP = 5
+    SHRINK_AFTER_INTERVALS = 6
+
+    def __init__(self, name, minsize, maxsize_limit):
+        self.name = name
+        self.pool = None
+        self.minsize = minsize
+        self.maxsize = minsize
+        self.maxsize_limit = max(minsize, maxsize_limit)
+        self.waiting = 0
+        self.peak_waiting = 0
+        self.peak_in_use = 0
+        self.idle_intervals = 0
+        self.ready = asyncio.Event()
+
+    @property
+    def in_use(self):
+        return self.pool.size - self.pool.freesize if self.pool is not None else 0
+
+    async def connect(self, **cred):
+        self.pool = await aiomysql.create_pool(
+            **cred, maxsize=self.maxsize, autocommit=True, echo=False
+        )
+        if not self.resizable:
+            logger.warning(
+                f"Pool [{self.name}] can't be resized with the installed aiomysql version, "
+                f"using a fixed maximum of {self.maxsize_limit} connections"
+            )
+            self.pool.close()
+            await self.pool.wait_closed()
+            self.maxsize = self.minsize = self.maxsize_limit
+            self.pool = await aiomysql.create_pool(
+                **cred, maxsize=self.maxsize, autocommit=True, echo=False
+            )
+        pool_maxsize_gauge.labels(self.name).set(self.maxsize)
+        self.ready.set()
+
+    @property
+    def resizable(self):
+        """Whether the aiomysql internals `set_maxsize` relies on are there"""
+        return isinstance(getattr(self.pool, "_free", None), deque) and hasattr(self.pool, "_cond")
+
+    async def wait_until_ready(self, timeout=10):
+        if self.ready.is_set():
+            return True
+        logger.warning(f"Pool [{self.name}] not initialized yet. waiting...")
+        try:
+            await asyncio.wait_for(self.ready.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    @asynccontextmanager
+    async def acquire(self):
+        start = perf_counter()
+        self.waiting += 1
+        self.peak_waiting = max(self.peak_waiting, self.waiting)
+        pool_waiters_gauge.labels(self.name).inc()
+        try:
+            conn = await self.pool.acquire()
+        finally:
+            self.waiting -= 1
+            pool_waiters_gauge.labels(self.name).dec()
+        pool_acquire_histogram.labels(self.name).observe(perf_counter() - start)
+        self.peak_in_use = max(self.peak_in_use, self.in_use)
+        try:
+            yield conn
+        finally:
+            await self.pool.release(conn)
+
+    async def resize(self):
+        """Adjust the pool maximum size based on the waiters and usage seen since the last call"""
+        new_maxsize = self.maxsize
+        if self.peak_waiting > 0 and self.maxsize < self.maxsize_limit:
+            new_maxsize = min(self.maxsize_limit, self.maxsize + self.GROW_STEP)
+            self.idle_intervals = 0
+        elif self.peak_in_use <= self.maxsize // 2 and self.maxsize > self.minsize:
+            self.idle_intervals += 1
+            if self.idle_intervals >= self.SHRINK_AFTER_INTERVALS:
+                new_maxsize = max(self.minsize, self.maxsize - self.GROW_STEP)
+                self.idle_intervals = 0
+        else:
+            self.idle_intervals = 0
+
+        if new_maxsize != self.maxsize:
+            logger.info(
+                f"Resizing pool [{self.name}] from {self.maxsize} to {new_maxsize} connections "
+                f"(peak waiters {self.peak_waiting}, peak in use {self.peak_in_use})"
+            )
+            await self.set_maxsize(new_maxsize)
+            if self.pool.maxsize != new_maxsize:
+                logger.warning(
+                    f"Pool [{self.name}] could only be resized to {self.pool.maxsize} "
+                    f"connections, {self.pool.size} are open"
+                )
+            self.maxsize = self.pool.maxsize
+
+        self.peak_waiting = self.waiting
+        self.peak_in_use = self.in_use
+        self.update_metrics()
+
+    async def set_maxsize(self, maxsize):
+        """Change the maximum size of the aiomysql pool.
+
+        aiomysql has no api for this. The maximum size of its pool is the maxlen of the deque of
+        free connections, so that deque is replaced with a new one. The pool can't be shrunk
+        below the connections currently in use, since a connection released into a full deque
+        would be dropped without being closed.
+        """
+        if not self.resizable:
+            return
+        if maxsize < self.pool.maxsize:
+            # close idle connections, new ones are opened on demand up to the new limit
+            await self.pool.clear()
+        # connections are only opened while holding this condition
+        async with self.pool._cond:
+            maxsize = max(maxsize, self.pool.size)
+            self.pool._free = deque(self.pool._free, maxlen=maxsize)
+            # tasks waiting for a connection can now open one if the pool grew
+            self.pool._cond.notify_all()
+
+    def update_metrics(self):
+        pool_connections_gauge.labels(self.name, "in_use").set(self.in_use)
+        pool_connections_gauge.labels(self.name, "free").set(self.pool.freesize)
+        pool_maxsize_gauge.labels(self.name).set(self.maxsize)
+
+    async def close(self):
+        self.pool.close()
+        await self.pool.wait_closed()
+
 
 class MariaDB:
     def __init__(self, bot):
         self.bot = bot
-        self.pool = None
+        pool_size = int(os.environ.get("DB_POOL_SIZE", 10))
+        self.pool = ConnectionPool(
+            "primary",
+            pool_size,
+            int(os.environ.get("DB_POOL_MAX_SIZE", pool_size * 3)),
+        )
+        self.replica = None
+        self.replica_cred = None
+        self.replica_available = False
+        if os.environ.get("DB_REPLICA_HOST"):
+            replica_pool_size = int(os.environ.get("DB_REPLICA_POOL_SIZE", pool_size))
+            self.replica = ConnectionPool(
+                "replica",
+                replica_pool_size,
+                int(os.environ.get("DB_REPLICA_POOL_MAX_SIZE", replica_pool_size * 3)),
+            )
+        self.query_stats = {}
+        self.slow_queries = deque(maxlen=100)
 
     async def wait_for_pool(self):
-        i = 0
-        while self.pool is None and i < 10:
-            logger.warning("Pool not initialized yet. waiting...")
-            await asyncio.sleep(1)
-            i += 1
-
-        if self.pool is None:
+        if not await self.pool.wait_until_ready():
             logger.error("Pool wait timeout! ABORTING")
             return False
         return True
@@ -37,41 +288,304 @@ class MariaDB:
         logger.info(
             f"Connecting to database {cred['db']} on {cred['host']}:{cred['port']} as {cred['user']}"
         )
-        maxsize = int(os.environ.get("DB_POOL_SIZE", 10))
-        self.pool = await aiomysql.create_pool(
-            **cred, maxsize=maxsize, autocommit=True, echo=False
+        await self.pool.connect(**cred)
+        logger.info(
+            f"Initialized MariaDB connection pool with {self.pool.maxsize} connections "
+            f"(adaptive up to {self.pool.maxsize_limit})"
         )
-        logger.info(f"Initialized MariaDB connection pool with {maxsize} connections")
+        if self.replica is not None:
+            self.replica_cred = {
+                **cred,
+                "host": os.environ["DB_REPLICA_HOST"],
+                "port": int(os.environ.get("DB_REPLICA_PORT", cred["port"])),
+            }
+            await self.connect_replica()
+        self.maintain_pools.start()
+
+    async def connect_replica(self):
+        cred = self.replica_cred
+        logger.info(f"Connecting to read replica on {cred['host']}:{cred['port']}")
+        try:
+            await self.replica.connect(**cred)
+        except Exception as e:
+            # the bot works fine without the replica, connecting is retried later
+            logger.warning(f"Could not connect to read replica: {e}")
+            return
+        await self.check_replica()
+
+    async def write_heartbeat(self):
+        await self.execute(
+            "REPLACE INTO replication_heartbeat (id, beat) VALUES (1, UTC_TIMESTAMP(6))"
+        )
+
+    async def check_replica(self):
+        """Mark the replica available only if it's reachable and not lagging behind.
+
+        The lag is the age of the heartbeat written to the primary by `write_heartbeat`, as seen
+        on the replica. Unlike SHOW SLAVE STATUS this needs no privileges beyond SELECT, but it
+        assumes the clocks of the database servers are in sync.
+        """
+        lag = None
+        available = False
+        try:
+            async with self.replica.acquire() as conn:
+                async with conn.cursor() as cur:
+                    await cur.execute(
+                        """
+                        SELECT TIMESTAMPDIFF(MICROSECOND, beat, UTC_TIMESTAMP(6)) / 1000000
+                            FROM replication_heartbeat WHERE id = 1
+                        """
+                    )
+                    row = await cur.fetchone()
+            if row is None:
+                logger.warning("No replication heartbeat found on the read replica")
+            else:
+                lag = max(0.0, float(row[0]))
+                available = lag <= REPLICA_MAX_LAG
+        except aiomysql.Error as e:
+            if e.args and e.args[0] in ACCESS_DENIED_ERRORS:
+                # without the lag the replica could be serving arbitrarily stale data
+                logger.error(
+                    f"Unable to check the lag of the read replica, not routing reads to it: {e}"
+                )
+            else:
+                logger.warning(f"Read replica health check failed: {e}")
+        except Exception as e:
+            logger.warning(f"Read replica health check failed: {e}")
+
+        if available != self.replica_available:
+            logger.info(
+                f"Read replica is now {'available' if available else 'unavailable'} (lag {lag})"
+            )
+        self.replica_available = available
+        replica_lag_gauge.set(lag if lag is not None else -1)
 
     async def cleanup(self):
-        self.pool.close()
-        await self.pool.wait_closed()
+        self.maintain_pools.cancel()
+        await self.pool.close()
+        if self.replica is not None and self.replica.pool is not None:
+            await self.replica.close()
         logger.info("Closed MariaDB connection pool")
 
-    async def execute(self, statement, *params, one_row=False, one_value=False, as_list=False):
+    @tasks.loop(seconds=10)
+    async def maintain_pools(self):
+        try:
+            await self.pool.resize()
+            if self.replica is not None:
+                if self.replica.pool is None:
+                    await self.connect_replica()
+                else:
+                    await self.replica.resize()
+                    await self.write_heartbeat()
+                    await self.check_replica()
+        except Exception as e:
+            logger.error(f"Error maintaining database pool: {e}")
+
+    def get_pool(self, read_only=False):
+        """Route read only queries to the replica when it's healthy"""
+        if read_only and self.replica_available:
+            return self.replica
+        return self.pool
+
+    def record_query(self, statement, start, acquired, rows):
+        """Record timing of a finished query"""
+        took = perf_counter() - acquired
+        acquire_wait = acquired - start
+        query_id, normalized = fingerprint(statement)
+
+        stats = self.query_stats.get(query_id)
+        if stats is None:
+            stats = self.query_stats[query_id] = QueryStats(query_id, normalized)
+        stats.calls += 1
+        stats.total_time += took
+        stats.max_time = max(stats.max_time, took)
+        stats.acquire_time += acquire_wait
+        if rows > 0:
+            stats.rows += rows
+            query_rows_counter.labels(query_id).inc(rows)
+
+        query_duration_histogram.labels(query_id).observe(took)
+
+        if took > SLOW_QUERY_THRESHOLD:
+            self.slow_queries.append((query_id, took, normalized))
+            slow_query_logger.warning(
+                f"SLOW QUERY [{query_id}] {took:.3f}s (waited {acquire_wait:.3f}s for connection)"
+                f" rows={rows} > {normalized}"
+            )
+
+    def top_queries(self, key="total_time"):
+        return sorted(self.query_stats.values(), key=lambda x: getattr(x, key), reverse=True)
+
+    async def run_statement(self, conn, statement, params, start, many=False):
+        """Run a statement on an already acquired connection and record its timing"""
+        acquired = perf_counter()
+        async with conn.cursor() as cur:
+            if many:
+                await cur.executemany(statement, params)
+                data = ()
+            else:
+                await cur.execute(statement, params)
+                data = await cur.fetchall()
+            rows = cur.rowcount
+        self.record_query(statement, start, acquired, rows)
+        return data
+
+    async def run_query(self, pool, statement, params, many=False):
+        with tracing.span("db"):
+            start = perf_counter()
+            async with pool.acquire() as conn:
+                data = await self.run_statement(conn, statement, params, start, many)
+                if many:
+                    await conn.commit()
+            pool_queries_counter.labels(pool.name).inc()
+        return data
+
+    async def execute(
+        self,
+        statement,
+        *params,
+        one_row=False,
+        one_value=False,
+        as_list=False,
+        read_only=False,
+    ):
         if await self.wait_for_pool():
-            async with self.pool.acquire() as conn:
-                async with conn.cursor() as cur:
-                    await cur.execute(statement, params)
-                    data = await cur.fetchall()
-            if data is None:
-                return ()
-            if data:
-                if one_value:
-                    return data[0][0]
-                if one_row:
-                    return data[0]
-                if as_list:
-                    return [row[0] for row in data]
-                return data
-            return ()
+            pool = self.get_pool(read_only)
+            try:
+                data = await self.run_query(pool, statement, params)
+            except (aiomysql.OperationalError, OSError) as e:
+                if pool is self.pool:
+                    raise
+                logger.warning(f"Read replica query failed, falling back to primary: {e}")
+                self.replica_available = False
+                data = await self.run_query(self.pool, statement, params)
+            return format_result(data, one_row, one_value, as_list)
         raise exceptions.CommandError("Could not connect to the local MariaDB instance!")
 
     async def executemany(self, statement, params):
         if await self.wait_for_pool():
-            async with self.pool.acquire() as conn:
-                async with conn.cursor() as cur:
-                    await cur.executemany(statement, params)
-                    await conn.commit()
+            await self.run_query(self.pool, statement, params, many=True)
             return ()
         raise exceptions.CommandError("Could not connect to the local MariaDB instance!")
+
+    @asynccontextmanager
+    async def stream(self, statement, *params, chunk_size=1000, read_only=False):
+        """Stream rows of a large result set using a server side cursor.
+
+        usage:
+            async with bot.db.stream("SELECT ...") as rows:
+                async for row in rows:
+                    ...
+
+        Rows are fetched `chunk_size` at a time instead of loading the whole result in memory.
+        Leaving the block before all rows are read drops the connection, so that the
+        remaining rows don't have to be transferred just to be discarded.
+        """
+        if not await self.wait_for_pool():
+            raise exceptions.CommandError("Could not connect to the local MariaDB instance!")
+
+        pool = self.get_pool(read_only)
+        start = perf_counter()
+        async with pool.acquire() as conn:
+            acquired = perf_counter()
+            cur = await conn.cursor(aiomysql.SSCursor)
+            rows = RowStream(cur, chunk_size)
+            try:
+                await cur.execute(statement, params)
+                yield rows
+            finally:
+                if rows.exhausted:
+                    await cur.close()
+                else:
+                    conn.close()
+        self.record_query(statement, start, acquired, rows.row_count)
+        pool_queries_counter.labels(pool.name).inc()
+
+    @asynccontextmanager
+    async def transaction(self, read_only=False):
+        """Run multiple statements on a single connection as one atomic transaction.
+
+        usage:
+            async with bot.db.transaction() as tx:
+                await tx.execute(...)
+                await tx.execute(...)
+
+        Commits when the block exits normally and rolls back if it raises.
+        """
+        if not await self.wait_for_pool():
+            raise exceptions.CommandError("Could not connect to the local MariaDB instance!")
+
+        pool = self.get_pool(read_only)
+        start = perf_counter()
+        async with pool.acquire() as conn:
+            await conn.begin()
+            try:
+                yield Transaction(self, conn, start)
+            except BaseException:
+                await conn.rollback()
+                raise
+            await conn.commit()
+        pool_queries_counter.labels(pool.name).inc()
+
+
+class RowStream:
+    """Async iterator over the rows of a server side cursor, see MariaDB.stream()"""
+
+    def __init__(self, cursor, chunk_size):
+        self.cursor = cursor
+        self.chunk_size = chunk_size
+        self.row_count = 0
+        self.exhausted = False
+
+    def __aiter__(self):
+        return self.rows()
+
+    async def chunks(self):
+        while not self.exhausted:
+            chunk = await self.cursor.fetchmany(self.chunk_size)
+            if not chunk:
+                self.exhausted = True
+                return
+            self.row_count += len(chunk)
+            yield chunk
+
+    async def rows(self):
+        async for chunk in self.chunks():
+            for row in chunk:
+                yield row
+
+
+class Transaction:
+    """Handle for executing statements inside MariaDB.transaction()"""
+
+    def __init__(self, db, conn, start):
+        self.db = db
+        self.conn = conn
+        self.start = start
+
+    async def execute(self, statement, *params, one_row=False, one_value=False, as_list=False):
+        with tracing.span("db"):
+            data = await self.db.run_statement(self.conn, statement, params, self.start)
+        # only the first statement waited for the connection
+        self.start = perf_counter()
+        return format_result(data, one_row, one_value, as_list)
+
+    async def executemany(self, statement, params):
+        with tracing.span("db"):
+            await self.db.run_statement(self.conn, statement, params, self.start, many=True)
+        self.start = perf_counter()
+        return ()
+
+
+def format_result(data, one_row=False, one_value=False, as_list=False):
+    if data is None:
+        return ()
+    if data:
+        if one_value:
+            return data[0][0]
+        if one_row:
+            return data[0]
+        if as_list:
+            return [row[0] for row in data]
+        return data
+    return ()
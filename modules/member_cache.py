@@ -0,0 +1,195 @@
+"""
+Deciding which guilds keep their whole member list in memory.
+
+With MEMBER_CACHE_POLICY=features (the default) only guilds that use member dependent features
+are chunked and keep their members cached: guilds with autoroles or an enabled greeter, and
+guilds where commands marked with `util.requires_members()` were used in the last
+MEMBER_CACHE_IDLE_HOURS hours. Members of other guilds are dropped from the cache, and single
+members are fetched on demand through `get_member`, which keeps them in a short lived LRU.
+Users are only cached while a cached member references them, so code that needs a user by id
+should use `get_user`, which falls back to the same LRU and the api.
+
+MEMBER_CACHE_POLICY=all caches every member of every guild like discord.py does by default.
+"""
+import os
+from collections import OrderedDict
+from time import monotonic
+
+import discord
+from discord.ext import tasks
+from prometheus_client import Counter, Gauge
+
+from modules import log
+
+logger = log.get_logger(__name__)
+
+POLICY = os.environ.get("MEMBER_CACHE_POLICY", "features")
+IDLE_SECONDS = float(os.environ.get("MEMBER_CACHE_IDLE_HOURS", 6)) * 3600
+LRU_SIZE = 10_000
+LRU_TTL = 300
+
+cached_guilds_gauge = Gauge(
+    "miso_member_cache_guilds",
+    "Guilds whose whole member list is kept in the cache.",
+)
+lru_lookup_counter = Counter(
+    "miso_member_lru_lookups_total",
+    "Single member lookups of guilds without a full member cache, by result.",
+    ["result"],
+)
+
+
+def member_cache_flags():
+    if POLICY == "all":
+        return discord.MemberCacheFlags.all()
+    # members are added to the cache by MemberCachePolicy instead. Empty flags would also stop
+    # discord.py from caching users at all, so joining members are cached and dropped in
+    # on_member_join if their guild doesn't want them
+    flags = discord.MemberCacheFlags.none()
+    flags.joined = True
+    return flags
+
+
+class MemberLRU:
+    """Members by (guild_id, user_id), or users by (None, user_id), that expire after `ttl`"""
+
+    def __init__(self, size=LRU_SIZE, ttl=LRU_TTL):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        """Return (found, member), the member can be None if it's known not to exist"""
+        entry = self.entries.get(key)
+        if entry is None:
+            return False, None
+        expires, member = entry
+        if expires < monotonic():
+            del self.entries[key]
+            return False, None
+        self.entries.move_to_end(key)
+        return True, member
+
+    def put(self, key, member):
+        self.entries[key] = (monotonic() + self.ttl, member)
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+
+class MemberCachePolicy:
+    def __init__(self, bot):
+        self.bot = bot
+        self.cache_all = POLICY == "all"
+        self.pinned = set()
+        # guild_id -> when a command needing members was last used
+        self.last_used = {}
+        self.lru = MemberLRU()
+        bot.add_listener(self.on_member_join)
+
+    def start(self):
+        if not self.cache_all:
+            self.maintenance_loop.start()
+
+    def stop(self):
+        self.maintenance_loop.cancel()
+
+    def wants_members(self, guild_id):
+        if self.cache_all or guild_id in self.pinned:
+            return True
+        last_used = self.last_used.get(guild_id)
+        return last_used is not None and monotonic() - last_used < IDLE_SECONDS
+
+    def mark_used(self, guild_id):
+        self.last_used[guild_id] = monotonic()
+
+    async def get_member(self, guild, user_id):
+        """Get a member of the guild from the cache, or from the api if it's not cached"""
+        member = guild.get_member(user_id)
+        if member is not None:
+            return member
+
+        key = (guild.id, user_id)
+        found, member = self.lru.get(key)
+        if found:
+            lru_lookup_counter.labels("hit").inc()
+            return member
+
+        lru_lookup_counter.labels("miss").inc()
+        try:
+            member = await guild.fetch_member(user_id)
+        except discord.NotFound:
+            member = None
+        self.lru.put(key, member)
+        return member
+
+    async def get_user(self, user_id):
+        """Get a user from the cache, or from the api if it's not cached.
+
+        Returns None only if the user doesn't exist, other api errors are raised.
+        """
+        user = self.bot.get_user(user_id)
+        if user is not None:
+            return user
+
+        key = (None, user_id)
+        found, user = self.lru.get(key)
+        if found:
+            lru_lookup_counter.labels("hit").inc()
+            return user
+
+        lru_lookup_counter.labels("miss").inc()
+        try:
+            user = await self.bot.fetch_user(user_id)
+        except discord.NotFound:
+            user = None
+        self.lru.put(key, user)
+        return user
+
+    async def on_member_join(self, member):
+        if not self.cache_all and not self.wants_members(member.guild.id):
+            member.guild._remove_member(member)
+
+    async def refresh_pinned(self):
+        greeter_guilds = await self.bot.db.execute(
+            "SELECT guild_id FROM greeter_settings WHERE is_enabled",
+            as_list=True,
+        )
+        self.pinned = set(greeter_guilds) | set(self.bot.cache.autoroles)
+
+    def trim(self):
+        """Drop the members of guilds that no longer need them"""
+        now = monotonic()
+        for guild_id, last_used in list(self.last_used.items()):
+            if now - last_used >= IDLE_SECONDS:
+                del self.last_used[guild_id]
+
+        cached = 0
+        dropped = 0
+        for guild in self.bot.guilds:
+            if self.wants_members(guild.id):
+                cached += 1
+                if not guild.chunked:
+                    self.bot.chunker.enqueue_background(guild)
+            elif len(guild._members) > 1:
+                me = guild.me
+                dropped += len(guild._members) - 1
+                guild._members = {me.id: me} if me is not None else {}
+        cached_guilds_gauge.set(cached)
+        if dropped:
+            logger.info(f"Dropped {dropped} cached members of guilds without member features")
+
+    @tasks.loop(minutes=10)
+    async def maintenance_loop(self):
+        try:
+            await self.refresh_pinned()
+        except Exception as e:
+            logger.error(f"Failed to refresh member cache guilds: {e}")
+        self.trim()
+
+    @maintenance_loop.before_loop
+    async def task_waiter(self):
+        await self.bot.wait_until_ready()
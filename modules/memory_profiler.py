@@ -0,0 +1,224 @@
+"""
+Finding memory leaks in a running bot.
+
+`MemoryProfiler` starts and stops tracemalloc on demand and compares each snapshot taken while
+tracing to the previous one by the source line that allocated the memory. Tracing makes every
+allocation slower, so it's only on while an owner has turned it on with the `memory` command or
+the /debug/memory endpoints of the webserver.
+
+`census` counts the discord.py model objects on the heap and measures the bot's own cache
+structures, which needs no tracing. It runs in a thread while the bot keeps going, so the items
+of every container are copied in one step before being walked.
+
+Every report is a json serializable dict, so the same data can be sent over IPC from any cluster.
+"""
+import asyncio
+import gc
+import os
+import sys
+import sysconfig
+import tracemalloc
+from collections import Counter, deque
+from time import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STDLIB = sysconfig.get_paths()["stdlib"]
+TOP_ROWS = 25
+
+# allocations made by the profiling itself and by imports are just noise in the diff
+SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+# attributes of cogs that hold cached data, as (cog name, attribute)
+COG_CACHES = (
+    ("Notifications", "notifications_cache"),
+    ("Fishy", "ts_lock"),
+    ("Utility", "reminder_list"),
+)
+
+
+def short_path(filename):
+    """Path relative to the project, site-packages or the standard library"""
+    _, found, rest = filename.rpartition("site-packages" + os.sep)
+    if found:
+        return rest
+    if filename.startswith(PROJECT_ROOT):
+        return os.path.relpath(filename, PROJECT_ROOT)
+    if filename.startswith(STDLIB):
+        return os.path.relpath(filename, STDLIB)
+    return filename
+
+
+class MemoryProfiler:
+    def __init__(self, bot):
+        self.bot = bot
+        self.previous = None
+        self.started_at = None
+        self.lock = asyncio.Lock()
+
+    async def run(self, action, limit=TOP_ROWS, frames=1):
+        """Run a profiler action by name, for commands and IPC requests"""
+        if action == "status":
+            return self.status()
+        if action == "start":
+            return await self.start(frames)
+        if action == "stop":
+            return await self.stop()
+        if action == "snapshot":
+            return await self.snapshot(limit)
+        if action == "census":
+            # walking every object on the heap blocks for seconds on a large bot
+            return await asyncio.to_thread(census, self.bot, limit)
+        return {"error": f"Unknown action `{action}`"}
+
+    def status(self):
+        current, peak = tracemalloc.get_traced_memory()
+        return {
+            "tracing": tracemalloc.is_tracing(),
+            "frames": tracemalloc.get_traceback_limit(),
+            "started_at": self.started_at,
+            "traced_bytes": current,
+            "peak_bytes": peak,
+            "overhead_bytes": tracemalloc.get_tracemalloc_memory(),
+        }
+
+    async def start(self, frames=1):
+        if tracemalloc.is_tracing():
+            return {"error": "Memory tracing is already running"}
+        tracemalloc.start(frames)
+        self.started_at = time()
+        async with self.lock:
+            self.previous = await asyncio.to_thread(take_snapshot)
+        return self.status()
+
+    async def stop(self):
+        if not tracemalloc.is_tracing():
+            return {"error": "Memory tracing is not running"}
+        # wait for a snapshot that is being taken
+        async with self.lock:
+            status = self.status()
+            tracemalloc.stop()
+            self.previous = None
+            self.started_at = None
+        return {**status, "tracing": False}
+
+    async def snapshot(self, limit=TOP_ROWS):
+        """Compare a new snapshot to the previous one, biggest changes first"""
+        if not tracemalloc.is_tracing():
+            return {"error": "Memory tracing is not running, start it first"}
+
+        async with self.lock:
+            # snapshots of a large heap take seconds to take and compare
+            snapshot = await asyncio.to_thread(take_snapshot)
+            key_type = "traceback" if tracemalloc.get_traceback_limit() > 1 else "lineno"
+            stats = await asyncio.to_thread(snapshot.compare_to, self.previous, key_type)
+            self.previous = snapshot
+
+        return {
+            **self.status(),
+            "size_diff": sum(stat.size_diff for stat in stats),
+            "sites": [
+                {
+                    # the allocating line first
+                    "traceback": [
+                        f"{short_path(frame.filename)}:{frame.lineno}"
+                        for frame in reversed(stat.traceback)
+                    ],
+                    "size": stat.size,
+                    "size_diff": stat.size_diff,
+                    "count": stat.count,
+                    "count_diff": stat.count_diff,
+                }
+                for stat in stats[:limit]
+            ],
+        }
+
+
+def take_snapshot():
+    return tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+
+
+def census(bot, limit=TOP_ROWS):
+    """Objects of discord.py model types on the heap, and the sizes of our caches"""
+    counts = Counter()
+    sizes = Counter()
+    objects = gc.get_objects()
+    for obj in objects:
+        cls = type(obj)
+        if isinstance(obj, type):
+            # classes themselves are not model objects
+            continue
+        module = getattr(cls, "__module__", None)
+        if not isinstance(module, str) or not module.startswith("discord."):
+            continue
+        name = f"{module}.{cls.__qualname__}"
+        counts[name] += 1
+        sizes[name] += sys.getsizeof(obj)
+        if hasattr(obj, "__dict__"):
+            sizes[name] += sys.getsizeof(obj.__dict__)
+    total_objects = len(objects)
+    del objects
+
+    caches = [
+        {"name": name, "items": len(structure), "size": deep_sizeof(structure)}
+        for name, structure in cache_structures(bot).items()
+    ]
+    return {
+        "objects": total_objects,
+        "types": [
+            {"type": name, "count": counts[name], "size": size}
+            for name, size in sizes.most_common(limit)
+        ],
+        "caches": sorted(caches, key=lambda cache: cache["size"], reverse=True),
+    }
+
+
+def cache_structures(bot):
+    structures = {
+        f"Cache.{name}": value
+        for name, value in list(vars(bot.cache).items())
+        if isinstance(value, (dict, set, list))
+    }
+    for cog_name, attribute in COG_CACHES:
+        cog = bot.get_cog(cog_name)
+        if cog is not None:
+            structures[f"{cog_name}.{attribute}"] = getattr(cog, attribute)
+
+    events = bot.get_cog("Events")
+    if events is not None:
+        structures["Events.message_store"] = events.message_store.channels
+    structures["MemberCachePolicy.lru"] = bot.member_cache.lru.entries
+    return structures
+
+
+def deep_sizeof(structure):
+    """Size of a container and everything in it.
+
+    Only goes into builtin containers and objects defined in this project, anything else such as
+    discord.py models is counted with its shallow size.
+    """
+    seen = set()
+    stack = [structure]
+    size = 0
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+            stack.extend(obj)
+        elif str(type(obj).__module__).startswith(("modules.", "cogs.")):
+            if hasattr(obj, "__dict__"):
+                stack.append(obj.__dict__)
+            for slot in getattr(type(obj), "__slots__", ()):
+                stack.append(getattr(obj, slot, None))
+    return size
@@ -0,0 +1,117 @@
+"""
+Recent messages of the channels where deleted messages are logged.
+
+discord.py's own message cache keeps the last n messages of every channel the bot can see as
+full Message objects, while only guilds with a message log channel ever look at them.
+MessageStore instead keeps a ring buffer per channel, only for guilds with message logging
+enabled and not for ignored channels, holding slim LoggedMessage snapshots.
+"""
+from collections import deque
+
+from prometheus_client import Counter, Gauge
+
+# messages remembered per channel
+MESSAGES_PER_CHANNEL = 250
+
+lookup_counter = Counter(
+    "miso_message_store_lookups_total",
+    "Messages deleted in logged channels by whether they were found in the message store. "
+    "Bot messages are never stored, so deleting them counts as a miss.",
+    ["result"],
+)
+stored_messages_gauge = Gauge(
+    "miso_message_store_messages",
+    "Messages currently held in the message store.",
+)
+
+
+class LoggedMessage:
+    __slots__ = (
+        "id",
+        "author_id",
+        "author_name",
+        "author_avatar_url",
+        "author_color",
+        "content",
+        "attachment_urls",
+        "created_at",
+    )
+
+    def __init__(self, message):
+        self.id = message.id
+        self.author_id = message.author.id
+        self.author_name = str(message.author)
+        self.author_avatar_url = message.author.display_avatar.url
+        self.author_color = message.author.color
+        self.content = message.content
+        self.attachment_urls = tuple(attachment.proxy_url for attachment in message.attachments)
+        self.created_at = message.created_at
+
+
+class MessageStore:
+    def __init__(self, bot, per_channel=MESSAGES_PER_CHANNEL):
+        self.bot = bot
+        self.per_channel = per_channel
+        # channel_id -> (guild_id, deque of LoggedMessage)
+        self.channels = {}
+
+    def log_channel_id(self, guild_id, channel_id):
+        """The message log channel for messages deleted in this channel, if they are logged"""
+        settings = self.bot.cache.logging_settings.get(guild_id)
+        if settings is None or not settings.message_log_channel_id:
+            return None
+        if channel_id == settings.message_log_channel_id:
+            return None
+        if channel_id in self.bot.cache.message_log_ignored.get(guild_id, ()):
+            return None
+        return settings.message_log_channel_id
+
+    def add(self, message):
+        if message.guild is None or message.author.bot:
+            return
+        if not message.content and not message.attachments:
+            return
+
+        entry = self.channels.get(message.channel.id)
+        if entry is None:
+            if self.log_channel_id(message.guild.id, message.channel.id) is None:
+                return
+            entry = self.channels[message.channel.id] = (
+                message.guild.id,
+                deque(maxlen=self.per_channel),
+            )
+        entry[1].append(LoggedMessage(message))
+
+    def edit(self, channel_id, message_id, content):
+        entry = self.channels.get(channel_id)
+        if entry is None:
+            return
+        # recently sent messages are the most likely to be edited
+        for logged in reversed(entry[1]):
+            if logged.id == message_id:
+                logged.content = content
+                return
+
+    def pop(self, channel_id, message_id):
+        """Remove and return the snapshot of a deleted message, or None if it's not stored"""
+        entry = self.channels.get(channel_id)
+        if entry is None:
+            return None
+        messages = entry[1]
+        for logged in reversed(messages):
+            if logged.id == message_id:
+                messages.remove(logged)
+                lookup_counter.labels("hit").inc()
+                return logged
+        lookup_counter.labels("miss").inc()
+        return None
+
+    def prune(self):
+        """Drop the buffers of channels that are no longer logged"""
+        for channel_id, (guild_id, _) in list(self.channels.items()):
+            if self.log_channel_id(guild_id, channel_id) is None:
+                del self.channels[channel_id]
+        stored_messages_gauge.set(len(self))
+
+    def __len__(self):
+        return sum(len(messages) for _, messages in self.channels.values())
@@ -0,0 +1,83 @@
+import os
+import re
+
+import arrow
+
+from modules import log
+
+logger = log.get_logger(__name__)
+
+MIGRATIONS_DIR = "sql/migrations"
+MIGRATION_FILENAME = re.compile(r"^(\d+)_(\w+)\.sql$")
+STATEMENT_END = re.compile(r";\s*$", re.MULTILINE)
+
+
+class Migration:
+    def __init__(self, version, name, path):
+        self.version = version
+        self.name = name
+        self.path = path
+
+    def statements(self):
+        """Split the migration file into individual statements"""
+        with open(self.path, "r", encoding="utf-8") as f:
+            lines = [line for line in f if not line.lstrip().startswith("--")]
+        return [s.strip() for s in STATEMENT_END.split("".join(lines)) if s.strip()]
+
+
+def find_migrations(directory=MIGRATIONS_DIR):
+    migrations = []
+    for filename in os.listdir(directory):
+        match = MIGRATION_FILENAME.match(filename)
+        if match is None:
+            continue
+        version, name = match.groups()
+        migrations.append(Migration(int(version), name, os.path.join(directory, filename)))
+
+    versions = [m.version for m in migrations]
+    if len(versions) != len(set(versions)):
+        raise RuntimeError(f"Duplicate migration versions found in {directory}")
+
+    return sorted(migrations, key=lambda m: m.version)
+
+
+async def migrate(db):
+    """Apply all migrations that have not been applied to the database yet.
+
+    A named lock makes sure only one process runs migrations at a time.
+    """
+    migrations = find_migrations()
+    async with db.pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("SELECT GET_LOCK('miso_migrations', 60)")
+            (locked,) = await cur.fetchone()
+            if not locked:
+                raise RuntimeError("Could not acquire the migration lock")
+            try:
+                await cur.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS schema_migration (
+                        version INT,
+                        name VARCHAR(128),
+                        applied_on DATETIME,
+                        PRIMARY KEY (version)
+                    )
+                    """
+                )
+                await cur.execute("SELECT version FROM schema_migration")
+                applied = {row[0] for row in await cur.fetchall()}
+
+                for migration in migrations:
+                    if migration.version in applied:
+                        continue
+                    logger.info(f"Applying migration {migration.version:04} {migration.name}")
+                    for statement in migration.statements():
+                        await cur.execute(statement)
+                    await cur.execute(
+                        "INSERT INTO schema_migration (version, name, applied_on) VALUES (%s, %s, %s)",
+                        (migration.version, migration.name, arrow.utcnow().datetime),
+                    )
+            finally:
+                await cur.execute("SELECT RELEASE_LOCK('miso_migrations')")
+
+    logger.info(f"Database schema is at version {migrations[-1].version if migrations else 0}")
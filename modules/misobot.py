@@ -1,3 +1,5 @@
+import asyncio
+import signal
 import traceback
 from time import time
 
@@ -7,9 +9,26 @@ from discord import Activity, ActivityType, AllowedMentions, Intents, Status
 from discord.errors import Forbidden
 from discord.ext import commands
 
-from modules import cache, log, maria, util
+from modules import (
+    cache,
+    chunking,
+    cpu_profiler,
+    invalidation,
+    ipc,
+    log,
+    maria,
+    member_cache,
+    memory_profiler,
+    migrations,
+    startup,
+    tracing,
+    util,
+)
 from modules.help import EmbedHelpCommand
 
+# extensions that look at the commands of all other extensions when they are loaded
+LOAD_LAST = ["webserver"]
+
 
 class MisoBot(commands.AutoShardedBot):
     def __init__(self, extensions, default_prefix, **kwargs):
@@ -19,12 +38,14 @@ class MisoBot(commands.AutoShardedBot):
             command_prefix=util.determine_prefix,
             case_insensitive=True,
             allowed_mentions=AllowedMentions(everyone=False),
-            max_messages=20000,
+            # deleted messages are logged from Events.message_store instead
+            max_messages=None,
             heartbeat_timeout=120,
             owner_id=133311691852218378,
             client_id=500385855072894982,
             status=Status.idle,
             chunk_guilds_at_startup=False,
+            member_cache_flags=member_cache.member_cache_flags(),
             intents=Intents(  # https://discordpy.readthedocs.io/en/latest/api.html?highlight=intents#intents
                 guilds=True,
                 members=True,  # requires verification
@@ -54,45 +75,134 @@ class MisoBot(commands.AutoShardedBot):
         self.global_cd = commands.CooldownMapping.from_cooldown(15, 60, commands.BucketType.member)
         self.db = maria.MariaDB(self)
         self.cache = cache.Cache(self)
+        self.invalidation = invalidation.InvalidationBus(self)
+        self.member_cache = member_cache.MemberCachePolicy(self)
+        self.chunker = chunking.ChunkingService(self)
+        self.memory_profiler = memory_profiler.MemoryProfiler(self)
+        self.cpu_profiler = cpu_profiler.CPUProfiler()
         self.version = "5.1"
         self.extensions_loaded = False
+        self.startup_report = startup.StartupReport()
+        # set by MisoCluster when running under the launcher
+        self.ipc = None
+        self.ipc_handlers = dict(ipc.HANDLERS)
         self.register_hooks()
 
     async def setup_hook(self):
         self.session = aiohttp.ClientSession(
             connector=aiohttp.TCPConnector(limit=0),
             json_serialize=lambda x: orjson.dumps(x).decode(),
+            trace_configs=[tracing.http_trace_config()],
         )
-        await self.db.initialize_pool()
-        await self.cache.initialize_settings_cache()
-        await self.load_all_extensions()
+        await self.boot_phase("database pool", self.db.initialize_pool())
+        await self.boot_phase("migrations", migrations.migrate(self.db))
+        await self.boot_phase("settings cache", self.cache.initialize_settings_cache())
+        await self.boot_phase("extensions", self.load_all_extensions())
+        self.chunker.start()
+        self.member_cache.start()
         self.boot_up_time = time() - self.start_time
 
+    async def boot_phase(self, name, coro):
+        """Await a step of the startup process and log how long it took"""
+        start = time()
+        result = await coro
+        self.logger.info(f"Boot phase [ {name} ] took {time() - start:.2f}s")
+        return result
+
     def register_hooks(self):
         """Register event hooks to the bot"""
         self.before_invoke(self.before_any_command)
+        self.after_invoke(self.after_any_command)
         self.check(self.check_for_blacklist)
         self.check(self.cooldown_check)
 
     async def load_all_extensions(self):
+        """Load the extensions concurrently, so their cog_load waits overlap.
+
+        The cogs are still added to the bot in the order of `extensions_to_load`.
+        """
         self.logger.info("Loading extensions...")
+        start = time()
+        independent = [
+            (extension, f"cogs.{extension}")
+            for extension in self.extensions_to_load
+            if extension not in LOAD_LAST
+        ] + [("jishaku", "jishaku")]
+        previous = [None] + [name for name, _ in independent[:-1]]
+        await asyncio.gather(
+            *(
+                self.load_timed_extension(name, module, after)
+                for (name, module), after in zip(independent, previous)
+            )
+        )
         for extension in self.extensions_to_load:
+            if extension in LOAD_LAST:
+                await self.load_timed_extension(extension, f"cogs.{extension}")
+
+        self.extensions_loaded = True
+        self.startup_report.log(time() - start)
+
+    async def load_timed_extension(self, name, module, after=None):
+        with self.startup_report.measure(name, after) as timing:
             try:
-                await self.load_extension(f"cogs.{extension}")
-                self.logger.info(f"Loaded [ {extension} ]")
+                await self.load_extension(module)
+                self.logger.info(f"Loaded [ {name} ]")
             except Exception as error:
-                self.logger.error(f"Error loading [ {extension} ]")
+                timing.failed = True
+                self.logger.error(f"Error loading [ {name} ]")
                 traceback.print_exception(type(error), error, error.__traceback__)
 
-        await self.load_extension("jishaku")
-        self.extensions_loaded = True
-        self.logger.info("All extensions loaded successfully!")
+    async def add_cog(self, cog, **kwargs):
+        """Overrides built-in add_cog() to time cog_load for the startup report"""
+        await startup.timed_add_cog(super().add_cog, cog, **kwargs)
+
+    async def run_ipc_handler(self, handler, data=None):
+        return await self.ipc_handlers[handler](self, data)
+
+    async def cluster_request(self, handler, data=None, target=None, guild_id=None, timeout=None):
+        """Run an ipc handler in every cluster, or the one holding `guild_id`.
+
+        Returns a dict of results keyed by cluster name. Without the launcher the handler is
+        simply run in this process.
+        """
+        if self.ipc is None:
+            return {"main": await self.run_ipc_handler(handler, data)}
+        return await self.ipc.request(
+            handler, data, target=target, guild_id=guild_id, timeout=timeout
+        )
+
+    async def cluster_stats(self) -> dict:
+        """Guild, member and user counts summed over all clusters"""
+        results = await self.cluster_request("stats")
+        totals = {"guilds": 0, "members": 0, "users": 0, "shards": {}}
+        for result in results.values():
+            totals["guilds"] += result["guilds"]
+            totals["members"] += result["members"]
+            totals["users"] += result["users"]
+            totals["shards"].update(result["shards"])
+        return totals
+
+    def shard_filter(self, column="guild_id"):
+        """SQL condition and its params matching rows of guilds on the shards of this process"""
+        if self.shard_ids is None:
+            return "TRUE", ()
+        placeholders = ", ".join(["%s"] * len(self.shard_ids))
+        return (
+            f"({column} >> 22) %% %s IN ({placeholders})",
+            (self.shard_count, *self.shard_ids),
+        )
 
     async def close(self):
         """Overrides built-in close()"""
+        # unloads the extensions first, their cog_unload flushes buffered writes to the database
+        await super().close()
+        if self.ipc is not None:
+            await self.ipc.close()
+        self.chunker.stop()
+        self.member_cache.stop()
         await self.session.close()
+        await self.cache.save_snapshot()
         await self.db.cleanup()
-        await super().close()
 
     async def on_message(self, message):
         """Overrides built-in on_message()"""
@@ -109,13 +219,21 @@ class MisoBot(commands.AutoShardedBot):
     @staticmethod
     async def before_any_command(ctx: commands.Context):
         """Runs before any command"""
-        await util.require_chunked(ctx.guild)
+        ctx.trace = tracing.start_trace(ctx.command.qualified_name)
+        ctx.bot.chunker.mark_active(ctx.guild)
         ctx.timer = time()
         try:
             await ctx.typing()
         except Forbidden:
             pass
 
+    @staticmethod
+    async def after_any_command(ctx: commands.Context):
+        """Runs after any command, including ones that raised an error"""
+        trace = getattr(ctx, "trace", None)
+        if trace is not None:
+            trace.finish(failed=ctx.command_failed)
+
     @staticmethod
     async def check_for_blacklist(ctx: commands.Context):
         """Check command invocation context for blacklist triggers"""
@@ -144,17 +262,36 @@ class MisoBot(commands.AutoShardedBot):
 
 
 class MisoCluster(MisoBot):
-    def __init__(self, **kwargs):
-        self.cluster_name = kwargs.pop("cluster_name")
-        self.cluster_id = kwargs.pop("cluster_id")
+    """A bot process running a subset of the shards, started by launcher.py"""
+
+    def __init__(self, cluster_name, cluster_id, ready_event=None, ipc_path=None, **kwargs):
+        self.cluster_name = cluster_name
+        self.cluster_id = cluster_id
+        self.ready_event = ready_event
+        self.ipc_path = ipc_path
         super().__init__(**kwargs)
 
         self.logger = log.get_logger(f"MisoBot#{self.cluster_name}")
 
-        self.run(kwargs["token"])
+    async def setup_hook(self):
+        # the launcher stops clusters with SIGTERM. cancelling the main task makes discord.py close
+        # the bot the same way it does on ctrl+c, so close() runs to the end before the process exits
+        asyncio.get_running_loop().add_signal_handler(
+            signal.SIGTERM, asyncio.current_task().cancel
+        )
+        if self.ipc_path is not None:
+            self.ipc = ipc.IPCClient(
+                self, self.cluster_name, self.ipc_path, self.shard_ids, self.shard_count
+            )
+            await self.boot_phase("ipc", self.ipc.connect())
+        await super().setup_hook()
 
     async def on_ready(self):
-        self.logger.info(f"Cluster {self.cluster_name} ready")
+        await super().on_ready()
+        self.logger.info(f"Cluster {self.cluster_name} ready with shards {self.shard_ids}")
+        if self.ready_event is not None:
+            # lets the launcher know it can start identifying the next cluster
+            self.ready_event.set()
 
     async def on_shard_ready(self, shard_id):
         self.logger.info(f"Shard {shard_id} ready")
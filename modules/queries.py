@@ -3,19 +3,64 @@ from modules import exceptions, log
 logger = log.get_logger(__name__)
 
 
-async def save_command_usage(ctx):
-    await ctx.bot.db.execute(
-        """
-        INSERT INTO command_usage (guild_id, user_id, command_name, command_type)
-            VALUES (%s, %s, %s, %s)
-        ON DUPLICATE KEY UPDATE
-            uses = uses + 1
-        """,
-        ctx.guild.id,
-        ctx.author.id,
-        ctx.command.qualified_name,
-        "internal",
-    )
+async def save_command_usage(ctx, command_name=None, command_type="internal"):
+    """Record a command use along with the per command and per guild rollups"""
+    if command_name is None:
+        command_name = ctx.command.qualified_name
+
+    async with ctx.bot.db.transaction() as tx:
+        await tx.execute(
+            """
+            INSERT INTO command_usage (guild_id, user_id, command_name, command_type)
+                VALUES (%s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                uses = uses + 1
+            """,
+            ctx.guild.id,
+            ctx.author.id,
+            command_name,
+            command_type,
+        )
+        await tx.execute(
+            """
+            INSERT INTO command_usage_guild (guild_id, command_name, command_type)
+                VALUES (%s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                uses = uses + 1
+            """,
+            ctx.guild.id,
+            command_name,
+            command_type,
+        )
+        await tx.execute(
+            """
+            INSERT INTO command_usage_total (command_name, command_type)
+                VALUES (%s, %s)
+            ON DUPLICATE KEY UPDATE
+                uses = uses + 1
+            """,
+            command_name,
+            command_type,
+        )
+
+
+async def guild_member_query(bot, guild, statement, *params):
+    """Run a statement with the ids of the guild's members available
+    in the temporary table `guild_member (user_id)` to join against
+    """
+    await bot.chunker.require(guild)
+    member_ids = [(member.id,) for member in guild.members]
+    async with bot.db.transaction(read_only=True) as tx:
+        await tx.execute(
+            "CREATE TEMPORARY TABLE guild_member (user_id BIGINT PRIMARY KEY) ENGINE=MEMORY"
+        )
+        try:
+            await tx.executemany(
+                "INSERT IGNORE INTO guild_member (user_id) VALUES (%s)", member_ids
+            )
+            return await tx.execute(statement, *params)
+        finally:
+            await tx.execute("DROP TEMPORARY TABLE guild_member")
 
 
 async def update_setting(ctx, table, setting, new_value):
@@ -0,0 +1,151 @@
+"""
+Keeping the startup of the bot fast, and showing where the time goes.
+
+`lazy_import` returns a stand-in for a module that is imported the first time one of its
+attributes is used. Heavy libraries that only a few commands need, such as matplotlib or
+asyncpraw, are imported like this so they don't slow down loading the extensions.
+
+`StartupReport` records how long each extension took to load, split into importing the module
+(and constructing the cog), running `cog_load`, and warming caches with `warm_cache`.
+
+Extensions are loaded concurrently, but an extension measured with `after=` waits for that
+extension to finish loading before adding its cogs to the bot. Only the `cog_load` calls overlap,
+and the order of cogs, commands and listeners is the same as when loading one by one.
+"""
+import asyncio
+import contextlib
+import contextvars
+import importlib
+from time import perf_counter
+
+from discord.utils import maybe_coroutine
+from prometheus_client import Gauge
+
+from modules import log
+
+logger = log.get_logger(__name__)
+
+extension_load_gauge = Gauge(
+    "miso_extension_load_seconds",
+    "Time taken to load an extension at startup, by phase.",
+    ["extension", "phase"],
+)
+
+# timing of the extension being loaded in the current task
+loading_extension = contextvars.ContextVar("loading_extension", default=None)
+
+
+class LazyModule:
+    """Stand-in for a module that imports it on the first attribute access"""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attribute):
+        if self._module is None:
+            start = perf_counter()
+            self._module = importlib.import_module(self._name)
+            logger.info(f"Imported [ {self._name} ] on first use in {perf_counter() - start:.2f}s")
+        return getattr(self._module, attribute)
+
+    def __repr__(self):
+        state = "imported" if self._module is not None else "not imported yet"
+        return f"<lazy module {self._name!r} ({state})>"
+
+
+def lazy_import(name):
+    return LazyModule(name)
+
+
+class ExtensionTiming:
+    def __init__(self, name):
+        self.name = name
+        self.started = None
+        # until the first cog is added
+        self.import_time = None
+        self.cog_load_time = 0.0
+        self.warm_time = 0.0
+        self.total = 0.0
+        self.failed = False
+        # the extension that has to add its cogs to the bot before this one
+        self.after = None
+        self.finished = asyncio.Event()
+
+
+class StartupReport:
+    def __init__(self):
+        self.extensions = {}
+
+    def timing(self, name):
+        if name not in self.extensions:
+            self.extensions[name] = ExtensionTiming(name)
+        return self.extensions[name]
+
+    @contextlib.contextmanager
+    def measure(self, name, after=None):
+        """Time loading an extension inside this block"""
+        timing = self.timing(name)
+        timing.started = perf_counter()
+        timing.after = self.timing(after) if after is not None else None
+        token = loading_extension.set(timing)
+        try:
+            yield timing
+        finally:
+            loading_extension.reset(token)
+            timing.finished.set()
+            timing.total = perf_counter() - timing.started
+            if timing.import_time is None:
+                # failed before adding a cog, or didn't add any
+                timing.import_time = timing.total - timing.cog_load_time - timing.warm_time
+            extension_load_gauge.labels(name, "import").set(timing.import_time)
+            extension_load_gauge.labels(name, "cog_load").set(timing.cog_load_time)
+            extension_load_gauge.labels(name, "cache_warm").set(timing.warm_time)
+
+    def log(self, total):
+        lines = [f"{'extension':16} {'import':>8} {'cog_load':>8} {'warm':>8} {'total':>8}"]
+        for timing in sorted(self.extensions.values(), key=lambda t: t.total, reverse=True):
+            lines.append(
+                f"{timing.name:16} {timing.import_time:7.2f}s {timing.cog_load_time:7.2f}s "
+                f"{timing.warm_time:7.2f}s {timing.total:7.2f}s"
+                + (" FAILED" if timing.failed else "")
+            )
+        logger.info(
+            f"Loaded {len(self.extensions)} extensions in {total:.2f}s\n" + "\n".join(lines)
+        )
+
+
+async def timed_add_cog(add_cog, cog, **kwargs):
+    """Run Bot.add_cog, counting the time as cog_load of the extension being loaded"""
+    timing = loading_extension.get()
+    if timing is None:
+        return await add_cog(cog, **kwargs)
+
+    start = perf_counter()
+    if timing.import_time is None:
+        timing.import_time = start - timing.started
+    warmed_before = timing.warm_time
+    try:
+        await maybe_coroutine(cog.cog_load)
+    finally:
+        timing.cog_load_time += perf_counter() - start - (timing.warm_time - warmed_before)
+
+    if timing.after is not None:
+        await timing.after.finished.wait()
+    # cog_load already ran, Bot.add_cog would run it again
+    cog.cog_load = lambda: None
+    try:
+        await add_cog(cog, **kwargs)
+    finally:
+        del cog.cog_load
+
+
+async def warm_cache(coro):
+    """Await a coroutine filling a cache, counting it as cache warming in the startup report"""
+    timing = loading_extension.get()
+    start = perf_counter()
+    try:
+        return await coro
+    finally:
+        if timing is not None:
+            timing.warm_time += perf_counter() - start
@@ -0,0 +1,103 @@
+from collections import defaultdict
+
+import arrow
+
+from modules import log
+
+logger = log.get_logger(__name__)
+
+# counters that are reset every time they are written into the stats table
+COUNTERS = [
+    "messages",
+    "reactions",
+    "commands_used",
+    "notifications_sent",
+    "lastfm_api_requests",
+    "html_rendered",
+]
+# values that are sampled at write time instead of counted. They are totals over all clusters,
+# written by the first cluster only and left NULL by the others so they are never added together.
+GAUGES = ["guild_count", "member_count"]
+COLUMNS = COUNTERS + GAUGES
+
+counters = defaultdict(int)
+
+
+def increment(name, amount=1):
+    """Increment a stats counter. Only touches a dict, so it's safe to call on hot paths"""
+    counters[name] += amount
+
+
+def take_snapshot():
+    """Return the current counter values and reset them"""
+    global counters
+    snapshot, counters = counters, defaultdict(int)
+    return snapshot
+
+
+async def sample_gauges(bot):
+    """Guild and member counts of all clusters if this process writes them, else None"""
+    if getattr(bot, "cluster_id", 0) != 0:
+        return [None] * len(GAUGES)
+    try:
+        totals = await bot.cluster_stats()
+    except Exception as e:
+        logger.warning(f"Could not get cluster stats, not writing guild and member counts: {e}")
+        return [None] * len(GAUGES)
+    return [totals["guilds"], totals["members"]]
+
+
+async def write(bot):
+    """Write the counters accumulated since the last write as a single row into `stats`.
+
+    Rows are keyed by the minute they were written on; if a row already exists for that minute
+    (another cluster, or a restart) the counters are added together and the gauges replaced.
+    """
+    snapshot = take_snapshot()
+    values = [snapshot.get(name, 0) for name in COUNTERS] + await sample_gauges(bot)
+    updates = [f"{name} = {name} + VALUES({name})" for name in COUNTERS] + [
+        f"{name} = COALESCE(VALUES({name}), {name})" for name in GAUGES
+    ]
+    try:
+        await bot.db.execute(
+            f"""
+            INSERT INTO stats (ts, {", ".join(COLUMNS)})
+                VALUES (%s, {", ".join(["%s"] * len(COLUMNS))})
+            ON DUPLICATE KEY UPDATE
+                {", ".join(updates)}
+            """,
+            arrow.utcnow().floor("minute").datetime,
+            *values,
+        )
+    except Exception:
+        # keep the counts for the next write
+        for name, value in snapshot.items():
+            counters[name] += value
+        raise
+
+
+async def query(bot, column, since, bucket_minutes=60):
+    """Get the values of a stats column since given datetime, grouped into buckets.
+
+    Counters are summed and gauges averaged over each bucket, ignoring rows without them.
+    :returns : list of (datetime, value) tuples
+    """
+    if column not in COLUMNS:
+        raise ValueError(f"Unknown stats column {column}")
+
+    aggregate = "AVG" if column in GAUGES else "SUM"
+    bucket_seconds = bucket_minutes * 60
+    data = await bot.db.execute(
+        f"""
+        SELECT FROM_UNIXTIME(UNIX_TIMESTAMP(ts) DIV %s * %s) AS bucket, {aggregate}({column})
+        FROM stats
+        WHERE ts >= %s
+        GROUP BY bucket
+        ORDER BY bucket
+        """,
+        bucket_seconds,
+        bucket_seconds,
+        since,
+        read_only=True,
+    )
+    return [(bucket, float(value)) for bucket, value in data if value is not None]
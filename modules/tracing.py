@@ -0,0 +1,126 @@
+import os
+import random
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+
+import aiohttp
+import orjson
+
+from modules import log
+
+logger = log.get_logger(__name__)
+
+SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", 0))
+
+current_trace: ContextVar = ContextVar("current_trace", default=None)
+
+
+class Trace:
+    """
+    Collects timed spans of a single command invocation.
+
+    Tasks spawned by the command inherit the trace, so concurrent spans are all counted
+    and the span totals can add up to more than the wall clock time of the command.
+    """
+
+    def __init__(self, name, sampled=False):
+        self.name = name
+        self.start = perf_counter()
+        self.end = None
+        self.totals = defaultdict(float)
+        self.counts = defaultdict(int)
+        self.spans = [] if sampled else None
+        self.failed = False
+
+    @property
+    def sampled(self):
+        return self.spans is not None
+
+    @property
+    def elapsed(self):
+        return (self.end or perf_counter()) - self.start
+
+    def add(self, kind, start, duration, detail=None):
+        self.totals[kind] += duration
+        self.counts[kind] += 1
+        if self.spans is not None:
+            self.spans.append((kind, start - self.start, duration, detail))
+
+    def finish(self, failed=False):
+        if self.end is not None:
+            return
+        self.end = perf_counter()
+        self.failed = failed
+        if self.sampled:
+            logger.info(f"TRACE {self.name} {self.dump().decode()}")
+
+    def breakdown(self):
+        """Time spent per span kind, with the remainder attributed to `other`"""
+        result = dict(self.totals)
+        result["other"] = max(0.0, self.elapsed - sum(self.totals.values()))
+        return result
+
+    def dump(self):
+        return orjson.dumps(
+            {
+                "command": self.name,
+                "elapsed": self.elapsed,
+                "failed": self.failed,
+                "breakdown": self.breakdown(),
+                "counts": dict(self.counts),
+                "spans": [
+                    {"kind": kind, "offset": offset, "duration": duration, "detail": detail}
+                    for kind, offset, duration, detail in self.spans or []
+                ],
+            }
+        )
+
+
+def start_trace(name):
+    """Start a new trace for the current task and return it"""
+    trace = Trace(name, sampled=SAMPLE_RATE > 0 and random.random() < SAMPLE_RATE)
+    current_trace.set(trace)
+    return trace
+
+
+def record(kind, start, detail=None):
+    """Record a span of `kind` that started at perf_counter value `start` and ends now"""
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add(kind, start, perf_counter() - start, detail)
+
+
+@contextmanager
+def span(kind, detail=None):
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        record(kind, start, detail)
+
+
+def http_trace_config():
+    """aiohttp TraceConfig that records every request made in a traced context as a span.
+
+    The span kind defaults to `http`, but can be overridden per request with
+    `trace_request_ctx={"span": "kind"}`.
+    """
+
+    async def on_request_start(_session, trace_config_ctx, params):
+        trace_config_ctx.start = perf_counter()
+
+    async def on_request_end(_session, trace_config_ctx, params):
+        request_ctx = trace_config_ctx.trace_request_ctx or {}
+        record(
+            request_ctx.get("span", "http"),
+            trace_config_ctx.start,
+            f"{params.method} {params.url.host}{params.url.path}",
+        )
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_request_end.append(on_request_end)
+    trace_config.on_request_exception.append(on_request_end)
+    return trace_config
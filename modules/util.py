@@ -4,22 +4,23 @@ import io
 import math
 import os
 import re
-from time import time
 
 import aiohttp
 import arrow
-import colorgram
 import discord
 import regex
 from discord.ext import commands
 from durations_nlp import Duration
 from durations_nlp.exceptions import InvalidTokenError
-from PIL import Image, UnidentifiedImageError
 
 from libraries import emoji_literals
-from modules import emojis, exceptions, log, queries
+from modules import emojis, exceptions, log, queries, startup, stats
+
+colorgram = startup.lazy_import("colorgram")
+Image = startup.lazy_import("PIL.Image")
 
 IMAGE_SERVER_HOST = os.environ.get("IMAGE_SERVER_HOST")
+CUSTOM_EMOJI_PATTERN = regex.compile(r"<(a?):([a-zA-Z0-9\_]+):([0-9]+)>")
 logger = log.get_logger(__name__)
 
 
@@ -53,7 +54,7 @@ async def send_success(ctx, message):
 async def determine_prefix(bot, message):
     """Get the prefix used in the invocation context"""
     if message.guild:
-        prefix = bot.cache.prefixes.get(str(message.guild.id), bot.default_prefix)
+        prefix = bot.cache.prefixes.get(message.guild.id, bot.default_prefix)
         return commands.when_mentioned_or(prefix)(bot, message)
     return commands.when_mentioned_or(bot.default_prefix)(bot, message)
 
@@ -69,14 +70,12 @@ async def is_blacklisted(ctx):
     if ctx.author.id in ctx.bot.cache.blacklist["global"]["user"]:
         raise exceptions.BlacklistedUser()
 
-    if ctx.guild is not None and ctx.bot.cache.blacklist.get(str(ctx.guild.id)) is not None:
-        if ctx.author.id in ctx.bot.cache.blacklist[str(ctx.guild.id)]["member"]:
+    guild_blacklist = ctx.bot.cache.blacklist.get(ctx.guild.id) if ctx.guild is not None else None
+    if guild_blacklist is not None:
+        if ctx.author.id in guild_blacklist.member:
             raise exceptions.BlacklistedMember()
 
-        if (
-            ctx.command.qualified_name.lower()
-            in ctx.bot.cache.blacklist[str(ctx.guild.id)]["command"]
-        ):
+        if ctx.command.qualified_name.lower() in guild_blacklist.command:
             raise exceptions.BlacklistedCommand()
 
     return True
@@ -322,20 +321,21 @@ async def reaction_buttons(
             pass
 
 
-def message_embed(message):
+def message_embed(message, channel):
     """
-    Creates a nice embed from message
-    :param: message : discord.Message you want to embed
+    Creates a nice embed from a deleted message
+    :param: message : LoggedMessage you want to embed
+    :param: channel : the channel it was sent in
     :returns        : discord.Embed
     """
     content = discord.Embed()
-    content.set_author(name=f"{message.author}", icon_url=message.author.display_avatar.url)
+    content.set_author(name=message.author_name, icon_url=message.author_avatar_url)
     content.description = message.content
-    content.set_footer(text=f"{message.guild.name} | #{message.channel.name}")
+    content.set_footer(text=f"{channel.guild.name} | #{channel.name}")
     content.timestamp = message.created_at
-    content.colour = message.author.color
-    if message.attachments:
-        content.set_image(url=message.attachments[0].proxy_url)
+    content.colour = message.author_color
+    if message.attachment_urls:
+        content.set_image(url=message.attachment_urls[0])
 
     return content
 
@@ -586,27 +586,13 @@ async def color_from_image_url(session, url, fallback="E74C3C", return_color_obj
 
 def find_unicode_emojis(text):
     """Finds and returns all unicode emojis from a string"""
-    emoji_list = set()
-
-    # yeah.
-    # it's an emoji regex.
-    # what do you want from me.
-    data = regex.findall(
-        r"(?:\U0001f1e6[\U0001f1e8-\U0001f1ec\U0001f1ee\U0001f1f1\U0001f1f2\U0001f1f4\U0001f1f6-\U0001f1fa\U0001f1fc\U0001f1fd\U0001f1ff])\|(?:\U0001f1e7[\U0001f1e6\U0001f1e7\U0001f1e9-\U0001f1ef\U0001f1f1-\U0001f1f4\U0001f1f6-\U0001f1f9\U0001f1fb\U0001f1fc\U0001f1fe\U0001f1ff])|(?:\U0001f1e8[\U0001f1e6\U0001f1e8\U0001f1e9\U0001f1eb-\U0001f1ee\U0001f1f0-\U0001f1f5\U0001f1f7\U0001f1fa-\U0001f1ff])|(?:\U0001f1e9[\U0001f1ea\U0001f1ec\U0001f1ef\U0001f1f0\U0001f1f2\U0001f1f4\U0001f1ff])|(?:\U0001f1ea[\U0001f1e6\U0001f1e8\U0001f1ea\U0001f1ec\U0001f1ed\U0001f1f7-\U0001f1fa])|(?:\U0001f1eb[\U0001f1ee-\U0001f1f0\U0001f1f2\U0001f1f4\U0001f1f7])|(?:\U0001f1ec[\U0001f1e6\U0001f1e7\U0001f1e9-\U0001f1ee\U0001f1f1-\U0001f1f3\U0001f1f5-\U0001f1fa\U0001f1fc\U0001f1fe])|(?:\U0001f1ed[\U0001f1f0\U0001f1f2\U0001f1f3\U0001f1f7\U0001f1f9\U0001f1fa])|(?:\U0001f1ee[\U0001f1e8-\U0001f1ea\U0001f1f1-\U0001f1f4\U0001f1f6-\U0001f1f9])|(?:\U0001f1ef[\U0001f1ea\U0001f1f2\U0001f1f4\U0001f1f5])|(?:\U0001f1f0[\U0001f1ea\U0001f1ec-\U0001f1ee\U0001f1f2\U0001f1f3\U0001f1f5\U0001f1f7\U0001f1fc\U0001f1fe\U0001f1ff])|(?:\U0001f1f1[\U0001f1e6-\U0001f1e8\U0001f1ee\U0001f1f0\U0001f1f7-\U0001f1fb\U0001f1fe])|(?:\U0001f1f2[\U0001f1e6\U0001f1e8-\U0001f1ed\U0001f1f0-\U0001f1ff])|(?:\U0001f1f3[\U0001f1e6\U0001f1e8\U0001f1ea-\U0001f1ec\U0001f1ee\U0001f1f1\U0001f1f4\U0001f1f5\U0001f1f7\U0001f1fa\U0001f1ff])|\U0001f1f4\U0001f1f2|(?:\U0001f1f4[\U0001f1f2])|(?:\U0001f1f5[\U0001f1e6\U0001f1ea-\U0001f1ed\U0001f1f0-\U0001f1f3\U0001f1f7-\U0001f1f9\U0001f1fc\U0001f1fe])|\U0001f1f6\U0001f1e6|(?:\U0001f1f6[\U0001f1e6])|(?:\U0001f1f7[\U0001f1ea\U0001f1f4\U0001f1f8\U0001f1fa\U0001f1fc])|(?:\U0001f1f8[\U0001f1e6-\U0001f1ea\U0001f1ec-\U0001f1f4\U0001f1f7-\U0001f1f9\U0001f1fb\U0001f1fd-\U0001f1ff])|(?:\U0001f1f9[\U0001f1e6\U0001f1e8\U0001f1e9\U0001f1eb-\U0001f1ed\U0001f1ef-\U0001f1f4\U0001f1f7\U0001f1f9\U0001f1fb\U0001f1fc\U0001f1ff])|(?:\U0001f1fa[\U0001f1e6\U0001f1ec\U0001f1f2\U0001f1f8\U0001f1fe\U0001f1ff])|(?:\U0001f1fb[\U0001f1e6\U0001f1e8\U0001f1ea\U0001f1ec\U0001f1ee\U0001f1f3\U0001f1fa])|(?:\U0001f1fc[\U0001f1eb\U0001f1f8])|\U0001f1fd\U0001f1f0|(?:\U0001f1fd[\U0001f1f0])|(?:\U0001f1fe[\U0001f1ea\U0001f1f9])|(?:\U0001f1ff[\U0001f1e6\U0001f1f2\U0001f1fc])|(?:\U0001f3f3\ufe0f\u200d\U0001f308)|(?:\U0001f441\u200d\U0001f5e8)|(?:[\U0001f468\U0001f469]\u200d\u2764\ufe0f\u200d(?:\U0001f48b\u200d)?[\U0001f468\U0001f469])|(?:(?:(?:\U0001f468\u200d[\U0001f468\U0001f469])|(?:\U0001f469\u200d\U0001f469))(?:(?:\u200d\U0001f467(?:\u200d[\U0001f467\U0001f466])?)|(?:\u200d\U0001f466\u200d\U0001f466)))|(?:(?:(?:\U0001f468\u200d\U0001f468)|(?:\U0001f469\u200d\U0001f469))\u200d\U0001f466)|[\u2194-\u2199]|[\u23e9-\u23f3]|[\u23f8-\u23fa]|[\u25fb-\u25fe]|[\u2600-\u2604]|[\u2638-\u263a]|[\u2648-\u2653]|[\u2692-\u2694]|[\u26f0-\u26f5]|[\u26f7-\u26fa]|[\u2708-\u270d]|[\u2753-\u2755]|[\u2795-\u2797]|[\u2b05-\u2b07]|[\U0001f191-\U0001f19a]|[\U0001f1e6-\U0001f1ff]|[\U0001f232-\U0001f23a]|[\U0001f300-\U0001f321]|[\U0001f324-\U0001f393]|[\U0001f399-\U0001f39b]|[\U0001f39e-\U0001f3f0]|[\U0001f3f3-\U0001f3f5]|[\U0001f3f7-\U0001f3fa]|[\U0001f400-\U0001f4fd]|[\U0001f4ff-\U0001f53d]|[\U0001f549-\U0001f54e]|[\U0001f550-\U0001f567]|[\U0001f573-\U0001f57a]|[\U0001f58a-\U0001f58d]|[\U0001f5c2-\U0001f5c4]|[\U0001f5d1-\U0001f5d3]|[\U0001f5dc-\U0001f5de]|[\U0001f5fa-\U0001f64f]|[\U0001f680-\U0001f6c5]|[\U0001f6cb-\U0001f6d2]|[\U0001f6e0-\U0001f6e5]|[\U0001f6f3-\U0001f6f6]|[\U0001f910-\U0001f91e]|[\U0001f920-\U0001f927]|[\U0001f933-\U0001f93a]|[\U0001f93c-\U0001f93e]|[\U0001f940-\U0001f945]|[\U0001f947-\U0001f94b]|[\U0001f950-\U0001f95e]|[\U0001f980-\U0001f991]|\u00a9|\u00ae|\u203c|\u2049|\u2122|\u2139|\u21a9|\u21aa|\u231a|\u231b|\u2328|\u23cf|\u24c2|\u25aa|\u25ab|\u25b6|\u25c0|\u260e|\u2611|\u2614|\u2615|\u2618|\u261d|\u2620|\u2622|\u2623|\u2626|\u262a|\u262e|\u262f|\u2660|\u2663|\u2665|\u2666|\u2668|\u267b|\u267f|\u2696|\u2697|\u2699|\u269b|\u269c|\u26a0|\u26a1|\u26aa|\u26ab|\u26b0|\u26b1|\u26bd|\u26be|\u26c4|\u26c5|\u26c8|\u26ce|\u26cf|\u26d1|\u26d3|\u26d4|\u26e9|\u26ea|\u26fd|\u2702|\u2705|\u270f|\u2712|\u2714|\u2716|\u271d|\u2721|\u2728|\u2733|\u2734|\u2744|\u2747|\u274c|\u274e|\u2757|\u2763|\u2764|\u27a1|\u27b0|\u27bf|\u2934|\u2935|\u2b1b|\u2b1c|\u2b50|\u2b55|\u3030|\u303d|\u3297|\u3299|\U0001f004|\U0001f0cf|\U0001f170|\U0001f171|\U0001f17e|\U0001f17f|\U0001f18e|\U0001f201|\U0001f202|\U0001f21a|\U0001f22f|\U0001f250|\U0001f251|\U0001f396|\U0001f397|\U0001f56f|\U0001f570|\U0001f587|\U0001f590|\U0001f595|\U0001f596|\U0001f5a4|\U0001f5a5|\U0001f5a8|\U0001f5b1|\U0001f5b2|\U0001f5bc|\U0001f5e1|\U0001f5e3|\U0001f5e8|\U0001f5ef|\U0001f5f3|\U0001f6e9|\U0001f6eb|\U0001f6ec|\U0001f6f0|\U0001f930|\U0001f9c0|[#|0-9]\u20e3",
-        text,
-    )
-    for word in data:
-        name = emoji_literals.UNICODE_TO_NAME.get(word)
-        if name is not None:
-            emoji_list.add(name)
-
-    return emoji_list
+    return set(emoji_literals.SCANNER.scan(text))
 
 
 def find_custom_emojis(text):
     """Finds and returns all custom discord emojis from a string"""
     emoji_list = set()
-    data = regex.findall(r"<(a?):([a-zA-Z0-9\_]+):([0-9]+)>", text)
+    data = CUSTOM_EMOJI_PATTERN.findall(text)
     for _a, emoji_name, emoji_id in data:
         emoji_list.add((emoji_name, emoji_id))
 
@@ -620,7 +606,7 @@ async def image_info_from_url(session, url):
         filetype = response.headers.get("Content-Type")
         try:
             image = Image.open(io.BytesIO(await response.read()))
-        except UnidentifiedImageError:
+        except Image.UnidentifiedImageError:
             return None
 
         dimensions = image.size
@@ -761,6 +747,16 @@ def patrons_only():
     return commands.check(predicate)
 
 
+def requires_members():
+    """Make the command wait until the member list of the guild is fully cached"""
+
+    async def predicate(ctx):
+        await ctx.bot.chunker.require(ctx.guild)
+        return True
+
+    return commands.check(predicate)
+
+
 def format_html(template, replacements):
     def dictsub(m):
         return str(replacements[m.group().strip("$")])
@@ -771,9 +767,12 @@ def format_html(template, replacements):
 async def render_html(bot, payload):
     try:
         async with bot.session.post(
-            f"http://{IMAGE_SERVER_HOST}:3000/html", data=payload
+            f"http://{IMAGE_SERVER_HOST}:3000/html",
+            data=payload,
+            trace_request_ctx={"span": "render"},
         ) as response:
             if response.status == 200:
+                stats.increment("html_rendered")
                 buffer = io.BytesIO(await response.read())
                 return buffer
             raise exceptions.RendererError(f"{response.status} : {await response.text()}")
@@ -786,15 +785,6 @@ def ordinal(n):
     return str(n) + {1: "st", 2: "nd", 3: "rd"}.get(4 if 10 <= n % 100 < 20 else n % 10, "th")
 
 
-async def require_chunked(guild: discord.Guild):
-    if guild is not None and not guild.chunked:
-        start_time = time()
-        await guild.chunk(cache=True)
-        logger.info(
-            f"Chunked [{guild}] with {guild.member_count} members in {time() - start_time:.2f} seconds"
-        )
-
-
 class TwoWayIterator:
     """Two way iterator class that is used as the backend for paging"""
 
@@ -0,0 +1,28 @@
+-- rollups of command_usage, maintained by queries.save_command_usage
+CREATE TABLE IF NOT EXISTS command_usage_total (
+    command_name VARCHAR(64),
+    command_type ENUM('internal', 'custom'),
+    uses INT DEFAULT 1,
+    PRIMARY KEY (command_name, command_type)
+);
+
+CREATE TABLE IF NOT EXISTS command_usage_guild (
+    guild_id BIGINT,
+    command_name VARCHAR(64),
+    command_type ENUM('internal', 'custom'),
+    uses INT DEFAULT 1,
+    PRIMARY KEY (guild_id, command_name, command_type)
+);
+
+-- backfill from existing usage data
+INSERT INTO command_usage_total (command_name, command_type, uses)
+    SELECT command_name, command_type, SUM(uses) FROM command_usage
+    GROUP BY command_name, command_type
+ON DUPLICATE KEY UPDATE
+    uses = VALUES(uses);
+
+INSERT INTO command_usage_guild (guild_id, command_name, command_type, uses)
+    SELECT guild_id, command_name, command_type, SUM(uses) FROM command_usage
+    GROUP BY guild_id, command_name, command_type
+ON DUPLICATE KEY UPDATE
+    uses = VALUES(uses);
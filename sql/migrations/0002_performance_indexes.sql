@@ -0,0 +1,12 @@
+-- secondary indexes for lookups that are not covered by a primary key prefix
+CREATE INDEX IF NOT EXISTS notification_user_id ON notification (user_id);
+
+CREATE INDEX IF NOT EXISTS muted_user_unmute_on ON muted_user (unmute_on);
+
+CREATE INDEX IF NOT EXISTS artist_crown_guild_id_user_id ON artist_crown (guild_id, user_id);
+
+CREATE INDEX IF NOT EXISTS typing_stats_user_id_wpm ON typing_stats (user_id, wpm);
+
+CREATE INDEX IF NOT EXISTS command_usage_command_name ON command_usage (command_name);
+
+CREATE INDEX IF NOT EXISTS command_usage_user_id ON command_usage (user_id);
@@ -0,0 +1,6 @@
+-- written by every bot process on the primary, read back from the replica to measure its lag
+CREATE TABLE IF NOT EXISTS replication_heartbeat (
+    id TINYINT,
+    beat DATETIME(6) NOT NULL,
+    PRIMARY KEY (id)
+);
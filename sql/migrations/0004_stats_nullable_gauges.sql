@@ -0,0 +1,4 @@
+-- guild and member counts are written by one process only, rows written by others leave them NULL
+ALTER TABLE stats
+    MODIFY guild_count INT NULL DEFAULT NULL,
+    MODIFY member_count INT NULL DEFAULT NULL;
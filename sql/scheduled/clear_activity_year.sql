@@ -0,0 +1 @@
+TRUNCATE TABLE user_activity_year;
\ No newline at end of file